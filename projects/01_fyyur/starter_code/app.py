@@ -5,17 +5,42 @@
 import json
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+import babel.dates
+from flask import Flask, render_template, request, Response, make_response, flash, redirect, url_for, jsonify, g, has_request_context, session, stream_with_context, abort
+from flask.logging import default_handler
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
-from logging import Formatter, FileHandler
+from logging.handlers import RotatingFileHandler
 from flask_wtf import Form
 from forms import *
+from suggest import SuggestIndex
+from cache import PageCache
+from pagination import Keyset, InvalidCursor
+from availability import AvailabilityIndex
+from recommend import Recommender
+from sqlstats import QueryStats, one_line
+from logqueue import JSONFormatter, queued_logging
+from seed import SeedData
+from thumbnails import ThumbnailCache, ImageUnavailable, fetch_image, FORMATS as IMAGE_FORMATS
+from importer import read_records, batched, copy_rows, ImportStats
+from exporter import export_chunks, FORMATS as EXPORT_FORMATS
 
 import sys
+import atexit
+import hashlib
+import click
+import sqlite3
 import datetime
+from functools import wraps, lru_cache
+from timeit import default_timer as timer
+from itertools import groupby
 from flask_migrate import Migrate
+from sqlalchemy import event, func, case, cast, and_, or_, DDL
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError, DBAPIError
+from sqlalchemy.orm.exc import StaleDataError
+from sqlalchemy.engine import Engine
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -27,14 +52,30 @@ db = SQLAlchemy(app)
 
 migrate = Migrate(app, db)
 
+suggest_index = SuggestIndex(max_entries=app.config['SUGGEST_MAX_ENTRIES'])
+page_cache = PageCache(max_entries=app.config['PAGE_CACHE_SIZE'], ttl=app.config['PAGE_CACHE_TTL'])
+availability_index = AvailabilityIndex()
+thumbnail_cache = ThumbnailCache(app.config['THUMBNAIL_DIR'], max_bytes=app.config['THUMBNAIL_CACHE_BYTES'])
+
 # TODO: connect to a local postgresql database
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# Genres are a Postgres ARRAY; fall back to JSON so the tests can run on SQLite
+GenreList = db.ARRAY(db.String(120)).with_variant(db.JSON(), 'sqlite')
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        db.Index('ix_Venue_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Venue_city_state', 'city', 'state'),
+        # The venue directory's keyset order
+        db.Index('ix_Venue_state_city_name_id', 'state', 'city', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
@@ -44,46 +85,758 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)), nullable=False)
+    genres = db.Column(GenreList, nullable=False)
     seeking_talent = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String)
     website = db.Column(db.String(120))
+    # Bumped by every UPDATE, which only applies to the version it read
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_Artist_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+        # The artist directory's keyset order
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120), nullable=False)
     state = db.Column(db.String(120), nullable=False)
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(120)), nullable=False)
+    genres = db.Column(GenreList, nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False)
     seeking_description = db.Column(db.String)
     website = db.Column(db.String(120))
+    # Bumped by every UPDATE, which only applies to the version it read
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    __mapper_args__ = {'version_id_col': version}
   
 class Show(db.Model):
     __tablename__ = 'Show'
-    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), primary_key=True)
-    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'), primary_key=True)
-    start_time = db.Column(db.String, primary_key=True)
+    __table_args__ = (
+        db.UniqueConstraint('venue_id', 'start_time', name='Show_venue_id_start_time_key'),
+        db.UniqueConstraint('artist_id', 'start_time', name='Show_artist_id_start_time_key'),
+        # Serves date range scans and the show listing's keyset order
+        db.Index('ix_Show_start_time', 'start_time', 'venue_id', 'artist_id'),
+    )
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    start_time = db.Column(db.DateTime(timezone=True), primary_key=True)
+    end_time = db.Column(db.DateTime(timezone=True), nullable=False)
+
+class ShowListing(db.Model):
+    # Read model of the show listing: each show with the venue and artist
+    # columns it is listed with, so /shows pages are a scan of one table.
+    # Rows follow their show through the foreign key; names are kept in
+    # sync by the mapper events below and `flask rebuild-show-listing`
+    # repairs any drift.
+    __tablename__ = 'ShowListing'
+    __table_args__ = (
+        db.ForeignKeyConstraint(
+            ['venue_id', 'artist_id', 'start_time'],
+            ['Show.venue_id', 'Show.artist_id', 'Show.start_time'],
+            ondelete='CASCADE', onupdate='CASCADE'
+        ),
+        db.Index('ix_ShowListing_start_time', 'start_time', 'venue_id', 'artist_id'),
+        db.Index('ix_ShowListing_artist_id', 'artist_id'),
+    )
+    venue_id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, primary_key=True)
+    start_time = db.Column(db.DateTime(timezone=True), primary_key=True)
+    venue_name = db.Column(db.String, nullable=False)
+    venue_image_link = db.Column(db.String(500))
+    artist_name = db.Column(db.String, nullable=False)
+    artist_image_link = db.Column(db.String(500))
+
+class Match(db.Model):
+    # Precomputed genre matches between seeking venues and seeking artists.
+    # A pair is stored while it is among the venue's top matches (venue_rank)
+    # or the artist's (artist_rank); `flask refresh-recommendations` keeps
+    # the table up to date.
+    __tablename__ = 'Match'
+    __table_args__ = (
+        db.Index('ix_Match_artist_id_artist_rank', 'artist_id', 'artist_rank'),
+    )
+    venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Integer, nullable=False)
+    venue_rank = db.Column(db.Integer)
+    artist_rank = db.Column(db.Integer)
+
+class MatchChange(db.Model):
+    # Venues and artists whose matches may have changed since the last
+    # `flask refresh-recommendations`: seeking ones created, edited in what
+    # they are matched on, or deleted. A row of kind 'all' asks for every
+    # match to be recomputed, after bulk inserts.
+    __tablename__ = 'MatchChange'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    entity_id = db.Column(db.Integer)
+
+class Area(db.Model):
+    # Venue, artist and upcoming show counts per city - state pair, kept up
+    # to date by the controllers that change them. The upcoming count goes
+    # stale once next_show_time passes, and is recounted on the next read.
+    __tablename__ = 'Area'
+    city = db.Column(db.String(120), primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    venue_count = db.Column(db.Integer, nullable=False, default=0)
+    artist_count = db.Column(db.Integer, nullable=False, default=0)
+    upcoming_shows = db.Column(db.Integer, nullable=False, default=0)
+    next_show_time = db.Column(db.DateTime(timezone=True))
+
+class Version(db.Model):
+    # A counter per table, bumped in the same transaction as every write to
+    # it, from which JSON responses derive their ETags. The Show row's
+    # expires_at is the next show start, when shows move from upcoming to past.
+    # The Booking row counts only shows created and deleted, for the
+    # availability index.
+    __tablename__ = 'Version'
+    name = db.Column(db.String(40), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    expires_at = db.Column(db.DateTime(timezone=True))
+
+VERSIONED_TABLES = ['Area', 'Artist', 'Booking', 'Match', 'Show', 'Venue']
+
+@event.listens_for(Version.__table__, 'after_create')
+def insert_versions(target, connection, **kw):
+  connection.execute(target.insert(), [{'name': name, 'version': 1} for name in VERSIONED_TABLES])
+
+def listing_source():
+  # Every show joined with the columns ShowListing copies
+  return db.select([
+    Show.venue_id, Show.artist_id, Show.start_time,
+    Venue.name, Venue.image_link, Artist.name, Artist.image_link
+  ]).select_from(Show.__table__.join(Venue.__table__, Venue.id == Show.venue_id)
+                                .join(Artist.__table__, Artist.id == Show.artist_id))
+
+LISTING_COLUMNS = ['venue_id', 'artist_id', 'start_time', 'venue_name', 'venue_image_link',
+                   'artist_name', 'artist_image_link']
+
+# Keep ShowListing in step with the ORM writes of the controllers, inside the
+# same flush; bulk inserts call list_shows_inserted() themselves
+@event.listens_for(Show, 'after_insert')
+def list_new_show(mapper, connection, show):
+  connection.execute(ShowListing.__table__.insert().from_select(
+    LISTING_COLUMNS,
+    listing_source().where(and_(
+      Show.venue_id == show.venue_id, Show.artist_id == show.artist_id, Show.start_time == show.start_time
+    ))
+  ))
+
+def relist(model, prefix):
+  # Copy a renamed venue or artist's name and image to its listed shows
+  @event.listens_for(model, 'after_update')
+  def listener(mapper, connection, target):
+    state = db.inspect(target)
+    if state.attrs.name.history.has_changes() or state.attrs.image_link.history.has_changes():
+      connection.execute(ShowListing.__table__.update()
+        .where(getattr(ShowListing, prefix + '_id') == target.id)
+        .values({prefix + '_name': target.name, prefix + '_image_link': target.image_link}))
+  return listener
+
+relist(Venue, 'venue')
+relist(Artist, 'artist')
+
+MATCHED_FIELDS = ('genres', 'city', 'state')
+
+def rematch(model, kind, seeking):
+  # Log seeking venues or artists whose matches need recomputing
+  @event.listens_for(model, 'after_insert')
+  @event.listens_for(model, 'after_update')
+  def listener(mapper, connection, target):
+    state = db.inspect(target)
+    changed = any(state.attrs[name].history.has_changes() for name in MATCHED_FIELDS)
+    if state.attrs[seeking].history.has_changes() or (changed and getattr(target, seeking)):
+      connection.execute(MatchChange.__table__.insert().values(kind=kind, entity_id=target.id))
+  return listener
+
+rematch(Venue, 'venue', 'seeking_talent')
+rematch(Artist, 'artist', 'seeking_venue')
+
+# Postgres extensions used by the trigram and exclusion indexes
+event.listen(db.metadata, 'before_create', DDL(
+  'CREATE EXTENSION IF NOT EXISTS pg_trgm; CREATE EXTENSION IF NOT EXISTS btree_gist'
+).execute_if(dialect='postgresql'))
+
+# On Postgres a venue or artist cannot be booked for overlapping shows; other
+# databases only reject two shows with the same start time
+for column in ('venue_id', 'artist_id'):
+  event.listen(Show.__table__, 'after_create', DDL(
+    'ALTER TABLE "Show" ADD CONSTRAINT "Show_%s_excl" '
+    'EXCLUDE USING gist (%s WITH =, tstzrange(start_time, end_time) WITH &&)' % (column, column)
+  ).execute_if(dialect='postgresql'))
+
+#----------------------------------------------------------------------------#
+# Queries.
+#----------------------------------------------------------------------------#
+
+def list_shows(*criteria, order_by=None, limit=None):
+  # Fetch shows joined with the venue and artist columns the templates need,
+  # so listing shows costs a single query however many rows there are
+  if order_by is None:
+    order_by = [Show.start_time]
+  elif not isinstance(order_by, list):
+    order_by = [order_by]
+  query = db.session.query(
+    Show.venue_id,
+    Venue.name.label('venue_name'),
+    Venue.image_link.label('venue_image_link'),
+    Show.artist_id,
+    Artist.name.label('artist_name'),
+    Artist.image_link.label('artist_image_link'),
+    Show.start_time
+  ).join(Venue, Venue.id == Show.venue_id) \
+    .join(Artist, Artist.id == Show.artist_id) \
+    .filter(*criteria) \
+    .order_by(*order_by) \
+    .limit(limit)
+
+  return [row._asdict() for row in query]
+
+EXPORT_COLUMNS = ['venue_id', 'venue_name', 'artist_id', 'artist_name', 'start_time', 'end_time']
+
+def export_show_rows(batch_size=1000):
+  # Stream every show with its venue and artist names. yield_per uses a
+  # server-side cursor on Postgres, so only one batch is held in memory.
+  return db.session.query(
+    Show.venue_id,
+    Venue.name,
+    Show.artist_id,
+    Artist.name,
+    Show.start_time,
+    Show.end_time
+  ).join(Venue, Venue.id == Show.venue_id) \
+    .join(Artist, Artist.id == Show.artist_id) \
+    .order_by(Show.start_time, Show.venue_id, Show.artist_id) \
+    .yield_per(batch_size)
+
+SEARCH_PAGE_SIZE = 10
+LISTING_PAGE_SIZE = 50
+CALENDAR_MAX_DAYS = 92
+
+def escape_like(text):
+  # Make LIKE wildcards in user input match literally, with '\\' as escape
+  return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def genre_filter(model, genres, match='all'):
+  # Rows having all (match='all') or any (match='any') of the genres. On
+  # Postgres this is array containment (@>) or overlap (&&) served by the GIN
+  # index; elsewhere the JSON-encoded list is matched with LIKE.
+  if db.engine.dialect.name == 'postgresql':
+    wanted = cast(postgresql.array(genres), postgresql.ARRAY(db.String(120)))
+    return model.genres.op('@>' if match == 'all' else '&&')(wanted)
+  clauses = [
+    cast(model.genres, db.Text).like('%' + escape_like(json.dumps(genre)) + '%', escape='\\')
+    for genre in genres
+  ]
+  return and_(*clauses) if match == 'all' else or_(*clauses)
+
+def requested_genres():
+  # Genres from one or more ?genre= values, and whether rows must have all
+  # of them (the default) or any
+  genres = [genre for genre in request.values.getlist('genre') if genre]
+  match = 'any' if request.values.get('match') == 'any' else 'all'
+  return genres, match
+
+# Listings are ordered on a unique key so each page can seek past the last
+ARTIST_KEYSET = Keyset(Artist.name, Artist.id)
+VENUE_KEYSET = Keyset(Venue.state, Venue.city, Venue.name, Venue.id)
+SHOW_KEYSET = Keyset(ShowListing.start_time, ShowListing.venue_id, ShowListing.artist_id)
+
+def page_artists(cursor=None, genres=None, match='all', size=LISTING_PAGE_SIZE):
+  # Returns (rows, prev cursor, next cursor) for one page of artists
+  query = db.session.query(Artist.id, Artist.name)
+  if genres:
+    query = query.filter(genre_filter(Artist, genres, match))
+  rows = query.filter(*ARTIST_KEYSET.criteria(cursor)) \
+    .order_by(*ARTIST_KEYSET.order_by(cursor)) \
+    .limit(size + 1) \
+    .all()
+  return ARTIST_KEYSET.page(rows, cursor, size)
+
+def page_venues(cursor=None, genres=None, match='all', size=LISTING_PAGE_SIZE, areas=False):
+  # Venues sharing a city - state pair come out adjacent, ready to group.
+  # With `areas`, each row also carries its area's summary counts.
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state)
+  if areas:
+    query = query.add_columns(Area.venue_count, Area.artist_count, Area.upcoming_shows, area_stale()) \
+      .outerjoin(Area, and_(Area.city == Venue.city, Area.state == Venue.state))
+  if genres:
+    query = query.filter(genre_filter(Venue, genres, match))
+  query = query.filter(*VENUE_KEYSET.criteria(cursor)) \
+    .order_by(*VENUE_KEYSET.order_by(cursor)) \
+    .limit(size + 1)
+  rows = fresh_areas(query) if areas else query.all()
+  return VENUE_KEYSET.page(rows, cursor, size)
+
+def page_shows(cursor=None, size=LISTING_PAGE_SIZE):
+  # A range scan of the ShowListing start time index, with no joins. Rows
+  # have the same keys as list_shows() rows.
+  query = db.session.query(*[getattr(ShowListing, column) for column in LISTING_COLUMNS]) \
+    .filter(*SHOW_KEYSET.criteria(cursor)) \
+    .order_by(*SHOW_KEYSET.order_by(cursor)) \
+    .limit(size + 1)
+  return SHOW_KEYSET.page([row._asdict() for row in query], cursor, size)
+
+def show_calendar(first_day, last_day, city=None, state=None):
+  # Shows from the start of first_day to the end of last_day in local time,
+  # as (date, shows) pairs. A single range scan over the start_time index,
+  # joined to the venue for its city and state.
+  start = datetime.datetime.combine(first_day, datetime.time.min).astimezone()
+  end = datetime.datetime.combine(last_day + datetime.timedelta(days=1), datetime.time.min).astimezone()
+  criteria = [Show.start_time >= start, Show.start_time < end]
+  if city:
+    criteria.append(Venue.city == city)
+  if state:
+    criteria.append(Venue.state == state)
+  rows = list_shows(*criteria, order_by=[Show.start_time, Show.venue_id, Show.artist_id])
+  return [
+    (day, list(shows))
+    for day, shows in groupby(rows, key=lambda row: row['start_time'].astimezone().date())
+  ]
+
+def requested_cursor(keyset):
+  # Decode the ?cursor= of a listing; a malformed cursor is a bad request
+  token = request.args.get('cursor')
+  if not token:
+    return None
+  try:
+    return keyset.decode(token)
+  except InvalidCursor:
+    abort(400)
+
+def search_by_name(model, search_term, page=1, genres=None, match='all'):
+  # Case-insensitive partial match on name, resolved by the trigram index on
+  # Postgres and by a plain LIKE scan on SQLite
+  escaped = escape_like(search_term)
+  matches = model.name.ilike('%' + escaped + '%', escape='\\')
+  if genres:
+    matches = and_(matches, genre_filter(model, genres, match))
+
+  # Upcoming show counts as a correlated subquery, evaluated only for the
+  # page of results, each a range scan of the (venue_id|artist_id, start_time)
+  # unique index
+  show_key = Show.venue_id if model is Venue else Show.artist_id
+  upcoming = db.session.query(func.count()) \
+    .filter(show_key == model.id, Show.start_time >= current_show_time()) \
+    .correlate(model) \
+    .as_scalar()
+
+  # Most relevant first: prefix matches, then closest trigram similarity
+  relevance = [case([(model.name.ilike(escaped + '%', escape='\\'), 0)], else_=1)]
+  if db.engine.dialect.name == 'postgresql':
+    relevance.append(func.similarity(model.name, search_term).desc())
+
+  count = db.session.query(func.count(model.id)).filter(matches).scalar()
+  rows = db.session.query(
+    model.id,
+    model.name,
+    upcoming.label('num_upcoming_shows')
+  ).filter(matches) \
+    .order_by(*relevance, model.name, model.id) \
+    .limit(SEARCH_PAGE_SIZE) \
+    .offset((page - 1) * SEARCH_PAGE_SIZE) \
+    .all()
+
+  return count, rows
+
+def delete_rows(model, ids):
+  # Delete venues or artists with one set-based statement; their shows go
+  # with them through ON DELETE CASCADE. Returns the deleted (id, name,
+  # city, state) rows and the (venue_id, artist_id, start_time, end_time)
+  # shows deleted with them, after recounting their areas. The caller
+  # commits, so the delete happens in a single transaction.
+  rows = db.session.query(model.id, model.name, model.city, model.state).filter(model.id.in_(ids)).all()
+  shows = []
+  if rows:
+    ids = [row.id for row in rows]
+    show_key = Show.venue_id if model is Venue else Show.artist_id
+    shows = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time) \
+      .filter(show_key.in_(ids)).all()
+    areas = {(row.city, row.state) for row in rows}
+    if model is Artist:
+      # The artists' upcoming shows are counted in their venues' areas
+      areas |= set(db.session.query(Venue.city, Venue.state).distinct()
+        .join(Show, Show.venue_id == Venue.id)
+        .filter(Show.artist_id.in_(ids), Show.start_time >= current_show_time()))
+    model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+    db.session.execute(MatchChange.__table__.insert(),
+                       [{'kind': model.__tablename__.lower(), 'entity_id': id} for id in ids])
+    refresh_areas(areas)
+    bump_versions(model.__tablename__, 'Show', 'Match', 'Booking')
+  return rows, shows
+
+def in_areas(city, state, keys):
+  # Criterion matching rows whose city and state are one of the keys
+  return or_(*[and_(city == area_city, state == area_state) for area_city, area_state in keys])
+
+def refresh_areas(keys=None):
+  # Recount the given (city, state) areas, or every area, from the base
+  # tables, dropping areas left with no venues or artists. The caller commits.
+  if keys is not None and not keys:
+    return
+  def grouped(query, city, state):
+    if keys is not None:
+      query = query.filter(in_areas(city, state, keys))
+    return {(row[0], row[1]): row[2:] for row in query.group_by(city, state)}
+
+  venues = grouped(db.session.query(Venue.city, Venue.state, func.count()), Venue.city, Venue.state)
+  artists = grouped(db.session.query(Artist.city, Artist.state, func.count()), Artist.city, Artist.state)
+  shows = grouped(
+    db.session.query(Venue.city, Venue.state, func.count(), func.min(Show.start_time))
+      .join(Show, Show.venue_id == Venue.id)
+      .filter(Show.start_time >= current_show_time()),
+    Venue.city, Venue.state
+  )
+  query = Area.query
+  if keys is not None:
+    query = query.filter(in_areas(Area.city, Area.state, keys))
+  existing = {(area.city, area.state): area for area in query}
+
+  for key in set(venues) | set(artists) | set(existing):
+    venue_count, = venues.get(key, (0,))
+    artist_count, = artists.get(key, (0,))
+    upcoming_shows, next_show_time = shows.get(key, (0, None))
+    area = existing.get(key)
+    if not venue_count and not artist_count:
+      db.session.delete(area)
+      continue
+    if area is None:
+      area = Area(city=key[0], state=key[1])
+      db.session.add(area)
+    area.venue_count, area.artist_count = venue_count, artist_count
+    area.upcoming_shows, area.next_show_time = upcoming_shows, next_show_time
+  bump_versions('Area')
+
+def count_in_area(city, state, venues=0, artists=0):
+  # Add a new venue or artist to its area's counts, creating the area if it
+  # is new. On Postgres this is one upsert, so concurrent creates in a new
+  # area cannot both insert it; SQLite serializes writers. The caller commits.
+  counts = {
+    Area.venue_count: Area.venue_count + venues,
+    Area.artist_count: Area.artist_count + artists
+  }
+  if db.engine.dialect.name == 'postgresql':
+    db.session.execute(
+      postgresql.insert(Area.__table__)
+        .values(city=city, state=state, venue_count=venues, artist_count=artists, upcoming_shows=0)
+        .on_conflict_do_update(index_elements=[Area.city, Area.state],
+                               set_={column.name: value for column, value in counts.items()})
+    )
+  elif not Area.query.filter_by(city=city, state=state).update(counts, synchronize_session=False):
+    db.session.add(Area(city=city, state=state, venue_count=venues, artist_count=artists, upcoming_shows=0))
+  bump_versions('Area')
+
+def count_show_in_area(venue_id, start_time):
+  # Add a new upcoming show to its venue's area. The caller commits.
+  if start_time < current_show_time():
+    return
+  Area.query.filter(
+    db.session.query(Venue.id).filter(
+      Venue.id == venue_id, Venue.city == Area.city, Venue.state == Area.state
+    ).exists()
+  ).update({
+    Area.upcoming_shows: Area.upcoming_shows + 1,
+    Area.next_show_time: case(
+      [(or_(Area.next_show_time.is_(None), Area.next_show_time > start_time), start_time)],
+      else_=Area.next_show_time
+    )
+  }, synchronize_session=False)
+  bump_versions('Area')
+
+def fresh_areas(query):
+  # Run a query selecting Area columns and a `stale` flag, first recounting
+  # any area whose next show has started since its upcoming shows were counted
+  rows = query.all()
+  stale = {(row.city, row.state) for row in rows if row.stale}
+  if stale:
+    refresh_areas(stale)
+    db.session.commit()
+    rows = query.all()
+  return rows
+
+def area_stale():
+  return func.coalesce(Area.next_show_time < current_show_time(), False).label('stale')
+
+def build_suggest_index():
+  # Load every artist and venue name into the typeahead index
+  entries = [('venue', id, name) for id, name in db.session.query(Venue.id, Venue.name)]
+  entries += [('artist', id, name) for id, name in db.session.query(Artist.id, Artist.name)]
+  suggest_index.rebuild(entries)
+
+@app.before_first_request
+def load_suggest_index():
+  if app.config['SUGGEST_INDEX']:
+    build_suggest_index()
+
+def show_bookings(shows):
+  # A venue and an artist booking for each (venue_id, artist_id,
+  # start_time, end_time) show
+  for venue_id, artist_id, start_time, end_time in shows:
+    start, end = start_time.timestamp(), end_time.timestamp()
+    yield 'venue', venue_id, start, end
+    yield 'artist', artist_id, start, end
+
+def booking_version():
+  return db.session.query(Version.version).filter_by(name='Booking').scalar()
+
+def build_availability_index():
+  # Load every show into the free/busy index, reading the version first so
+  # a show committed meanwhile causes another rebuild rather than being lost
+  version = booking_version()
+  shows = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.end_time)
+  availability_index.rebuild(list(show_bookings(shows.yield_per(10000))), version)
+
+def update_availability_index(added=(), removed=()):
+  # Apply committed show inserts and deletes to the index. If another change
+  # was committed since the index was last up to date, as by another worker,
+  # the next query rebuilds it instead.
+  if availability_index.ready:
+    availability_index.update(booking_version(), show_bookings(added), show_bookings(removed))
+
+def recommended_artists(venue_id):
+  # The venue's precomputed artist matches, best first
+  return db.session.query(Artist.id, Artist.name, Artist.image_link, Match.score) \
+    .join(Match, Match.artist_id == Artist.id) \
+    .filter(Match.venue_id == venue_id, Match.venue_rank.isnot(None)) \
+    .order_by(Match.venue_rank) \
+    .all()
+
+def recommended_venues(artist_id):
+  return db.session.query(Venue.id, Venue.name, Venue.image_link, Match.score) \
+    .join(Match, Match.venue_id == Venue.id) \
+    .filter(Match.artist_id == artist_id, Match.artist_rank.isnot(None)) \
+    .order_by(Match.artist_rank) \
+    .all()
+
+def ready_availability_index():
+  # The index is built on first use, and again whenever shows were created
+  # or deleted elsewhere: by another worker, an import or `flask seed`
+  if not availability_index.ready or availability_index.version != booking_version():
+    build_availability_index()
+  return availability_index
+
+#----------------------------------------------------------------------------#
+# Caching.
+#----------------------------------------------------------------------------#
+
+def bump_versions(*tables):
+  # Count a change to each table in the caller's transaction
+  Version.query.filter(Version.name.in_(tables)) \
+    .update({Version.version: Version.version + 1}, synchronize_session=False)
+
+def bump_show_version(start_time):
+  # Count a new show, bringing the show clock forward to its start if sooner
+  if start_time >= current_show_time():
+    Version.query.filter_by(name='Show').update({
+      Version.expires_at: case(
+        [(or_(Version.expires_at.is_(None), Version.expires_at > start_time), start_time)],
+        else_=Version.expires_at
+      )
+    }, synchronize_session=False)
+  bump_versions('Show', 'Booking')
+
+def restart_show_clock():
+  # Shows have moved from upcoming to past: count that as a change to the
+  # Show table and wind the clock to the next show start
+  next_start = db.session.query(func.min(Show.start_time)) \
+    .filter(Show.start_time > current_show_time()).scalar()
+  Version.query.filter_by(name='Show').update({Version.expires_at: next_start}, synchronize_session=False)
+  bump_versions('Show')
+
+def current_etag(tables, format):
+  # A strong ETag from the versions of the tables a response is built from,
+  # or None if a version is missing. Reads only the Version table, unless
+  # the show clock has run out and is restarted first.
+  query = db.session.query(Version.name, Version.version,
+                           func.coalesce(Version.expires_at <= current_show_time(), False).label('expired')) \
+    .filter(Version.name.in_(tables)) \
+    .order_by(Version.name)
+  rows = query.all()
+  if any(row.expired for row in rows):
+    restart_show_clock()
+    db.session.commit()
+    rows = query.all()
+  if len(rows) < len(tables):
+    return None
+  return '%s-%s' % (format, '.'.join(str(row.version) for row in rows))
+
+def wants_json():
+  # Content negotiation between the HTML pages and their JSON variants, which
+  # are also served under /api/
+  if request.path.startswith('/api/'):
+    return True
+  return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def negotiated(*tables):
+  # Let clients sending Accept: application/json get the view's JSON variant
+  # with an ETag over the given tables, answering If-None-Match with 304
+  # before the view touches the model tables. The ETags of pages of one venue
+  # or artist include its id, so one page's ETag never answers for another,
+  # and an unknown id reaches the view's 404. Creates and deletes bump the
+  # table counters, so an id that has since been deleted no longer matches.
+  def decorator(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+      if not wants_json():
+        response = make_response(view(*args, **kwargs))
+        response.vary.add('Accept')
+        return response
+      etag = current_etag(tables, 'json')
+      if etag is not None and kwargs:
+        etag += '-' + '.'.join(str(kwargs[name]) for name in sorted(kwargs))
+      if etag is not None and etag in request.if_none_match:
+        response = Response(status=304)
+      else:
+        response = make_response(view(*args, **kwargs))
+      if etag is not None and response.status_code in (200, 304):
+        response.set_etag(etag)
+      response.vary.add('Accept')
+      return response
+    return wrapper
+  return decorator
+
+def cached_page(view):
+  # Serve the rendered page from the page cache, keyed by endpoint and
+  # arguments. Controllers that write call page_cache.invalidate() with the
+  # endpoints whose pages they change. JSON variants are not cached here;
+  # negotiated() answers repeat requests for them with 304s instead.
+  @wraps(view)
+  def wrapper(*args, **kwargs):
+    # Pages carrying flashed messages are rendered fresh and not stored
+    if not app.config['PAGE_CACHE'] or '_flashes' in session or wants_json():
+      return view(*args, **kwargs)
+
+    key = (request.endpoint, tuple(sorted(kwargs.items())), tuple(sorted(request.args.items(multi=True))))
+    page = page_cache.get(key)
+    if page is None:
+      page = view(*args, **kwargs)
+      if isinstance(page, str):
+        page_cache.set(request.endpoint, key, page)
+    return page
+  return wrapper
+
+#----------------------------------------------------------------------------#
+# Instrumentation.
+#----------------------------------------------------------------------------#
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite only enforces foreign keys, and so ON DELETE CASCADE, when asked
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+  conn.info.setdefault('query_start_time', []).append(timer())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_sql_statement(conn, cursor, statement, parameters, context, executemany):
+  # Count and time every statement issued while handling a request, and log
+  # any statement slower than SLOW_QUERY_MS
+  duration = timer() - conn.info['query_start_time'].pop()
+  if not has_request_context():
+    return
+  if 'sql_stats' not in g:
+    g.sql_stats = QueryStats(keep=app.config['SQL_SLOWEST_STATEMENTS'])
+  g.sql_stats.record(statement, duration)
+
+  if duration * 1000 >= app.config['SLOW_QUERY_MS']:
+    app.logger.warning(
+      'slow_query path=%s ms=%.1f statement="%s"', request.path, duration * 1000, one_line(statement),
+      extra={'sql': {'path': request.path, 'ms': round(duration * 1000, 2), 'statement': one_line(statement)}}
+    )
+
+@event.listens_for(Engine, 'handle_error')
+def discard_sql_timer(context):
+  # A failed statement never reaches after_cursor_execute
+  if context.connection is not None and context.connection.info.get('query_start_time'):
+    context.connection.info['query_start_time'].pop()
+
+@app.after_request
+def report_sql_statements(response):
+  # Debug responses carry the statement count and timings in a Server-Timing
+  # header; in production they are logged. Requests issuing more than
+  # SQL_STATEMENT_THRESHOLD statements, usually an N+1 query, are flagged.
+  stats = g.get('sql_stats') or QueryStats()
+  response.headers['X-SQL-Statements'] = str(stats.statements)
+  flagged = stats.statements > app.config['SQL_STATEMENT_THRESHOLD']
+
+  if app.debug:
+    response.headers['Server-Timing'] = stats.server_timing()
+  if flagged or not app.debug:
+    record = dict(stats.as_dict(), method=request.method, path=request.path,
+                  endpoint=request.endpoint, status=response.status_code, flagged=flagged)
+    app.logger.log(
+      logging.WARNING if flagged else logging.INFO,
+      'sql_stats method=%s path=%s status=%d statements=%d db_ms=%.1f flagged=%s',
+      request.method, request.path, response.status_code, stats.statements, stats.total * 1000,
+      str(flagged).lower(), extra={'sql': record}
+    )
+  return response
 
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
+DATETIME_FORMATS = {
+  'full': "EEEE MMMM, d, y 'at' h:mma",
+  'medium': "EE MM, dd, y h:mma"
+}
+DATETIME_LOCALE = babel.Locale.parse(babel.dates.LC_TIME or 'en_US_POSIX')
+
+BABEL_WIDTHS = ('short', 'medium', 'long', 'full')
+
+@lru_cache(maxsize=None)
+def datetime_pattern(format):
+  # Parse each babel pattern once: our named formats first, then babel's
+  # own widths for the locale, and anything else as a raw pattern
+  if format in DATETIME_FORMATS:
+    return babel.dates.parse_pattern(DATETIME_FORMATS[format])
+  if format in BABEL_WIDTHS:
+    pattern = babel.dates.get_datetime_format(format, locale=DATETIME_LOCALE) \
+      .replace('{0}', babel.dates.get_time_format(format, locale=DATETIME_LOCALE).pattern) \
+      .replace('{1}', babel.dates.get_date_format(format, locale=DATETIME_LOCALE).pattern)
+    return babel.dates.parse_pattern(pattern)
+  return babel.dates.parse_pattern(format)
+
+@lru_cache(maxsize=8192)
 def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format)
+  # Show times are datetimes already; only strings go through dateutil.
+  # Aware datetimes come back in the database session's time zone, so they
+  # are shown in server local time, as show times are entered and grouped.
+  if not isinstance(value, datetime.datetime):
+    value = dateutil.parser.parse(value)
+  if value.tzinfo is not None:
+    value = value.astimezone()
+  return datetime_pattern(format).apply(value, DATETIME_LOCALE)
 
 app.jinja_env.filters['datetime'] = format_datetime
 
+def image_version(image_link):
+  return hashlib.sha256(image_link.encode('utf-8')).hexdigest()[:12]
+
+def thumbnail_url(kind, id, image_link, width):
+  # Proxied, resized URL of an image_link. The link's hash is part of the
+  # URL, so the response can be cached for good and a new link gets a new URL.
+  if not image_link:
+    return image_link
+  return url_for('thumbnail', kind=kind, id=id, w=width, v=image_version(image_link))
+
+app.jinja_env.globals['thumbnail_url'] = thumbnail_url
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
@@ -96,100 +849,81 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@app.route('/api/venues')
+@negotiated('Venue', 'Area', 'Show')
+@cached_page
 def venues():
-  cities_state = []
-  
-  for venue in Venue.query.distinct(Venue.city):
-    cities_state.append((venue.city, venue.state))
+  genres, match = requested_genres()
+  cursor = requested_cursor(VENUE_KEYSET)
 
-  datas = []
+  # Fetch a page of venues in a single query, ordered so that venues sharing
+  # a city - state pair are adjacent, then group them in one pass
+  rows, prev_cursor, next_cursor = page_venues(cursor, genres, match, areas=True)
 
-  # Organize venues into groups of different city - state pairs
-  for city_state_pair in cities_state:
-    data = {
-      "city": city_state_pair[0],
-      "state": city_state_pair[1],
-      "venues": Venue.query.filter_by(city=city_state_pair[0]).all()
-    }
-    datas.append(data)
-  
-
-  return render_template('pages/venues.html', areas=datas)
+  datas = []
+  for (city, state), venues_in_area in groupby(rows, key=lambda row: (row.city, row.state)):
+    venues_in_area = list(venues_in_area)
+    datas.append({
+      "city": city,
+      "state": state,
+      "num_venues": venues_in_area[0].venue_count,
+      "num_artists": venues_in_area[0].artist_count,
+      "num_upcoming_shows": venues_in_area[0].upcoming_shows,
+      "venues": [{"id": venue.id, "name": venue.name} for venue in venues_in_area]
+    })
+
+  if wants_json():
+    return jsonify({'success': True, 'areas': datas, 'prev_cursor': prev_cursor, 'next_cursor': next_cursor})
+  return render_template('pages/venues.html', areas=datas,
+    genre_choices=GENRE_CHOICES, filters={'genre': genres, 'match': match},
+    prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
-  search_term = (request.form.get('search_term', '')).lower()
-  venues = Venue.query.all()
+  search_term = request.form.get('search_term', '')
+  page = max(request.form.get('page', 1, type=int), 1)
+  genres, match = requested_genres()
+  count, venues = search_by_name(Venue, search_term, page, genres, match)
 
-  count = 0
   datas = []
-  # Search in venues with case-insensitive search term
   for venue in venues:
-    if search_term in (venue.name).lower():
-      count += 1
-      data = {
-        "id": venue.id,
-        "name": venue.name,
-        "num_upcoming_shows": 0
-      }
-
-      datas.append(data)
+    data = {
+      "id": venue.id,
+      "name": venue.name,
+      "num_upcoming_shows": venue.num_upcoming_shows
+    }
+    datas.append(data)
 
   response = {
     "count": count,
-    "data": datas
+    "data": datas,
+    "page": page,
+    "has_prev": page > 1,
+    "has_next": page * SEARCH_PAGE_SIZE < count
   }
 
-
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term,
+    filters={'genre': genres, 'match': match})
 
 @app.route('/venues/<int:venue_id>')
+@negotiated('Venue', 'Artist', 'Show', 'Match')
 def show_venue(venue_id):
   # Shows the venue page with the given venue_id
-  venue = Venue.query.filter_by(id=venue_id).all()[0]
-  shows = Show.query.filter_by(venue_id=venue_id).all()
-
-  current_time = datetime.datetime.now()
-
-  past_shows = []
-  upcoming_shows =[]
+  venue = Venue.query.filter_by(id=venue_id).first_or_404()
+  current_time = current_show_time()
+
+  # Split shows at this venue into past and upcoming with two range queries
+  # on the (venue_id, start_time) index
+  past_shows = list_shows(
+    Show.venue_id == venue_id,
+    Show.start_time < current_time,
+    order_by=Show.start_time.desc()
+  )
+  upcoming_shows = list_shows(
+    Show.venue_id == venue_id,
+    Show.start_time >= current_time
+  )
 
-  # Check for shows at this venue whether they are in the past or in the future
-  for show in shows:
-    each_show = {
-      "artist_id" : show.artist_id,
-      "artist_name" : Artist.query.get(show.artist_id).name,
-      "artist_image_link" : Artist.query.get(show.artist_id).image_link,
-      "start_time" : show.start_time
-    }
-
-    if int(show.start_time[:4]) < int(str(current_time)[:4]):
-      past_shows.append(each_show)
-    elif int(show.start_time[:4]) > int(str(current_time)[:4]):
-      upcoming_shows.append(each_show)
-    else:
-      if int(show.start_time[5:7]) < int(str(current_time)[5:7]):
-        past_shows.append(each_show)
-      elif int(show.start_time[5:7]) > int(str(current_time)[5:7]):
-        upcoming_shows.append(each_show)
-      else:
-        if int(show.start_time[8:10]) > int(str(current_time)[8:10]):
-          past_shows.append(each_show)
-        elif int(show.start_time[8:10]) < int(str(current_time)[8:10]):
-          upcoming_shows.append(each_show)
-        else:
-          if int(show.start_time[11:13]) < int(str(current_time)[11:13]):
-            past_shows.append(each_show)
-          elif int(show.start_time[11:13]) > int(str(current_time)[11:13]):
-            upcoming_shows.append(each_show)
-          else:
-            if int(show.start_time[14:]) < int(str(current_time)[14:16]):
-              past_shows.append(each_show)
-            elif int(show.start_time[14:]) > int(str(current_time)[14:16]):
-              upcoming_shows.append(each_show)
-            else:
-              past_shows.append(each_show)
-      
   data = {
     "id": venue.id,
     "name": venue.name,
@@ -206,9 +940,12 @@ def show_venue(venue_id):
     "past_shows": past_shows,
     "upcoming_shows": upcoming_shows,
     "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
+    "upcoming_shows_count": len(upcoming_shows),
+    "recommended_artists": recommended_artists(venue_id) if venue.seeking_talent else []
   }
 
+  if wants_json():
+    return jsonify(detail_json(data, 'recommended_artists'))
   return render_template('pages/show_venue.html', venue=data)
 
 #  Create Venue
@@ -273,7 +1010,11 @@ def create_venue_submission():
       )
 
       db.session.add(venue)
+      count_in_area(city, state, venues=1)
+      bump_versions('Venue')
       db.session.commit()
+      suggest_index.add('venue', venue.id, name)
+      page_cache.invalidate('venues')
 
       # On successful db insert, flash success
       flash('Venue ' + name + ' was successfully listed!')
@@ -287,6 +1028,62 @@ def create_venue_submission():
 
   return render_template('pages/home.html')
 
+def apply_changes(row, values):
+  # Set only the attributes whose submitted value differs from the row's,
+  # so the UPDATE names just those columns. Returns the changed names.
+  # None and '' are the same to a form, which submits empty fields as ''.
+  changed = [name for name, value in values.items()
+             if (getattr(row, name) if getattr(row, name) is not None else '') != value]
+  for name in changed:
+    setattr(row, name, values[name])
+  return changed
+
+def current_show_time():
+  # Shows are stored as timezone-aware timestamps in the server's local time
+  return datetime.datetime.now().astimezone()
+
+def booking_conflict(error):
+  # Name the column, 'artist_id' or 'venue_id', whose booking constraint
+  # rejected a new show, or None if the error was something else
+  diag = getattr(error.orig, 'diag', None)
+  message = getattr(diag, 'constraint_name', None) or str(error.orig)
+  if 'fkey' in message or 'FOREIGN KEY' in message:
+    return None
+  # The same show again: the artist is the one already booked
+  if message == 'Show_pkey':
+    return 'artist_id'
+  for column in ('artist_id', 'venue_id'):
+    if column in message:
+      return column
+  return None
+
+def valid_start_time(start_time):
+  # Check if a show start time is formatted as 'YYYY-MM-DD HH:MM'
+  if len(start_time) != 16:
+    return False
+  for i in range(0, 16):
+    if i != 4 and i != 7 and i != 10 and i != 13:
+      try:
+        val = int(start_time[i])
+      except ValueError:
+        return False
+    elif (i == 4 or i == 7) and start_time[i] != '-':
+      return False
+    elif (i == 10) and start_time[i] != ' ':
+      return False
+    elif (i == 13) and start_time[i] != ':':
+      return False
+
+  return True
+
+def valid_duration(duration):
+  # Check if a show duration is a whole number of minutes, up to a day
+  return duration.isdigit() and 0 < int(duration) <= 24 * 60
+
+def parse_show_time(start_time):
+  # Convert a validated 'YYYY-MM-DD HH:MM' form value into a show timestamp
+  return datetime.datetime.strptime(start_time, '%Y-%m-%d %H:%M').astimezone()
+
 def valid_phone(number):
   # Check if input phone number is formatted correctly for creation or 
   # edit of venue or artist
@@ -304,151 +1101,174 @@ def valid_phone(number):
   
   return True
 
-@app.route('/venues/<venue_id>/delete', methods=['DELETE'])
+@app.route('/venues/<int:venue_id>/delete', methods=['DELETE'])
 def delete_venue(venue_id):
-  # Delete venue with venue_id
-
-  venue = Venue.query.get(venue_id)
+  # Delete venue with venue_id, along with any show at this venue
+  venue = Venue.query.get_or_404(venue_id)
   name = venue.name
-  shows = Show.query.filter_by(venue_id=venue_id).all()
+  success = True
 
-  # Delete any show at the to-be-delete venue first to ensure data integrity
   try:
-    for show in shows:
-      db.session.delete(show)
+    deleted, shows = delete_rows(Venue, [venue_id])
     db.session.commit()
+    suggest_index.remove('venue', venue_id)
+    update_availability_index(removed=shows)
+    page_cache.invalidate('venues', 'shows')
+    flash('Venue ' + name + ' along with any show at this venue were successfully deleted!')
   except:
     db.session.rollback()
-    flash('An error occurred. Show with venue ' + name + ' could not be deleted!')
+    success = False
+    flash('An error occurred. Venue ' + name + ' could not be deleted.')
     print(sys.exc_info())
   finally:
     db.session.close()
 
-  # Actually delete the venue
+  return jsonify({'success': success})
+
+@app.route('/venues/delete', methods=['DELETE'])
+def delete_venues():
+  # Delete every venue in the JSON body's "ids" list in one transaction
+  ids = requested_ids()
+  if ids is None:
+    return jsonify({'success': False, 'message': 'Expected {"ids": [...]} with integer IDs'}), 400
+
   try:
-    db.session.delete(venue)
+    deleted, shows = delete_rows(Venue, ids)
     db.session.commit()
-    flash('Venue ' + name + ' along with any show at this venue were successfully deleted!')
   except:
     db.session.rollback()
-    flash('An error occurred. Venue ' + name + ' could not be deleted.')
     print(sys.exc_info())
+    return jsonify({'success': False, 'message': 'Venues could not be deleted'}), 500
   finally:
     db.session.close()
 
-  return jsonify({'success': True})
+  for venue in deleted:
+    suggest_index.remove('venue', venue.id)
+  update_availability_index(removed=shows)
+  page_cache.invalidate('venues', 'shows')
 
-@app.route('/artist/<artist_id>/delete', methods=['DELETE'])
-def delete_artist(artist_id):
-  # Delete artist with artist_id
+  return jsonify({'success': True, 'deleted': [venue.id for venue in deleted]})
 
-  artist = Artist.query.get(artist_id)
+@app.route('/artist/<int:artist_id>/delete', methods=['DELETE'])
+def delete_artist(artist_id):
+  # Delete artist with artist_id, along with any show with this artist
+  artist = Artist.query.get_or_404(artist_id)
   name = artist.name
-  shows = Show.query.filter_by(artist_id=artist_id).all()
-  # Delete any show with the to-be-delete artist first to ensure data integrity
+  success = True
+
   try:
-    for show in shows:
-      db.session.delete(show)
+    deleted, shows = delete_rows(Artist, [artist_id])
     db.session.commit()
+    suggest_index.remove('artist', artist_id)
+    update_availability_index(removed=shows)
+    page_cache.invalidate('artists', 'venues', 'shows')
+    flash('Artist ' + name + ' along with any show with this artist were successfully deleted!')
   except:
     db.session.rollback()
-    flash('An error occurred. Show with artist ' + name + ' could not be deleted!')
+    success = False
+    flash('An error occurred. Artist ' + name + ' could not be deleted.')
     print(sys.exc_info())
   finally:
     db.session.close()
 
-  # Actually delete artist
+  return jsonify({'success': success})
+
+@app.route('/artists/delete', methods=['DELETE'])
+def delete_artists():
+  # Delete every artist in the JSON body's "ids" list in one transaction
+  ids = requested_ids()
+  if ids is None:
+    return jsonify({'success': False, 'message': 'Expected {"ids": [...]} with integer IDs'}), 400
+
   try:
-    db.session.delete(artist)
+    deleted, shows = delete_rows(Artist, ids)
     db.session.commit()
-    flash('Artist ' + name + ' along with any show with this artist were successfully deleted!')
   except:
     db.session.rollback()
-    flash('An error occurred. Artist ' + name + ' could not be deleted.')
     print(sys.exc_info())
+    return jsonify({'success': False, 'message': 'Artists could not be deleted'}), 500
   finally:
     db.session.close()
 
-  return jsonify({'success': True})
+  for artist in deleted:
+    suggest_index.remove('artist', artist.id)
+  update_availability_index(removed=shows)
+  page_cache.invalidate('artists', 'venues', 'shows')
+
+  return jsonify({'success': True, 'deleted': [artist.id for artist in deleted]})
+
+def requested_ids():
+  # Integer IDs from a {"ids": [...]} JSON body, or None if malformed
+  body = request.get_json(silent=True)
+  ids = body.get('ids') if isinstance(body, dict) else None
+  if not isinstance(ids, list) or not all(type(id) is int for id in ids):
+    return None
+  return ids
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@app.route('/api/artists')
+@negotiated('Artist')
+@cached_page
 def artists():
-  return render_template('pages/artists.html', artists=Artist.query.all())
+  genres, match = requested_genres()
+  cursor = requested_cursor(ARTIST_KEYSET)
+  rows, prev_cursor, next_cursor = page_artists(cursor, genres, match)
+
+  if wants_json():
+    return jsonify({'success': True, 'data': [row._asdict() for row in rows],
+                    'prev_cursor': prev_cursor, 'next_cursor': next_cursor})
+  return render_template('pages/artists.html', artists=rows,
+    genre_choices=GENRE_CHOICES, filters={'genre': genres, 'match': match},
+    prev_cursor=prev_cursor, next_cursor=next_cursor)
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
-  search_term = (request.form.get('search_term', '')).lower()
-  artists = Artist.query.all()
+  search_term = request.form.get('search_term', '')
+  page = max(request.form.get('page', 1, type=int), 1)
+  genres, match = requested_genres()
+  count, artists = search_by_name(Artist, search_term, page, genres, match)
 
-  count = 0
   datas = []
-  # Search in artists with case-insensitive search term 
   for artist in artists:
-    if search_term in (artist.name).lower():
-      count += 1
-      data = {
-        "id": artist.id,
-        "name": artist.name,
-        "num_upcoming_shows": 0
-      }
-      datas.append(data)
+    data = {
+      "id": artist.id,
+      "name": artist.name,
+      "num_upcoming_shows": artist.num_upcoming_shows
+    }
+    datas.append(data)
 
   response = {
     "count": count,
-    "data": datas
+    "data": datas,
+    "page": page,
+    "has_prev": page > 1,
+    "has_next": page * SEARCH_PAGE_SIZE < count
   }
 
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term,
+    filters={'genre': genres, 'match': match})
 
 @app.route('/artists/<int:artist_id>')
+@negotiated('Artist', 'Venue', 'Show', 'Match')
 def show_artist(artist_id):
-  # Shows the venue page with the given venue_id
-
-  artist = Artist.query.filter_by(id=artist_id).all()[0]
-  shows = Show.query.filter_by(artist_id=artist_id).all()
-  current_time = datetime.datetime.now()
-
-  past_shows = []
-  upcoming_shows =[]
+  # Shows the artist page with the given artist_id
+  artist = Artist.query.filter_by(id=artist_id).first_or_404()
+  current_time = current_show_time()
+
+  # Split shows with this artist into past and upcoming with two range
+  # queries on the (artist_id, start_time) index
+  past_shows = list_shows(
+    Show.artist_id == artist_id,
+    Show.start_time < current_time,
+    order_by=Show.start_time.desc()
+  )
+  upcoming_shows = list_shows(
+    Show.artist_id == artist_id,
+    Show.start_time >= current_time
+  )
 
-  # Check for shows with this artist whether they are in the past or in the future
-  for show in shows:
-    each_show = {
-      "venue_id" : show.venue_id,
-      "venue_name" : Venue.query.get(show.venue_id).name,
-      "venue_image_link" : Venue.query.get(show.venue_id).image_link,
-      "start_time" : show.start_time
-    }
-
-    if int(show.start_time[:4]) < int(str(current_time)[:4]):
-      past_shows.append(each_show)
-    elif int(show.start_time[:4]) > int(str(current_time)[:4]):
-      upcoming_shows.append(each_show)
-    else:
-      if int(show.start_time[5:7]) < int(str(current_time)[5:7]):
-        past_shows.append(each_show)
-      elif int(show.start_time[5:7]) > int(str(current_time)[5:7]):
-        upcoming_shows.append(each_show)
-      else:
-        if int(show.start_time[8:10]) > int(str(current_time)[8:10]):
-          past_shows.append(each_show)
-        elif int(show.start_time[8:10]) < int(str(current_time)[8:10]):
-          upcoming_shows.append(each_show)
-        else:
-          if int(show.start_time[11:13]) < int(str(current_time)[11:13]):
-            past_shows.append(each_show)
-          elif int(show.start_time[11:13]) > int(str(current_time)[11:13]):
-            upcoming_shows.append(each_show)
-          else:
-            if int(show.start_time[14:]) < int(str(current_time)[14:16]):
-              past_shows.append(each_show)
-            elif int(show.start_time[14:]) > int(str(current_time)[14:16]):
-              upcoming_shows.append(each_show)
-            else:
-              past_shows.append(each_show)
-      
   data = {
     "id": artist.id,
     "name": artist.name,
@@ -463,9 +1283,12 @@ def show_artist(artist_id):
     "past_shows": past_shows,
     "upcoming_shows": upcoming_shows,
     "past_shows_count": len(past_shows),
-    "upcoming_shows_count": len(upcoming_shows)
+    "upcoming_shows_count": len(upcoming_shows),
+    "recommended_venues": recommended_venues(artist_id) if artist.seeking_venue else []
   }
 
+  if wants_json():
+    return jsonify(detail_json(data, 'recommended_venues'))
   return render_template('pages/show_artist.html', artist=data)
 
 #  Update
@@ -489,6 +1312,7 @@ def edit_artist_submission(artist_id):
   website = request.form['website']
   seeking_venue = request.form['seeking_venue']
   seeking_description = request.form['seeking_description']
+  version = request.form.get('version', type=int)
 
   # Ensure seeking_venue is Boolean
   if seeking_venue == 'True':
@@ -505,24 +1329,44 @@ def edit_artist_submission(artist_id):
     flash('An error occurred. Invalid phone number!')
     return redirect(url_for('edit_artist', artist_id=artist_id))
 
-  # Try to input data into database
+  # Try to input data into database, writing only the columns that changed.
+  # The version column makes the UPDATE conditional on the row still being
+  # the one the form was filled in from.
   try:
     artist = Artist.query.get(artist_id)
-    artist.name = name
-    artist.city = city
-    artist.state = state
-    artist.phone = phone
-    artist.genres = genres
-    artist.facebook_link = facebook_link
-    artist.image_link = image_link
-    artist.website = website
-    artist.seeking_venue = seeking_venue
-    artist.seeking_description = seeking_description
-
-    db.session.commit()
+    if version is not None and version != artist.version:
+      raise StaleDataError()
+    areas = {(artist.city, artist.state), (city, state)}
+    changed = apply_changes(artist, {
+      'name': name,
+      'city': city,
+      'state': state,
+      'phone': phone,
+      'genres': genres,
+      'facebook_link': facebook_link,
+      'image_link': image_link,
+      'website': website,
+      'seeking_venue': seeking_venue,
+      'seeking_description': seeking_description
+    })
+    if changed:
+      if len(areas) > 1:
+        refresh_areas(areas)
+      bump_versions('Artist')
+      db.session.commit()
+      if 'name' in changed:
+        suggest_index.add('artist', artist_id, name)
+      page_cache.invalidate('artists', 'venues', 'shows')
 
-    # On successful db insert, flash success
-    flash('Artist ' + name + ' was successfully edited!')
+      # On successful db insert, flash success
+      flash('Artist ' + name + ' was successfully edited!')
+    else:
+      flash('Artist ' + name + ' was not changed.')
+  except StaleDataError:
+    db.session.rollback()
+    flash('Artist ' + name + ' was changed by someone else while you were editing it. '
+          'Your changes were not saved; please make them again.')
+    return redirect(url_for('edit_artist', artist_id=artist_id))
   except:
     db.session.rollback()
     flash('An error occurred. Artist ' + name + ' could not be edited.')
@@ -552,6 +1396,7 @@ def edit_venue_submission(venue_id):
   website = request.form['website']
   seeking_talent = request.form['seeking_talent']
   seeking_description = request.form['seeking_description']
+  version = request.form.get('version', type=int)
 
   # Ensure seeking_talent is Boolean
   if seeking_talent == 'True':
@@ -568,25 +1413,45 @@ def edit_venue_submission(venue_id):
     flash('An error occurred. Invalid phone number!')
     return redirect(url_for('edit_venue', venue_id=venue_id))
 
-  # Try input data into database
+  # Try input data into database, writing only the columns that changed.
+  # The version column makes the UPDATE conditional on the row still being
+  # the one the form was filled in from.
   try:
     venue = Venue.query.get(venue_id)
-    venue.name = name
-    venue.city = city
-    venue.state = state
-    venue.address = address
-    venue.phone = phone
-    venue.genres = genres
-    venue.facebook_link = facebook_link
-    venue.image_link = image_link
-    venue.website = website
-    venue.seeking_talent = seeking_talent
-    venue.seeking_description = seeking_description
-
-    db.session.commit()
+    if version is not None and version != venue.version:
+      raise StaleDataError()
+    areas = {(venue.city, venue.state), (city, state)}
+    changed = apply_changes(venue, {
+      'name': name,
+      'city': city,
+      'state': state,
+      'address': address,
+      'phone': phone,
+      'genres': genres,
+      'facebook_link': facebook_link,
+      'image_link': image_link,
+      'website': website,
+      'seeking_talent': seeking_talent,
+      'seeking_description': seeking_description
+    })
+    if changed:
+      if len(areas) > 1:
+        refresh_areas(areas)
+      bump_versions('Venue')
+      db.session.commit()
+      if 'name' in changed:
+        suggest_index.add('venue', venue_id, name)
+      page_cache.invalidate('venues', 'shows')
 
-    # On successful db insert, flash success
-    flash('Venue ' + name + ' was successfully edited!')
+      # On successful db insert, flash success
+      flash('Venue ' + name + ' was successfully edited!')
+    else:
+      flash('Venue ' + name + ' was not changed.')
+  except StaleDataError:
+    db.session.rollback()
+    flash('Venue ' + name + ' was changed by someone else while you were editing it. '
+          'Your changes were not saved; please make them again.')
+    return redirect(url_for('edit_venue', venue_id=venue_id))
   except:
     db.session.rollback()
     flash('An error occurred. Venue ' + name + ' could not be edited.')
@@ -655,7 +1520,11 @@ def create_artist_submission():
       )
 
       db.session.add(artist)
+      count_in_area(city, state, artists=1)
+      bump_versions('Artist')
       db.session.commit()
+      suggest_index.add('artist', artist.id, name)
+      page_cache.invalidate('artists', 'venues')
 
       # On successful db insert, flash success
       flash('Artist ' + name + ' was successfully listed!')
@@ -672,23 +1541,59 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@app.route('/api/shows')
+@negotiated('Show', 'Venue', 'Artist')
+@cached_page
 def shows():
-  # displays list of shows at /shows
-  shows = Show.query.all()
-  datas=[]
-
-  for show in shows:
-    data = {
-      "venue_id" : show.venue_id,
-      "venue_name" : Venue.query.get(show.venue_id).name,
-      "artist_id" : show.artist_id,
-      "artist_name" : Artist.query.get(show.artist_id).name,
-      "artist_image_link" : Artist.query.get(show.artist_id).image_link,
-      "start_time" : show.start_time
-    }
-    datas.append(data)
-
-  return render_template('pages/shows.html', shows=datas)
+  # displays list of shows at /shows, a page at a time
+  cursor = requested_cursor(SHOW_KEYSET)
+  datas, prev_cursor, next_cursor = page_shows(cursor)
+
+  if wants_json():
+    return jsonify({'success': True, 'data': shows_json(datas),
+                    'prev_cursor': prev_cursor, 'next_cursor': next_cursor})
+  return render_template('pages/shows.html', shows=datas, filters={},
+    prev_cursor=prev_cursor, next_cursor=next_cursor)
+
+def requested_calendar():
+  # Parse ?from=&to=&city=&state= into show_calendar() arguments. Dates are
+  # YYYY-MM-DD; the range defaults to the coming week and is capped.
+  try:
+    first_day = datetime.datetime.strptime(request.args['from'], '%Y-%m-%d').date() \
+      if request.args.get('from') else datetime.date.today()
+    last_day = datetime.datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+      if request.args.get('to') else first_day + datetime.timedelta(days=6)
+  except ValueError:
+    abort(400)
+  if last_day < first_day or (last_day - first_day).days >= CALENDAR_MAX_DAYS:
+    abort(400)
+  return first_day, last_day, request.args.get('city', '').strip(), request.args.get('state', '').strip()
+
+@app.route('/shows/calendar')
+def show_calendar_page():
+  # Not page cached: the default range moves with the date, and the range
+  # scan is cheap enough to run every time
+  first_day, last_day, city, state = requested_calendar()
+  days = show_calendar(first_day, last_day, city, state)
+
+  return render_template('pages/calendar.html', days=days, first_day=first_day,
+    last_day=last_day, city=city, state=state)
+
+@app.route('/shows/export')
+def export_shows():
+  # Stream every show as CSV or NDJSON, optionally gzipped on the fly
+  format = request.args.get('format', 'csv')
+  gzip = request.args.get('gzip', '') in ('1', 'true')
+  if format not in EXPORT_FORMATS:
+    abort(400)
+
+  filename = 'shows.' + format + ('.gz' if gzip else '')
+  chunks = export_chunks(EXPORT_COLUMNS, export_show_rows(), format, gzip)
+  return Response(
+    stream_with_context(chunks),
+    mimetype='application/gzip' if gzip else EXPORT_FORMATS[format][1],
+    headers={'Content-Disposition': 'attachment; filename=' + filename}
+  )
 
 @app.route('/shows/create')
 def create_shows():
@@ -703,8 +1608,7 @@ def create_show_submission():
   artist_id = request.form['artist_id']
   venue_id = request.form['venue_id']
   start_time = request.form['start_time']
-
-  valid_time = True
+  duration = request.form.get('duration') or str(app.config['SHOW_DURATION'])
 
   # Check if IDs are valid
   try:
@@ -720,26 +1624,15 @@ def create_show_submission():
     return redirect(url_for('create_shows'))
 
   # Check if start time is valid
-  if len(start_time) == 16:
-    for i in range(0, 16):
-      if i != 4 and i != 7 and i != 10 and i != 13:
-        try:
-          val = int(start_time[i])
-        except ValueError:
-          valid_time = False
-      elif (i == 4 or i == 7) and start_time[i] != '-':
-        valid_time = False
-      elif (i == 10) and start_time[i] != ' ':
-        valid_time = False
-      elif (i == 13) and start_time[i] != ':':
-        valid_time = False
-  else:
-    valid_time = False
-
-  if not valid_time:
+  if not valid_start_time(start_time):
     flash('An error occured. Invalid Start Time!')
     return redirect(url_for('create_shows'))
 
+  # Check if duration is valid
+  if not valid_duration(duration):
+    flash('An error occured. Invalid Duration!')
+    return redirect(url_for('create_shows'))
+
   # Check if artist and venue exist in database
   artist_exists = db.session.query(Artist.id).filter_by(id=artist_id).scalar() is not None
   venue_exists = db.session.query(Venue.id).filter_by(id=venue_id).scalar() is not None
@@ -754,28 +1647,36 @@ def create_show_submission():
     flash('An error occurred. Venue ID ' + venue_id + ' does not exists!')
     return redirect(url_for('create_shows'))
 
-  # Check if an artist or a venue is having another show at the given time
-  same_start_times = db.session.query(Show).filter_by(start_time=start_time).all()
-  for show_same_time in same_start_times:
-    if show_same_time.artist_id == int(artist_id):
-      flash('Artist with ID ' + artist_id + ' is not available at time ' + start_time)
-      return redirect(url_for('create_shows'))
-    if show_same_time.venue_id == int(venue_id):
-      flash('Venue with ID ' + venue_id + ' is not available at time ' + start_time)
-      return redirect(url_for('create_shows'))
-
-  # Try to input data into database
+  # Try to input data into database. The booking constraints reject a
+  # show that clashes with another one for the same artist or venue.
+  start_at = parse_show_time(start_time)
+  end_at = start_at + datetime.timedelta(minutes=int(duration))
   try:
     show = Show(
       venue_id = venue_id,
       artist_id = artist_id,
-      start_time = start_time,
+      start_time = start_at,
+      end_time = end_at
     )
 
     db.session.add(show)
+    count_show_in_area(venue_int, start_at)
+    bump_show_version(start_at)
     db.session.commit()
+    update_availability_index(added=[(venue_int, artist_int, start_at, end_at)])
+    page_cache.invalidate('shows', 'venues')
 
     flash('Show was successfully listed!')
+  except IntegrityError as error:
+    db.session.rollback()
+    conflict = booking_conflict(error)
+    if conflict == 'artist_id':
+      flash('Artist with ID ' + artist_id + ' is not available at time ' + start_time)
+      return redirect(url_for('create_shows'))
+    elif conflict == 'venue_id':
+      flash('Venue with ID ' + venue_id + ' is not available at time ' + start_time)
+      return redirect(url_for('create_shows'))
+    flash('An error occurred. Show could not be listed.')
   except:
     db.session.rollback()
     flash('An error occurred. Show could not be listed.')
@@ -785,8 +1686,666 @@ def create_show_submission():
   return render_template('pages/home.html')
 
 
+#  Images
+#  ----------------------------------------------------------------
+
+def thumbnail_width(width):
+  # Round a requested width up to one of the configured widths, so the cache
+  # holds a few variants per image rather than one per requested width
+  widths = app.config['THUMBNAIL_WIDTHS']
+  if width is None:
+    return app.config['THUMBNAIL_DEFAULT_WIDTH']
+  return next((allowed for allowed in widths if allowed >= width), widths[-1])
+
+def fetch_source_image(url):
+  return fetch_image(
+    url,
+    max_bytes=app.config['THUMBNAIL_MAX_SOURCE_BYTES'],
+    timeout=app.config['THUMBNAIL_FETCH_TIMEOUT'],
+    allow_private=app.config['THUMBNAIL_ALLOW_PRIVATE']
+  )
+
+@app.route('/img/<any(venue, artist):kind>/<int:id>')
+def thumbnail(kind, id):
+  # A venue or artist's image_link resized to ?w= pixels wide: WebP for
+  # clients listing image/webp in Accept, JPEG for the rest. The original is
+  # fetched once; variants come from the on-disk thumbnail cache.
+  model = Venue if kind == 'venue' else Artist
+  image_link = db.session.query(model.image_link).filter(model.id == id).scalar()
+  if not image_link:
+    abort(404)
+  width = thumbnail_width(request.args.get('w', type=int))
+  webp = any(value == 'image/webp' and quality > 0 for value, quality in request.accept_mimetypes)
+  format = 'webp' if webp else 'jpeg'
+
+  try:
+    name, data = thumbnail_cache.get(image_link, width, format, fetch_source_image)
+  except ImageUnavailable as error:
+    app.logger.warning('thumbnail %s %d: %s', kind, id, error)
+    abort(502)
+
+  response = Response(data, mimetype=IMAGE_FORMATS[format][1])
+  response.set_etag(name)
+  response.vary.add('Accept')
+  if request.args.get('v') == image_version(image_link):
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 3600
+    response.cache_control.immutable = True
+  else:
+    response.cache_control.public = True
+    response.cache_control.max_age = 300
+  return response.make_conditional(request)
+
+#  API
+#  ----------------------------------------------------------------
+
+@app.route('/api/suggest')
+def suggest():
+  # Typeahead suggestions for artist and venue names
+  query = request.args.get('q', '')
+  limit = min(request.args.get('limit', 10, type=int), 50)
+
+  if suggest_index.usable:
+    matches = suggest_index.suggest(query, limit)
+  else:
+    # Fall back to the database when the index is disabled or over its cap
+    matches = []
+    if query.strip():
+      for kind, model in (('venue', Venue), ('artist', Artist)):
+        count, rows = search_by_name(model, query.strip())
+        matches += [(kind, row.id, row.name) for row in rows]
+      matches = matches[:limit]
+
+  return jsonify({
+    'success': True,
+    'query': query,
+    'data': [{'type': kind, 'id': id, 'name': name} for kind, id, name in matches]
+  })
+
+@app.route('/api/shows/calendar')
+def api_show_calendar():
+  first_day, last_day, city, state = requested_calendar()
+  days = show_calendar(first_day, last_day, city, state)
+  return jsonify({
+    'success': True,
+    'from': first_day.isoformat(),
+    'to': last_day.isoformat(),
+    'city': city or None,
+    'state': state or None,
+    'days': [{
+      'date': day.isoformat(),
+      'shows': shows_json(shows)
+    } for day, shows in days]
+  })
+
+@app.route('/api/areas')
+def api_areas():
+  # Venue, artist and upcoming show counts per area, read from the summary
+  # table rather than grouping the base tables; ?state= narrows it down
+  query = db.session.query(Area.city, Area.state, Area.venue_count, Area.artist_count,
+                           Area.upcoming_shows, area_stale())
+  state = request.args.get('state')
+  if state:
+    query = query.filter(Area.state == state)
+  rows = fresh_areas(query.order_by(Area.state, Area.city))
+  return jsonify({
+    'success': True,
+    'data': [{
+      'city': row.city,
+      'state': row.state,
+      'venues': row.venue_count,
+      'artists': row.artist_count,
+      'upcoming_shows': row.upcoming_shows
+    } for row in rows]
+  })
+
+def shows_json(shows):
+  # list_shows() rows with ISO 8601 start times
+  return [dict(show, start_time=show['start_time'].isoformat()) for show in shows]
+
+def detail_json(data, recommended):
+  # JSON variant of a venue or artist page's template data
+  return dict(
+    data,
+    success=True,
+    past_shows=shows_json(data['past_shows']),
+    upcoming_shows=shows_json(data['upcoming_shows']),
+    **{recommended: [row._asdict() for row in data[recommended]]}
+  )
+
+def requested_time(name, default=None):
+  # An ISO 8601 ?name= argument as a timestamp, naive times being local
+  value = request.args.get(name)
+  if not value:
+    if default is None:
+      abort(400)
+    return default
+  try:
+    return datetime.datetime.fromisoformat(value).astimezone().timestamp()
+  except ValueError:
+    abort(400)
+
+def requested_window(default_days=None):
+  # The [from, to) window of a free/busy or slot query
+  start = requested_time('from', current_show_time().timestamp() if default_days else None)
+  end = requested_time('to', start + default_days * 86400 if default_days else None)
+  if end <= start:
+    abort(400)
+  return start, end
+
+def iso_time(timestamp):
+  return datetime.datetime.fromtimestamp(timestamp).astimezone().isoformat()
+
+def intervals_json(intervals):
+  return [{'start': iso_time(start), 'end': iso_time(end)} for start, end in intervals]
+
+def free_busy(kind, model, id):
+  # Busy bookings and the free gaps between them over ?from=&to=
+  if db.session.query(model.id).filter_by(id=id).scalar() is None:
+    abort(404)
+  start, end = requested_window(default_days=7)
+  busy = ready_availability_index().busy(kind, id, start, end)
+
+  free = []
+  position = start
+  for booked_start, booked_end in busy:
+    if booked_start > position:
+      free.append((position, booked_start))
+    position = max(position, booked_end)
+  if position < end:
+    free.append((position, end))
+
+  return jsonify({
+    'success': True,
+    'id': id,
+    'from': iso_time(start),
+    'to': iso_time(end),
+    'busy': intervals_json(busy),
+    'free': intervals_json(free)
+  })
+
+@app.route('/api/artists/<int:artist_id>/availability')
+def artist_availability(artist_id):
+  return free_busy('artist', Artist, artist_id)
+
+@app.route('/api/venues/<int:venue_id>/availability')
+def venue_availability(venue_id):
+  return free_busy('venue', Venue, venue_id)
+
+@app.route('/api/availability/artists')
+def free_artists():
+  # Artists with no booking in [from, to), optionally of given genres
+  start, end = requested_window()
+  genres, match = requested_genres()
+  query = db.session.query(Artist.id, Artist.name)
+  if genres:
+    query = query.filter(genre_filter(Artist, genres, match))
+  index = ready_availability_index()
+  return jsonify({
+    'success': True,
+    'data': [row._asdict() for row in query.order_by(Artist.name, Artist.id)
+             if index.is_free('artist', row.id, start, end)]
+  })
+
+@app.route('/api/availability/venues')
+def free_venues():
+  # Venues with no booking in [from, to), optionally in one city
+  start, end = requested_window()
+  city = request.args.get('city', '').strip()
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state)
+  if city:
+    query = query.filter(Venue.city == city)
+  index = ready_availability_index()
+  return jsonify({
+    'success': True,
+    'data': [row._asdict() for row in query.order_by(Venue.name, Venue.id)
+             if index.is_free('venue', row.id, start, end)]
+  })
+
+@app.route('/api/availability/slots')
+def find_slots():
+  # The earliest slot of ?duration= minutes in [from, to) when the artist
+  # and each venue (or just ?venue_id=) are both free, soonest first
+  artist_id = request.args.get('artist_id', type=int)
+  venue_id = request.args.get('venue_id', type=int)
+  duration = request.args.get('duration', str(app.config['SHOW_DURATION']))
+  if artist_id is None or not valid_duration(duration):
+    abort(400)
+  if db.session.query(Artist.id).filter_by(id=artist_id).scalar() is None:
+    abort(404)
+  start, end = requested_window(default_days=30)
+  city = request.args.get('city', '').strip()
+
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state)
+  if venue_id is not None:
+    query = query.filter(Venue.id == venue_id)
+  if city:
+    query = query.filter(Venue.city == city)
+  index = ready_availability_index()
+  slots = []
+  for venue in query:
+    slot = index.find_slot([('artist', artist_id), ('venue', venue.id)], start, int(duration) * 60, end)
+    if slot is not None:
+      slots.append((slot, venue))
+  slots.sort(key=lambda found: (found[0], found[1].name))
+
+  return jsonify({
+    'success': True,
+    'artist_id': artist_id,
+    'duration': int(duration),
+    'data': [dict(venue._asdict(), start=iso_time(slot), end=iso_time(slot + int(duration) * 60))
+             for slot, venue in slots]
+  })
+
+@app.route('/metrics')
+def metrics():
+  # Page cache, thumbnail cache and log queue counters in the Prometheus text format
+  lines = []
+  for name, value in sorted(page_cache.stats().items()):
+    metric = 'fyyur_page_cache_' + name + ('' if name == 'entries' else '_total')
+    lines.append('# TYPE %s %s' % (metric, 'gauge' if name == 'entries' else 'counter'))
+    lines.append('%s %d' % (metric, value))
+  for name in ('hits', 'misses', 'evictions'):
+    lines.append('# TYPE fyyur_thumbnail_cache_%s_total counter' % name)
+    lines.append('fyyur_thumbnail_cache_%s_total %d' % (name, getattr(thumbnail_cache, name)))
+  if log_handler is not None:
+    lines.append('# TYPE fyyur_log_records_dropped_total counter')
+    lines.append('fyyur_log_records_dropped_total %d' % log_handler.dropped)
+  return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+#----------------------------------------------------------------------------#
+# Commands.
+#----------------------------------------------------------------------------#
+
+def import_text(record, field, required=False):
+  value = record.get(field)
+  value = '' if value is None else str(value).strip()
+  if required and not value:
+    raise ValueError('missing ' + field)
+  return value or None
+
+def import_bool(record, field):
+  return str(record.get(field, '')).strip().lower() in ('true', 't', 'yes', 'y', '1')
+
+def import_genres(record):
+  # Genres are a JSON list in NDJSON files and ';' separated in CSV files
+  genres = record.get('genres') or []
+  if isinstance(genres, str):
+    genres = [genre.strip() for genre in genres.split(';') if genre.strip()]
+  return genres
+
+def import_phone(record):
+  phone = import_text(record, 'phone')
+  if phone and not valid_phone(phone):
+    raise ValueError('invalid phone number ' + phone)
+  return phone
+
+def import_venue(record):
+  # Validate an imported venue with the same rules as the venue form
+  return {
+    'name': import_text(record, 'name', required=True),
+    'city': import_text(record, 'city', required=True),
+    'state': import_text(record, 'state', required=True),
+    'address': import_text(record, 'address', required=True),
+    'phone': import_phone(record),
+    'genres': import_genres(record),
+    'facebook_link': import_text(record, 'facebook_link'),
+    'image_link': import_text(record, 'image_link'),
+    'website': import_text(record, 'website'),
+    'seeking_talent': import_bool(record, 'seeking_talent'),
+    'seeking_description': import_text(record, 'seeking_description')
+  }
+
+def import_artist(record):
+  # Validate an imported artist with the same rules as the artist form
+  return {
+    'name': import_text(record, 'name', required=True),
+    'city': import_text(record, 'city', required=True),
+    'state': import_text(record, 'state', required=True),
+    'phone': import_phone(record),
+    'genres': import_genres(record),
+    'facebook_link': import_text(record, 'facebook_link'),
+    'image_link': import_text(record, 'image_link'),
+    'website': import_text(record, 'website'),
+    'seeking_venue': import_bool(record, 'seeking_venue'),
+    'seeking_description': import_text(record, 'seeking_description')
+  }
+
+def import_show(record):
+  # Validate an imported show with the same rules as the show form
+  start_time = import_text(record, 'start_time', required=True)
+  if not valid_start_time(start_time):
+    raise ValueError('invalid start time ' + start_time)
+  duration = import_text(record, 'duration') or str(app.config['SHOW_DURATION'])
+  if not valid_duration(duration):
+    raise ValueError('invalid duration ' + duration)
+  try:
+    artist_id = int(record.get('artist_id'))
+    venue_id = int(record.get('venue_id'))
+  except (TypeError, ValueError):
+    raise ValueError('invalid ID(s)')
+  start_at = parse_show_time(start_time)
+  return {
+    'venue_id': venue_id,
+    'artist_id': artist_id,
+    'start_time': start_at,
+    'end_time': start_at + datetime.timedelta(minutes=int(duration))
+  }
+
+IMPORTERS = {
+  'venues': (Venue, import_venue),
+  'artists': (Artist, import_artist),
+  'shows': (Show, import_show)
+}
+
+def insert_batch(table, rows):
+  # COPY on Postgres, a single executemany INSERT elsewhere
+  connection = db.session.connection()
+  if connection.dialect.name == 'postgresql':
+    copy_rows(connection, table, rows)
+  else:
+    connection.execute(table.insert(), rows)
+
+def list_shows_inserted(rows):
+  # Add ShowListing rows for shows inserted in bulk, in the same transaction
+  venues = {id: (name, image_link) for id, name, image_link in db.session.query(Venue.id, Venue.name, Venue.image_link)
+            .filter(Venue.id.in_({row['venue_id'] for row in rows}))}
+  artists = {id: (name, image_link) for id, name, image_link in db.session.query(Artist.id, Artist.name, Artist.image_link)
+             .filter(Artist.id.in_({row['artist_id'] for row in rows}))}
+  insert_batch(ShowListing.__table__, [dict(
+    venue_id=row['venue_id'],
+    artist_id=row['artist_id'],
+    start_time=row['start_time'],
+    venue_name=venues[row['venue_id']][0],
+    venue_image_link=venues[row['venue_id']][1],
+    artist_name=artists[row['artist_id']][0],
+    artist_image_link=artists[row['artist_id']][1]
+  ) for row in rows])
+
+def rebuild_show_listing():
+  # Bring ShowListing back in line with the shows, venues and artists,
+  # writing only rows that drifted. Returns (added, updated, removed) counts.
+  listing = ShowListing.__table__
+  same_show = and_(Show.venue_id == listing.c.venue_id, Show.artist_id == listing.c.artist_id,
+                   Show.start_time == listing.c.start_time)
+  connection = db.session.connection()
+  removed = connection.execute(listing.delete().where(~db.exists().where(same_show))).rowcount
+
+  updated = 0
+  for model, prefix in ((Venue, 'venue'), (Artist, 'artist')):
+    name, image_link = listing.c[prefix + '_name'], listing.c[prefix + '_image_link']
+    source = db.select([model.name, model.image_link]).where(model.id == listing.c[prefix + '_id'])
+    drifted = db.exists().where(and_(
+      model.id == listing.c[prefix + '_id'],
+      or_(model.name != name, func.coalesce(model.image_link, '') != func.coalesce(image_link, ''))
+    ))
+    updated += connection.execute(listing.update().where(drifted).values({
+      name: source.with_only_columns([model.name]).as_scalar(),
+      image_link: source.with_only_columns([model.image_link]).as_scalar()
+    })).rowcount
+
+  missing = ~db.exists().where(and_(listing.c.venue_id == Show.venue_id, listing.c.artist_id == Show.artist_id,
+                                    listing.c.start_time == Show.start_time))
+  added = connection.execute(listing.insert().from_select(LISTING_COLUMNS, listing_source().where(missing))).rowcount
+  if added or updated or removed:
+    bump_versions('Show')
+  db.session.commit()
+  return added, updated, removed
+
+@app.cli.command('rebuild-show-listing')
+def rebuild_show_listing_command():
+  """Repair the /shows read model from the shows, venues and artists."""
+  added, updated, removed = rebuild_show_listing()
+  click.echo('%d listed shows added, %d updated, %d removed' % (added, updated, removed))
+
+@app.cli.command('import-data')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'format', type=click.Choice(['csv', 'ndjson']),
+              help='File format, guessed from the file extension by default.')
+@click.option('--batch-size', default=1000, show_default=True)
+def import_data(kind, path, format, batch_size):
+  """Stream venues, artists or shows from a CSV or NDJSON file."""
+  format = format or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+  # The csv module needs newline='' to read quoted newlines correctly
+  with open(path, newline='', encoding='utf-8') as file:
+    import_records(kind, read_records(file, format), batch_size)
+
+def import_records(kind, records, batch_size):
+  # Insert (line number, record) pairs in batches, reporting rejected ones
+  model, build_row = IMPORTERS[kind]
+  stats = ImportStats()
+
+  # Only one batch of records is held in memory at a time
+  for batch in batched(records, batch_size):
+    rows = []
+    for line, record in batch:
+      try:
+        if isinstance(record, ValueError):
+          raise record
+        rows.append(build_row(record))
+      except ValueError as error:
+        stats.rejected += 1
+        click.echo('line %d: %s' % (line, error), err=True)
+
+    # Names must be unique, as in the create forms
+    if model is not Show and rows:
+      taken = {name for name, in db.session.query(model.name).filter(model.name.in_([row['name'] for row in rows]))}
+      unique_rows = []
+      for row in rows:
+        if row['name'] in taken:
+          stats.rejected += 1
+          click.echo('%s already exists' % row['name'], err=True)
+        else:
+          taken.add(row['name'])
+          unique_rows.append(row)
+      rows = unique_rows
+
+    if not rows:
+      continue
+    try:
+      insert_batch(model.__table__, rows)
+      if model is Show:
+        list_shows_inserted(rows)
+      db.session.commit()
+      stats.imported += len(rows)
+    except Exception:
+      # Something in the batch was rejected by the database; retry row by
+      # row so only the offending rows are skipped
+      db.session.rollback()
+      for row in rows:
+        try:
+          db.session.execute(model.__table__.insert(), row)
+          if model is Show:
+            list_shows_inserted([row])
+          db.session.commit()
+          stats.imported += 1
+        except DBAPIError as error:
+          db.session.rollback()
+          stats.rejected += 1
+          click.echo('rejected %r: %s' % (row, error.orig), err=True)
+
+    click.echo(stats.summary())
+
+  refresh_areas()
+  bump_versions(model.__tablename__)
+  if model is Show:
+    bump_versions('Booking')
+    restart_show_clock()
+  else:
+    db.session.add(MatchChange(kind='all'))
+  db.session.commit()
+  click.echo('Done: ' + stats.summary())
+
+def current_matches(matches, side):
+  # {venue or artist id: [(other id, score), ...]} best first, from Match rows
+  current = {}
+  key, other, rank = ('venue_id', 'artist_id', 'venue_rank') if side == 'venue' else ('artist_id', 'venue_id', 'artist_rank')
+  for match in sorted(matches, key=lambda match: getattr(match, rank) or 0):
+    if getattr(match, rank) is not None:
+      current.setdefault(getattr(match, key), []).append((getattr(match, other), match.score))
+  return current
+
+def refresh_matches(k, city_bonus, full=False):
+  # Recompute the top matches of the venues and artists logged in
+  # MatchChange, and of those that may have gained or lost one of them, then
+  # write only the rows that changed. Recomputes every match with `full`, or
+  # if a bulk insert asked for it. Returns (added, updated, removed) counts.
+  changes = db.session.query(MatchChange.id, MatchChange.kind, MatchChange.entity_id).all()
+  full = full or any(kind == 'all' for id, kind, entity_id in changes)
+  if not changes and not full:
+    return 0, 0, 0
+
+  recommender = Recommender([genre for genre, label in GENRE_CHOICES], k=k, city_bonus=city_bonus)
+  venues = db.session.query(Venue.id, Venue.genres, Venue.city, Venue.state) \
+    .filter(Venue.seeking_talent.is_(True)).all()
+  artists = db.session.query(Artist.id, Artist.genres, Artist.city, Artist.state) \
+    .filter(Artist.seeking_venue.is_(True)).all()
+  existing = {(match.venue_id, match.artist_id): match for match in Match.query}
+
+  if full:
+    venue_matches = recommender.top_matches(venues, artists)
+    artist_matches = recommender.top_matches(artists, venues)
+  else:
+    changed = {'venue': set(), 'artist': set()}
+    for id, kind, entity_id in changes:
+      changed[kind].add(entity_id)
+    venue_matches = recommender.updated_matches(
+      venues, artists, current_matches(existing.values(), 'venue'), changed['venue'], changed['artist'])
+    artist_matches = recommender.updated_matches(
+      artists, venues, current_matches(existing.values(), 'artist'), changed['artist'], changed['venue'])
+    # Venues and artists no longer seeking lose their matches
+    for id in changed['venue']:
+      venue_matches.setdefault(id, [])
+    for id in changed['artist']:
+      artist_matches.setdefault(id, [])
+
+  # Keep the ranks of venues and artists not recomputed
+  wanted = {}
+  if not full:
+    for (venue_id, artist_id), match in existing.items():
+      wanted[(venue_id, artist_id)] = {
+        'score': match.score,
+        'venue_rank': None if venue_id in venue_matches else match.venue_rank,
+        'artist_rank': None if artist_id in artist_matches else match.artist_rank
+      }
+  for venue_id, matches in venue_matches.items():
+    for rank, (artist_id, score) in enumerate(matches, 1):
+      row = wanted.setdefault((venue_id, artist_id), {'artist_rank': None})
+      row['score'], row['venue_rank'] = score, rank
+  for artist_id, matches in artist_matches.items():
+    for rank, (venue_id, score) in enumerate(matches, 1):
+      row = wanted.setdefault((venue_id, artist_id), {'venue_rank': None})
+      row['score'], row['artist_rank'] = score, rank
+
+  added = updated = removed = 0
+  for key, match in existing.items():
+    row = wanted.get(key)
+    if row is None or (row['venue_rank'] is None and row['artist_rank'] is None):
+      db.session.delete(match)
+      removed += 1
+  for (venue_id, artist_id), row in wanted.items():
+    if row['venue_rank'] is None and row['artist_rank'] is None:
+      continue
+    match = existing.get((venue_id, artist_id))
+    if match is None:
+      db.session.add(Match(venue_id=venue_id, artist_id=artist_id, **row))
+      added += 1
+    elif (match.score, match.venue_rank, match.artist_rank) != (row['score'], row['venue_rank'], row['artist_rank']):
+      match.score, match.venue_rank, match.artist_rank = row['score'], row['venue_rank'], row['artist_rank']
+      updated += 1
+  if changes:
+    MatchChange.query.filter(MatchChange.id <= max(id for id, kind, entity_id in changes)) \
+      .delete(synchronize_session=False)
+  if added or updated or removed:
+    bump_versions('Match')
+  db.session.commit()
+  return added, updated, removed
+
+@app.cli.command('refresh-recommendations')
+@click.option('--top-k', default=lambda: app.config['RECOMMENDATIONS_TOP_K'], show_default='config', type=int)
+@click.option('--city-bonus', default=lambda: app.config['RECOMMENDATIONS_CITY_BONUS'], show_default='config', type=int)
+@click.option('--full', is_flag=True, help='Recompute every match, e.g. after changing --top-k or --city-bonus.')
+def refresh_recommendations(top_k, city_bonus, full):
+  """Recompute genre matches between seeking venues and artists."""
+  added, updated, removed = refresh_matches(top_k, city_bonus, full)
+  click.echo('%d matches added, %d updated, %d removed' % (added, updated, removed))
+
+@app.cli.command('refresh-areas')
+def refresh_areas_command():
+  """Recount every area's venues, artists and upcoming shows."""
+  refresh_areas()
+  db.session.commit()
+  click.echo('%d areas' % Area.query.count())
+
+def seed_database(venues, artists, shows, seed=0, batch_size=10000, progress=None):
+  # Bulk insert synthetic venues, artists and then shows between them,
+  # committing once per batch. `progress` is called after each batch with
+  # the table name, the batch size and the rows inserted so far. The area
+  # summaries are recounted at the end.
+  data = SeedData(seed=seed)
+  data.check(venues, artists, shows)
+  new_ids = {}
+  for model, rows in ((Venue, data.venues(venues)), (Artist, data.artists(artists))):
+    first_id = (db.session.query(func.max(model.id)).scalar() or 0) + 1
+    total = 0
+    for batch in batched(rows, batch_size):
+      insert_batch(model.__table__, batch)
+      db.session.commit()
+      total += len(batch)
+      if progress:
+        progress(model.__tablename__, len(batch), total)
+    new_ids[model] = [id for id, in db.session.query(model.id).filter(model.id >= first_id).order_by(model.id)]
+
+  total = 0
+  for batch in batched(data.shows(new_ids[Venue], new_ids[Artist], shows), batch_size):
+    insert_batch(Show.__table__, batch)
+    list_shows_inserted(batch)
+    db.session.commit()
+    total += len(batch)
+    if progress:
+      progress('Show', len(batch), total)
+  refresh_areas()
+  bump_versions('Venue', 'Artist', 'Booking')
+  restart_show_clock()
+  db.session.add(MatchChange(kind='all'))
+  db.session.commit()
+
+@app.cli.command('seed')
+@click.option('--venues', default=10000, show_default=True)
+@click.option('--artists', default=50000, show_default=True)
+@click.option('--shows', default=1000000, show_default=True)
+@click.option('--seed', 'seed', default=0, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--batch-size', default=10000, show_default=True)
+def seed_command(venues, artists, shows, seed, batch_size):
+  """Fill the database with synthetic venues, artists and shows."""
+  stats = ImportStats()
+
+  def progress(kind, rows, total):
+    stats.imported += rows
+    click.echo('%s: %d rows (%.0f rows/s)' % (kind, total, stats.rows_per_second))
+
+  try:
+    seed_database(venues, artists, shows, seed, batch_size, progress)
+  except ValueError as error:
+    raise click.UsageError(str(error))
+  click.echo('Done: ' + stats.summary())
+
+@app.cli.command('export-shows')
+@click.argument('file', type=click.File('wb'), default='-')
+@click.option('--format', 'format', type=click.Choice(sorted(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--gzip', is_flag=True, help='Compress the output with gzip.')
+def export_shows_command(file, format, gzip):
+  """Stream every show with venue and artist names to FILE."""
+  for chunk in export_chunks(EXPORT_COLUMNS, export_show_rows(), format, gzip):
+    file.write(chunk)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
+    if wants_json():
+        return jsonify({'success': False, 'message': 'Not found'}), 404
     return render_template('errors/404.html'), 404
 
 @app.errorhandler(500)
@@ -794,14 +2353,26 @@ def server_error(error):
     return render_template('errors/500.html'), 500
 
 
+# Request threads only put records on a bounded queue; a listener thread
+# formats them as JSON and writes them to a size-rotated file
+log_handler = None
+
 if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    file_handler = RotatingFileHandler(
+        app.config['LOG_FILE'],
+        maxBytes=app.config['LOG_MAX_BYTES'],
+        backupCount=app.config['LOG_BACKUP_COUNT']
     )
-    app.logger.setLevel(logging.INFO)
+    file_handler.setFormatter(JSONFormatter())
     file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
+    # Flask's stderr handler writes on the request thread, so it moves
+    # behind the queue too
+    app.logger.removeHandler(default_handler)
+    log_handler, log_listener = queued_logging(file_handler, default_handler, queue_size=app.config['LOG_QUEUE_SIZE'])
+    app.logger.setLevel(logging.INFO)
+    app.logger.addHandler(log_handler)
+    log_listener.start()
+    atexit.register(log_listener.stop)
     app.logger.info('errors')
 
 #----------------------------------------------------------------------------#
@@ -0,0 +1,160 @@
+import threading
+from bisect import bisect_left, bisect_right
+
+
+class AvailabilityIndex(object):
+    """In-memory free/busy index of artist and venue bookings.
+
+    Each artist and venue keeps its bookings as parallel arrays of start
+    and end times sorted by start, plus a running maximum of the end times
+    (how far the bookings so far reach). A query bisects to the bookings
+    starting before the window closes and walks back only while that
+    reach extends into the window. Bookings of one artist or venue do not
+    overlap, so this visits O(1) bookings and a query costs O(log n).
+    Times are POSIX timestamps.
+
+    The index ignores updates until it has been built with rebuild().
+    `version` is the version of the source data it was built from, and
+    update() only applies a change made at the next version; otherwise a
+    change was missed and the index needs rebuilding.
+    """
+
+    def __init__(self):
+        self.ready = False
+        self.version = None
+        self._lock = threading.Lock()
+        self._bookings = {}
+
+    def __len__(self):
+        return sum(len(starts) for starts, ends, reach in self._bookings.values())
+
+    def rebuild(self, bookings, version=None):
+        # Replace the whole index with (kind, id, start, end) bookings
+        grouped = {}
+        for kind, id, start, end in bookings:
+            grouped.setdefault((kind, id), []).append((start, end))
+        with self._lock:
+            self._bookings = {}
+            for key, intervals in grouped.items():
+                intervals.sort()
+                starts = [start for start, end in intervals]
+                ends = [end for start, end in intervals]
+                self._bookings[key] = (starts, ends, self._reach(ends))
+            self.version = version
+            self.ready = True
+
+    def reset(self):
+        # Drop every booking; the index must be rebuilt before it is used
+        with self._lock:
+            self._bookings = {}
+            self.version = None
+            self.ready = False
+
+    def add(self, kind, id, start, end):
+        # Record a new booking
+        with self._lock:
+            if self.ready:
+                self._add((kind, id), start, end)
+
+    def remove(self, kind, id, start, end):
+        # Forget a booking, if it is known
+        with self._lock:
+            if self.ready:
+                self._remove((kind, id), start, end)
+
+    def update(self, version, added=(), removed=()):
+        # Apply a change made at `version`, as (kind, id, start, end)
+        # bookings added and removed. Returns False, changing nothing, if
+        # the index is not at the version before.
+        with self._lock:
+            if not self.ready or self.version is None or self.version != version - 1:
+                return False
+            for kind, id, start, end in removed:
+                self._remove((kind, id), start, end)
+            for kind, id, start, end in added:
+                self._add((kind, id), start, end)
+            self.version = version
+            return True
+
+    def busy(self, kind, id, start, end):
+        # Return the (start, end) bookings overlapping [start, end), in order
+        with self._lock:
+            return self._overlapping((kind, id), start, end)
+
+    def is_free(self, kind, id, start, end):
+        return not self.busy(kind, id, start, end)
+
+    def find_slot(self, keys, start, duration, end=None):
+        # Earliest time from `start` when every (kind, id) in keys is free
+        # for `duration` seconds, finishing by `end`; None if there is none
+        with self._lock:
+            moved = True
+            while moved:
+                moved = False
+                for key in keys:
+                    slot = self._first_gap(key, start, duration, end)
+                    if slot is None:
+                        return None
+                    if slot != start:
+                        start = slot
+                        moved = True
+            return start
+
+    def _add(self, key, start, end):
+        starts, ends, reach = self._bookings.setdefault(key, ([], [], []))
+        position = bisect_right(starts, start)
+        starts.insert(position, start)
+        ends.insert(position, end)
+        reach.insert(position, end)
+        # Only the reach of later bookings this one outlasts changes
+        for i in range(position, len(reach)):
+            value = max(reach[i - 1], ends[i]) if i else ends[i]
+            if i > position and value == reach[i]:
+                break
+            reach[i] = value
+
+    def _remove(self, key, start, end):
+        starts, ends, reach = self._bookings.get(key, ([], [], []))
+        position = bisect_left(starts, start)
+        while position < len(starts) and starts[position] == start and ends[position] != end:
+            position += 1
+        if position == len(starts) or starts[position] != start:
+            return
+        del starts[position], ends[position], reach[position]
+        if not starts:
+            del self._bookings[key]
+            return
+        # The reach of later bookings may shrink, so recompute it from here
+        for i in range(position, len(reach)):
+            reach[i] = max(reach[i - 1], ends[i]) if i else ends[i]
+
+    def _overlapping(self, key, start, end):
+        starts, ends, reach = self._bookings.get(key, ((), (), ()))
+        found = []
+        i = bisect_left(starts, end) - 1
+        while i >= 0 and reach[i] > start:
+            if ends[i] > start:
+                found.append((starts[i], ends[i]))
+            i -= 1
+        found.reverse()
+        return found
+
+    def _first_gap(self, key, start, duration, end):
+        starts, ends, reach = self._bookings.get(key, ((), (), ()))
+        position = bisect_right(starts, start)
+        if position and reach[position - 1] > start:
+            start = reach[position - 1]
+        for i in range(position, len(starts)):
+            if starts[i] >= start + duration or (end is not None and start + duration > end):
+                break
+            start = max(start, ends[i])
+        if end is not None and start + duration > end:
+            return None
+        return start
+
+    @staticmethod
+    def _reach(ends):
+        reach = []
+        for end in ends:
+            reach.append(max(reach[-1], end) if reach else end)
+        return reach
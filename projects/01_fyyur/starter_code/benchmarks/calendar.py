@@ -0,0 +1,111 @@
+"""Time the show calendar range query against scanning every show.
+
+Run from the starter_code directory:
+
+    python -m benchmarks.calendar --shows 1000000
+
+Shows are spread over a year across venues in a few dozen cities. Queries
+ask for one week in one city, or for one day in every city. Both are timed
+with and without the start_time index. With a city, SQLite can instead
+walk the city's venues and their (venue_id, start_time) index, so the
+range index matters most for calendars without one. The full scan is the
+old way of answering the question, loading every show from list_shows()
+and filtering in Python.
+"""
+import os
+import random
+import argparse
+import datetime
+from timeit import default_timer as timer
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import db, Venue, Artist, Show, show_calendar, list_shows
+
+CITIES = 40
+VENUES = 2000
+ARTISTS = 5000
+SLOT = datetime.timedelta(hours=17)
+
+
+def seed(shows, batch_size=50000):
+    db.create_all()
+    db.session.execute(Venue.__table__.insert(), [{
+        'id': id, 'name': 'Venue %d' % id, 'city': 'City %d' % (id % CITIES), 'state': 'CA',
+        'address': '', 'genres': [], 'seeking_talent': False
+    } for id in range(1, VENUES + 1)])
+    db.session.execute(Artist.__table__.insert(), [{
+        'id': id, 'name': 'Artist %d' % id, 'city': 'City %d' % (id % CITIES), 'state': 'CA',
+        'genres': [], 'seeking_venue': False
+    } for id in range(1, ARTISTS + 1)])
+
+    # Show i is at venue i mod VENUES in slot i // VENUES, so no venue or
+    # artist is booked twice at the same time
+    start = datetime.datetime(2030, 1, 1, 18, 0).astimezone()
+    for offset in range(0, shows, batch_size):
+        db.session.execute(Show.__table__.insert(), [{
+            'venue_id': i % VENUES + 1,
+            'artist_id': i % ARTISTS + 1,
+            'start_time': start + SLOT * (i // VENUES),
+            'end_time': start + SLOT * (i // VENUES) + datetime.timedelta(hours=2)
+        } for i in range(offset, min(offset + batch_size, shows))])
+    db.session.commit()
+
+
+def full_scan(first_day, last_day, city, cities):
+    return [
+        show for show in list_shows()
+        if first_day <= show['start_time'].date() <= last_day and cities[show['venue_id']] == city
+    ]
+
+
+def time_per_query(lookup, queries):
+    start = timer()
+    for query in queries:
+        lookup(*query)
+    return (timer() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--shows', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--scans', type=int, default=2, help='full scans to time, they are slow')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = timer()
+    seed(args.shows)
+    seed_s = timer() - start
+
+    rng = random.Random(args.seed)
+    days = (SLOT * (args.shows // VENUES)).days
+    weeks, single_days = [], []
+    for _ in range(args.queries):
+        first_day = datetime.date(2030, 1, 1) + datetime.timedelta(days=rng.randrange(max(days - 6, 1)))
+        weeks.append((first_day, first_day + datetime.timedelta(days=6), 'City %d' % rng.randrange(CITIES)))
+        single_days.append((first_day, first_day))
+
+    def found(queries):
+        return sum(len(shows) for query in queries[:5] for day, shows in show_calendar(*query)) / 5
+
+    results = [
+        ('week in a city', found(weeks), time_per_query(show_calendar, weeks)),
+        ('day in every city', found(single_days), time_per_query(show_calendar, single_days)),
+    ]
+    db.session.execute('DROP INDEX "ix_Show_start_time"')
+    results += [
+        ('week in a city, no index', None, time_per_query(show_calendar, weeks[:args.scans])),
+        ('day in every city, no index', None, time_per_query(show_calendar, single_days[:args.scans])),
+    ]
+    cities = {id: 'City %d' % (id % CITIES) for id in range(1, VENUES + 1)}
+    results.append(('python full scan', None,
+                    time_per_query(lambda *query: full_scan(*query, cities), weeks[:args.scans])))
+
+    print('shows: %d over %d days, seeded in %.1f s' % (args.shows, days, seed_s))
+    for name, rows, ms in results:
+        print('%-30s %10.2f ms/query%s' % (name + ':', ms, '  (%.0f shows)' % rows if rows else ''))
+
+
+if __name__ == '__main__':
+    main()
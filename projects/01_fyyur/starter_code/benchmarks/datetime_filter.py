@@ -0,0 +1,63 @@
+"""Micro-benchmark the datetime Jinja filter.
+
+Run from the starter_code directory:
+
+    python -m benchmarks.datetime_filter --values 5000
+
+Compares the original filter, which parsed every value with dateutil and
+formatted it through babel.dates.format_datetime, against the memoized
+format_datetime for the 'full' and 'medium' formats. Each case formats
+every value once (cold) and then again (warm, as on a repeated render).
+"""
+import os
+import random
+import datetime
+import argparse
+from timeit import default_timer as timer
+
+import babel.dates
+import dateutil.parser
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import format_datetime
+
+
+def original_format_datetime(value, format='medium'):
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def time_per_value(formatter, values, format):
+    start = timer()
+    for value in values:
+        formatter(value, format)
+    return (timer() - start) / len(values) * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--values', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    start = datetime.datetime(2020, 1, 1).astimezone()
+    times = [start + datetime.timedelta(minutes=15 * rng.randint(0, 200000)) for _ in range(args.values)]
+    strings = [time.strftime('%Y-%m-%d %H:%M') for time in times]
+
+    print('values: %d (microseconds per value)' % args.values)
+    for format in ('full', 'medium'):
+        format_datetime.cache_clear()
+        original = time_per_value(original_format_datetime, strings, format)
+        cold = time_per_value(format_datetime, times, format)
+        warm = time_per_value(format_datetime, times, format)
+        print('%-6s original: %7.2f  memoized cold: %7.2f  memoized warm: %7.2f' % (format, original, cold, warm))
+
+
+if __name__ == '__main__':
+    main()
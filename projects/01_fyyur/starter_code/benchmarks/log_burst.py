@@ -0,0 +1,99 @@
+"""Time log calls during a burst, direct to file against through the queue.
+
+Run from the starter_code directory:
+
+    python -m benchmarks.log_burst --records 50000
+
+The direct case is the original setup, a FileHandler writing on the
+calling thread. The queued case is the production setup: a bounded
+DroppingQueueHandler, with a listener thread writing JSON records to a
+rotating file. Latency is measured per log call, as the request thread
+sees it. Any flushing on close is left out. --write-delay adds a sleep to
+every write, standing in for a slow or contended disk.
+"""
+import os
+import logging
+import argparse
+import time
+import tempfile
+from logging.handlers import RotatingFileHandler
+from timeit import default_timer as timer
+
+from logqueue import JSONFormatter, queued_logging
+
+
+class SlowDisk(object):
+    """Mixin sleeping before every write, as a stalled disk would block"""
+
+    write_delay = 0.0
+
+    def emit(self, record):
+        if self.write_delay:
+            time.sleep(self.write_delay)
+        super(SlowDisk, self).emit(record)
+
+
+class SlowFileHandler(SlowDisk, logging.FileHandler):
+    pass
+
+
+class SlowRotatingFileHandler(SlowDisk, RotatingFileHandler):
+    pass
+
+
+def burst(logger, records):
+    # Per-call latencies in microseconds, with a warning every 100 records
+    latencies = []
+    for i in range(records):
+        level = logging.WARNING if i % 100 == 0 else logging.INFO
+        start = timer()
+        logger.log(level, 'sql_stats path=/venues statements=%d', i % 7, extra={'sql': {'statements': i % 7}})
+        latencies.append((timer() - start) * 1e6)
+    latencies.sort()
+    return latencies
+
+
+def percentile(values, fraction):
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--queue-size', type=int, default=10000)
+    parser.add_argument('--write-delay', type=float, default=0.0, help='milliseconds per write')
+    args = parser.parse_args()
+    SlowDisk.write_delay = args.write_delay / 1000
+
+    with tempfile.TemporaryDirectory() as directory:
+        direct = logging.getLogger('fyyur.benchmark.direct')
+        file_handler = SlowFileHandler(os.path.join(directory, 'direct.log'))
+        file_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
+        direct.addHandler(file_handler)
+
+        queued = logging.getLogger('fyyur.benchmark.queued')
+        rotating = SlowRotatingFileHandler(os.path.join(directory, 'queued.log'), maxBytes=10 * 1024 * 1024, backupCount=5)
+        rotating.setFormatter(JSONFormatter())
+        handler, listener = queued_logging(rotating, queue_size=args.queue_size)
+        queued.addHandler(handler)
+
+        for logger in (direct, queued):
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+
+        listener.start()
+        results = [('direct FileHandler', burst(direct, args.records)),
+                   ('queued', burst(queued, args.records))]
+        listener.stop()
+        file_handler.close()
+        rotating.close()
+
+    print('records: %d, queue size: %d, write delay: %.2f ms' % (args.records, args.queue_size, args.write_delay))
+    for name, latencies in results:
+        print('%-20s p50 %7.1f us  p99 %7.1f us  max %9.1f us' % (
+            name + ':', percentile(latencies, 0.5), percentile(latencies, 0.99), latencies[-1]))
+    print('queued records dropped: %d' % handler.dropped)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+"""Time every Fyyur route on seeded data and report latency as JSON.
+
+Run from the starter_code directory:
+
+    python -m benchmarks.routes --venues 1000 --artists 5000 --shows 50000 --output before.json
+
+The database, an in-memory SQLite one unless DATABASE_URL is set, is
+filled with seed_database() and every read route is requested through
+the Flask test client with random IDs and arguments. For each route the
+report gives p50, p95 and p99 latency in milliseconds and the SQL
+statements per request, from the X-SQL-Statements header. Keys are
+sorted so that reports from two commits diff cleanly. Routes that write,
+and the image proxy, which fetches from the network, are listed as
+skipped. Streamed routes set the header before their body runs, so their
+statement counts are reported as null. The page cache is off unless
+--page-cache is given.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import datetime
+from timeit import default_timer as timer
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import app, db, Venue, Artist, seed_database
+
+WRITES = {
+    'create_venue_submission', 'edit_venue_submission', 'delete_venue', 'delete_venues',
+    'create_artist_submission', 'edit_artist_submission', 'delete_artist', 'delete_artists',
+    'create_show_submission',
+}
+EXTERNAL = {'thumbnail'}
+# Bodies streamed after X-SQL-Statements is sent, so it undercounts
+STREAMED = {'export_shows'}
+
+
+def day(rng, ids):
+    # A random day within the seeded year either side of today
+    return (datetime.date.today() + datetime.timedelta(days=rng.randint(-365, 358))).isoformat()
+
+
+def evening(rng, ids):
+    # An evening window on one random day, as a booker would ask about
+    date = day(rng, ids)
+    return {'from': date + 'T20:00', 'to': date + 'T23:00'}
+
+
+def fragment(rng, names):
+    # A few letters from a random name, as a user would type them
+    name = rng.choice(names)
+    start = rng.randrange(max(len(name) - 3, 1))
+    return name[start:start + rng.randint(3, 6)]
+
+
+# endpoint -> function(rng, ids) returning (method, path, request keyword arguments)
+REQUESTS = {
+    'index': lambda rng, ids: ('GET', '/', {}),
+    'venues': lambda rng, ids: ('GET', '/venues', {}),
+    'artists': lambda rng, ids: ('GET', '/artists', {}),
+    'shows': lambda rng, ids: ('GET', '/shows', {}),
+    'show_venue': lambda rng, ids: ('GET', '/venues/%d' % rng.choice(ids['venue']), {}),
+    'show_artist': lambda rng, ids: ('GET', '/artists/%d' % rng.choice(ids['artist']), {}),
+    'edit_venue': lambda rng, ids: ('GET', '/venues/%d/edit' % rng.choice(ids['venue']), {}),
+    'edit_artist': lambda rng, ids: ('GET', '/artists/%d/edit' % rng.choice(ids['artist']), {}),
+    'create_venue_form': lambda rng, ids: ('GET', '/venues/create', {}),
+    'create_artist_form': lambda rng, ids: ('GET', '/artists/create', {}),
+    'create_shows': lambda rng, ids: ('GET', '/shows/create', {}),
+    'search_venues': lambda rng, ids: ('POST', '/venues/search', {'data': {'search_term': fragment(rng, ids['venue_name'])}}),
+    'search_artists': lambda rng, ids: ('POST', '/artists/search', {'data': {'search_term': fragment(rng, ids['artist_name'])}}),
+    'suggest': lambda rng, ids: ('GET', '/api/suggest', {'query_string': {'q': fragment(rng, ids['artist_name'])}}),
+    'show_calendar_page': lambda rng, ids: ('GET', '/shows/calendar', {'query_string': {'from': day(rng, ids), 'city': 'New York'}}),
+    'api_show_calendar': lambda rng, ids: ('GET', '/api/shows/calendar', {'query_string': {'from': day(rng, ids)}}),
+    'api_areas': lambda rng, ids: ('GET', '/api/areas', {}),
+    'artist_availability': lambda rng, ids: ('GET', '/api/artists/%d/availability' % rng.choice(ids['artist']), {}),
+    'venue_availability': lambda rng, ids: ('GET', '/api/venues/%d/availability' % rng.choice(ids['venue']), {}),
+    'free_artists': lambda rng, ids: ('GET', '/api/availability/artists', {'query_string': dict(
+        evening(rng, ids), genre='Jazz')}),
+    'free_venues': lambda rng, ids: ('GET', '/api/availability/venues', {'query_string': dict(
+        evening(rng, ids), city='Chicago')}),
+    'find_slots': lambda rng, ids: ('GET', '/api/availability/slots', {'query_string': {
+        'artist_id': rng.choice(ids['artist']), 'city': 'Austin'}}),
+    'export_shows': lambda rng, ids: ('GET', '/shows/export', {'query_string': {'format': 'ndjson'}}),
+    'metrics': lambda rng, ids: ('GET', '/metrics', {}),
+}
+
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of sorted values
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def run(client, build, rng, ids, requests, warmup, measure_queries=True):
+    latencies, statements, statuses = [], [], {}
+    for i in range(warmup + requests):
+        method, path, kwargs = build(rng, ids)
+        start = timer()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()
+        elapsed = (timer() - start) * 1000
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        statements.append(int(response.headers.get('X-SQL-Statements', 0)))
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+    latencies.sort()
+    return {
+        'method': method,
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        'queries_per_request': round(sum(statements) / len(statements), 2) if measure_queries else None,
+        'max_queries': max(statements) if measure_queries else None,
+        'status': statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--venues', type=int, default=1000)
+    parser.add_argument('--artists', type=int, default=5000)
+    parser.add_argument('--shows', type=int, default=50000)
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed requests per route')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--routes', nargs='*', help='endpoints to time, all by default')
+    parser.add_argument('--page-cache', action='store_true')
+    parser.add_argument('--output', help='write the report here instead of stdout')
+    args = parser.parse_args()
+
+    app.config['PAGE_CACHE'] = args.page_cache
+    with app.app_context():
+        db.create_all()
+        start = timer()
+        seed_database(args.venues, args.artists, args.shows, args.seed)
+        seed_s = timer() - start
+        ids = {
+            'venue': [id for id, in db.session.query(Venue.id)],
+            'artist': [id for id, in db.session.query(Artist.id)],
+            'venue_name': [name for name, in db.session.query(Venue.name)],
+            'artist_name': [name for name, in db.session.query(Artist.name)],
+        }
+        db.session.remove()
+
+    endpoints = {rule.endpoint for rule in app.url_map.iter_rules()} - {'static'}
+    uncovered = endpoints - set(REQUESTS) - WRITES - EXTERNAL
+    if uncovered:
+        sys.exit('No request defined for: ' + ', '.join(sorted(uncovered)))
+
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    routes = {}
+    for endpoint in sorted(args.routes or set(REQUESTS) & endpoints):
+        result = run(client, REQUESTS[endpoint], rng, ids, args.requests, args.warmup,
+                     measure_queries=endpoint not in STREAMED)
+        routes[endpoint] = result
+        queries = result['queries_per_request']
+        print('%-22s p50 %8.2f ms  p99 %8.2f ms  %s queries' % (
+            endpoint, result['p50_ms'], result['p99_ms'], '%6.1f' % queries if queries is not None else '   n/a'),
+            file=sys.stderr)
+
+    report = {
+        'dataset': {'venues': args.venues, 'artists': args.artists, 'shows': args.shows,
+                    'seed': args.seed, 'seconds_to_seed': round(seed_s, 1),
+                    'database': db.engine.dialect.name},
+        'requests_per_route': args.requests,
+        'page_cache': args.page_cache,
+        'routes': routes,
+        'skipped': sorted((WRITES | EXTERNAL) & endpoints),
+    }
+    output = json.dumps(report, indent=2, sort_keys=True) + '\n'
+    if args.output:
+        with open(args.output, 'w') as report_file:
+            report_file.write(output)
+    else:
+        sys.stdout.write(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Compare typeahead lookups against the full-scan search.
+
+Run from the starter_code directory:
+
+    python -m benchmarks.suggest --names 50000
+
+The full scan is the original search: load every name and test each one
+with a lowercased substring check. The database search is
+search_by_name() on an in-memory SQLite database.
+"""
+import os
+import random
+import argparse
+from timeit import default_timer as timer
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import db, Venue, search_by_name
+from suggest import SuggestIndex
+
+WORDS = [
+    'the', 'musical', 'hop', 'jazz', 'club', 'bar', 'hall', 'live', 'room',
+    'blue', 'note', 'velvet', 'lounge', 'garden', 'theatre', 'station',
+    'square', 'park', 'pianos', 'dueling', 'wild', 'sax', 'band', 'petals'
+]
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ven', 'tor', 'sel', 'du', 'bri', 'on', 'quin', 'zo']
+
+
+def random_name(rng):
+    # A made-up proper name followed by a common venue or band word
+    proper = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4)))
+    return (proper + ' ' + rng.choice(WORDS)).title()
+
+
+def full_scan(names, query):
+    query = query.lower()
+    return [name for name in names if query in name.lower()]
+
+
+def time_per_query(lookup, queries):
+    start = timer()
+    for query in queries:
+        lookup(query)
+    return (timer() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--names', type=int, default=50000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = [random_name(rng) for _ in range(args.names)]
+    queries = []
+    for _ in range(args.queries):
+        # Half the queries are name prefixes, half start mid-name
+        name = rng.choice(names)
+        start = rng.randint(0, len(name) - 3) if rng.random() < 0.5 else 0
+        queries.append(name[start:start + rng.randint(2, 8)])
+
+    start = timer()
+    index = SuggestIndex(max_entries=args.names)
+    index.rebuild(('venue', id, name) for id, name in enumerate(names, 1))
+    build_ms = (timer() - start) * 1000
+
+    db.create_all()
+    db.session.bulk_insert_mappings(Venue, [{
+        'name': name, 'city': 'San Francisco', 'state': 'CA', 'address': '',
+        'genres': [], 'seeking_talent': False
+    } for name in names])
+    db.session.commit()
+
+    print('names: %d, queries: %d' % (args.names, args.queries))
+    print('index build:         %8.1f ms' % build_ms)
+    print('index lookup:        %8.3f ms/query' % time_per_query(index.suggest, queries))
+    print('python full scan:    %8.3f ms/query' % time_per_query(lambda q: full_scan(names, q), queries))
+    print('database search:     %8.3f ms/query' % time_per_query(lambda q: search_by_name(Venue, q), queries))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class PageCache(object):
+    """LRU cache of rendered pages with a time-to-live.
+
+    Every entry belongs to a group, normally the endpoint that rendered
+    it, so that a write can invalidate every cached variant of the pages
+    it affects. At most `max_entries` pages are kept; the least recently
+    used page is evicted first.
+    """
+
+    def __init__(self, max_entries=128, ttl=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._groups = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= self.clock():
+                self._discard(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, group, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (group, self.clock() + self.ttl, value)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._discard(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *groups):
+        # Drop every cached page in the given groups
+        with self._lock:
+            for group in groups:
+                for key in self._groups.pop(group, ()):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._groups.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'entries': len(self._entries),
+        }
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._groups[entry[0]]
+            keys.discard(key)
+            if not keys:
+                del self._groups[entry[0]]
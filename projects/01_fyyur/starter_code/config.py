@@ -10,4 +10,47 @@ DEBUG = True
 
 
 # TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = 'postgres://postgres@localhost:5432/fyyur'
+SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgres://postgres@localhost:5432/fyyur')
+
+# Keep an in-memory typeahead index of artist and venue names for /api/suggest
+SUGGEST_INDEX = True
+SUGGEST_MAX_ENTRIES = 100000
+
+# Cache the rendered /venues, /artists and /shows pages
+PAGE_CACHE = True
+PAGE_CACHE_SIZE = 128
+PAGE_CACHE_TTL = 300
+
+# Length in minutes of a show submitted without a duration
+SHOW_DURATION = 120
+
+# Genre matches kept per seeking venue and artist by `flask refresh-recommendations`,
+# and the score bonus for a match in the same city
+RECOMMENDATIONS_TOP_K = 5
+RECOMMENDATIONS_CITY_BONUS = 1
+
+# Per-request SQL statistics: flag requests issuing more statements than
+# the threshold, log statements slower than SLOW_QUERY_MS, and report the
+# slowest few of each request
+SQL_STATEMENT_THRESHOLD = 25
+SLOW_QUERY_MS = 100
+SQL_SLOWEST_STATEMENTS = 3
+
+# Outside debug mode, log JSON records through a bounded queue to a file
+# rotated at LOG_MAX_BYTES. Under pressure records below WARNING are dropped.
+LOG_FILE = 'error.log'
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_QUEUE_SIZE = 10000
+
+# Resized venue and artist images served from /img/<kind>/<id>?w=, cached on
+# disk up to THUMBNAIL_CACHE_BYTES. Widths are rounded up to one of
+# THUMBNAIL_WIDTHS. Image links on private networks are refused unless
+# THUMBNAIL_ALLOW_PRIVATE is set, as the tests do for their local server.
+THUMBNAIL_DIR = os.path.join(basedir, 'thumbnails')
+THUMBNAIL_CACHE_BYTES = 256 * 1024 * 1024
+THUMBNAIL_WIDTHS = [80, 160, 320, 640, 1280]
+THUMBNAIL_DEFAULT_WIDTH = 320
+THUMBNAIL_MAX_SOURCE_BYTES = 20 * 1024 * 1024
+THUMBNAIL_FETCH_TIMEOUT = 10
+THUMBNAIL_ALLOW_PRIVATE = False
@@ -0,0 +1,71 @@
+import csv
+import json
+import zlib
+import datetime
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _Echo(object):
+    """File-like object whose write() hands back what it was given"""
+
+    def write(self, value):
+        return value
+
+
+def export_value(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def csv_lines(columns, rows):
+    # Yield a header line, then one CSV line per row
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([export_value(value) for value in row])
+
+
+def ndjson_lines(columns, rows):
+    # Yield one JSON object per line for each row
+    for row in rows:
+        yield json.dumps(dict(zip(columns, (export_value(value) for value in row)))) + '\n'
+
+
+def chunked(lines, size=CHUNK_SIZE):
+    # Join lines into encoded chunks of roughly `size` bytes
+    buffer = []
+    length = 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            length = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def gzipped(chunks):
+    # Compress a stream of byte chunks into a gzip stream as it is read
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+def export_chunks(columns, rows, format='csv', gzip=False):
+    # Encoded, optionally gzipped, chunks of rows in the given format
+    lines, mimetype = FORMATS[format]
+    chunks = chunked(lines(columns, rows))
+    return gzipped(chunks) if gzip else chunks
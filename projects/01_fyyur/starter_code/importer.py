@@ -0,0 +1,97 @@
+import io
+import csv
+import json
+import datetime
+from itertools import islice
+from timeit import default_timer as timer
+
+
+def read_records(stream, format):
+    # Yield (line number, record dict) pairs one at a time from a CSV file
+    # with a header row or from newline-delimited JSON. An NDJSON line that
+    # is not a JSON object comes as a ValueError in place of its record, so
+    # the caller can reject it and carry on. CSV streams must be opened with
+    # newline=''.
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif format == 'ndjson':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as error:
+                record = ValueError('invalid JSON: %s' % error)
+            else:
+                if not isinstance(record, dict):
+                    record = ValueError('expected a JSON object')
+            yield number, record
+    else:
+        raise ValueError('Unknown format ' + format)
+
+
+def batched(iterable, size):
+    # Yield lists of up to `size` items without reading ahead any further
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def copy_value(value):
+    # Render a value in the text form COPY ... WITH (FORMAT csv) expects
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        items = ('"' + str(item).replace('\\', '\\\\').replace('"', '\\"') + '"' for item in value)
+        return '{' + ','.join(items) + '}'
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def copy_rows(connection, table, rows):
+    # Bulk load rows into a Postgres table with COPY FROM STDIN
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([copy_value(row[column]) for column in columns])
+    buffer.seek(0)
+
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            'COPY "%s" (%s) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')' % (
+                table.name, ', '.join('"%s"' % column for column in columns)
+            ),
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+class ImportStats(object):
+    """Counts imported and rejected rows and reports the import rate"""
+
+    def __init__(self, clock=timer):
+        self.clock = clock
+        self.started = clock()
+        self.imported = 0
+        self.rejected = 0
+
+    @property
+    def rows_per_second(self):
+        elapsed = self.clock() - self.started
+        return self.imported / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        return '%d rows imported, %d rejected, %.0f rows/s' % (
+            self.imported, self.rejected, self.rows_per_second
+        )
@@ -0,0 +1,70 @@
+import json
+import queue
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+# Attributes every LogRecord has; anything else was passed with `extra`
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line.
+
+    Fields passed to a log call with `extra` are included alongside the
+    time, level, logger, message and source location.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created).astimezone().isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'path': record.pathname,
+            'line': record.lineno,
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES and not name.startswith('_'):
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to a bounded queue without ever blocking the caller.
+
+    Once the queue is `high_water` full, records below `keep_level` are
+    dropped so that the room left goes to warnings and errors. Records
+    that find the queue completely full are dropped whatever their level.
+    Drops are counted in `dropped`.
+    """
+
+    def __init__(self, queue, keep_level=logging.WARNING, high_water=0.8):
+        super(DroppingQueueHandler, self).__init__(queue)
+        self.keep_level = keep_level
+        self.high_water = int(queue.maxsize * high_water)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The listener runs in this process, so the record is passed on as
+        # is and formatted on the listener's thread rather than the caller's
+        return record
+
+    def enqueue(self, record):
+        if record.levelno < self.keep_level and self.queue.qsize() >= self.high_water:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def queued_logging(*handlers, queue_size=10000, keep_level=logging.WARNING):
+    # Return a (queue handler, listener) pair passing records through a
+    # bounded queue to `handlers`, which run on the listener's thread
+    records = queue.Queue(maxsize=queue_size)
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    return DroppingQueueHandler(records, keep_level=keep_level), listener
@@ -0,0 +1,25 @@
+"""booking version
+
+Revision ID: 0d9b6e2f7a45
+Revises: c5e0a7d3b961
+Create Date: 2026-10-18 19:02:17.584130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0d9b6e2f7a45'
+down_revision = 'c5e0a7d3b961'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Counts shows created and deleted, for the in-memory availability index
+    op.execute('''INSERT INTO "Version" (name, version) VALUES ('Booking', 1)''')
+
+
+def downgrade():
+    op.execute('''DELETE FROM "Version" WHERE name = 'Booking' ''')
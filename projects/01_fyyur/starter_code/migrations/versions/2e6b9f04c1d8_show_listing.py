@@ -0,0 +1,47 @@
+"""show listing
+
+Revision ID: 2e6b9f04c1d8
+Revises: f1c83a5d7e20
+Create Date: 2026-10-18 16:31:55.104927
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6b9f04c1d8'
+down_revision = 'f1c83a5d7e20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ShowListing',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('venue_name', sa.String(), nullable=False),
+    sa.Column('venue_image_link', sa.String(length=500), nullable=True),
+    sa.Column('artist_name', sa.String(), nullable=False),
+    sa.Column('artist_image_link', sa.String(length=500), nullable=True),
+    sa.ForeignKeyConstraint(['venue_id', 'artist_id', 'start_time'], ['Show.venue_id', 'Show.artist_id', 'Show.start_time'],
+                            ondelete='CASCADE', onupdate='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'artist_id', 'start_time')
+    )
+    op.create_index('ix_ShowListing_start_time', 'ShowListing', ['start_time', 'venue_id', 'artist_id'], unique=False)
+    op.create_index('ix_ShowListing_artist_id', 'ShowListing', ['artist_id'], unique=False)
+    op.execute('''
+        INSERT INTO "ShowListing" (venue_id, artist_id, start_time, venue_name, venue_image_link,
+                                   artist_name, artist_image_link)
+        SELECT s.venue_id, s.artist_id, s.start_time, v.name, v.image_link, a.name, a.image_link
+        FROM "Show" s
+        JOIN "Venue" v ON v.id = s.venue_id
+        JOIN "Artist" a ON a.id = s.artist_id
+    ''')
+
+
+def downgrade():
+    op.drop_index('ix_ShowListing_artist_id', table_name='ShowListing')
+    op.drop_index('ix_ShowListing_start_time', table_name='ShowListing')
+    op.drop_table('ShowListing')
@@ -0,0 +1,37 @@
+"""show start_time timestamp
+
+Revision ID: 4b2b697eca8f
+Revises: c676d58c3522
+Create Date: 2026-10-18 09:12:41.204318
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b2b697eca8f'
+down_revision = 'c676d58c3522'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing values are 'YYYY-MM-DD HH:MM' strings in the server's local time
+    op.alter_column('Show', 'start_time',
+               existing_type=sa.VARCHAR(),
+               type_=sa.DateTime(timezone=True),
+               existing_nullable=False,
+               postgresql_using='start_time::timestamp with time zone')
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.alter_column('Show', 'start_time',
+               existing_type=sa.DateTime(timezone=True),
+               type_=sa.VARCHAR(),
+               existing_nullable=False,
+               postgresql_using="to_char(start_time, 'YYYY-MM-DD HH24:MI')")
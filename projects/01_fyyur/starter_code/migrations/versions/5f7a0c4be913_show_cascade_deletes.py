@@ -0,0 +1,30 @@
+"""show cascade deletes
+
+Revision ID: 5f7a0c4be913
+Revises: 9d3e51f0c2a7
+Create Date: 2026-10-18 11:26:05.918344
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f7a0c4be913'
+down_revision = '9d3e51f0c2a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('Show_artist_id_fkey', 'Show', type_='foreignkey')
+    op.drop_constraint('Show_venue_id_fkey', 'Show', type_='foreignkey')
+    op.create_foreign_key('Show_artist_id_fkey', 'Show', 'Artist', ['artist_id'], ['id'])
+    op.create_foreign_key('Show_venue_id_fkey', 'Show', 'Venue', ['venue_id'], ['id'])
@@ -0,0 +1,28 @@
+"""keyset indexes
+
+Revision ID: 6f2d8b14a9c3
+Revises: 8a5c3e71f9b4
+Create Date: 2026-10-18 18:12:26.118304
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6f2d8b14a9c3'
+down_revision = '8a5c3e71f9b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # B-tree indexes in the order of the venue and artist directory keysets,
+    # so each page is a range scan instead of a sort of the whole table
+    op.create_index('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id'], unique=False)
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.drop_index('ix_Venue_state_city_name_id', table_name='Venue')
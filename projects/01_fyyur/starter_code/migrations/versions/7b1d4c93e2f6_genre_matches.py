@@ -0,0 +1,36 @@
+"""genre matches
+
+Revision ID: 7b1d4c93e2f6
+Revises: e52b8d0c7a94
+Create Date: 2026-10-18 14:10:27.603551
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b1d4c93e2f6'
+down_revision = 'e52b8d0c7a94'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Filled in by `flask refresh-recommendations`
+    op.create_table('Match',
+    sa.Column('venue_id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Integer(), nullable=False),
+    sa.Column('venue_rank', sa.Integer(), nullable=True),
+    sa.Column('artist_rank', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['artist_id'], ['Artist.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['venue_id'], ['Venue.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('venue_id', 'artist_id')
+    )
+    op.create_index('ix_Match_artist_id_artist_rank', 'Match', ['artist_id', 'artist_rank'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Match_artist_id_artist_rank', table_name='Match')
+    op.drop_table('Match')
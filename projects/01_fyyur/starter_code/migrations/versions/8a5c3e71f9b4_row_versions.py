@@ -0,0 +1,26 @@
+"""row versions
+
+Revision ID: 8a5c3e71f9b4
+Revises: 2e6b9f04c1d8
+Create Date: 2026-10-18 17:05:12.640381
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a5c3e71f9b4'
+down_revision = '2e6b9f04c1d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version')
+    op.drop_column('Venue', 'version')
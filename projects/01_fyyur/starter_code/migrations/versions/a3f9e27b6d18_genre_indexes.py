@@ -0,0 +1,27 @@
+"""genre indexes
+
+Revision ID: a3f9e27b6d18
+Revises: c81d2e6a4f05
+Create Date: 2026-10-18 13:05:11.482093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9e27b6d18'
+down_revision = 'c81d2e6a4f05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # GIN indexes serve the genre containment (@>) and overlap (&&) filters
+    op.create_index('ix_Venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_Artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    op.drop_index('ix_Artist_genres', table_name='Artist')
+    op.drop_index('ix_Venue_genres', table_name='Venue')
@@ -0,0 +1,31 @@
+"""match changes
+
+Revision ID: c5e0a7d3b961
+Revises: 6f2d8b14a9c3
+Create Date: 2026-10-18 18:40:53.271906
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e0a7d3b961'
+down_revision = '6f2d8b14a9c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Venues and artists to rematch; the first refresh recomputes everything
+    match_change = op.create_table('MatchChange',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=10), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(match_change, [{'kind': 'all'}])
+
+
+def downgrade():
+    op.drop_table('MatchChange')
@@ -0,0 +1,46 @@
+"""show booking constraints
+
+Revision ID: c81d2e6a4f05
+Revises: 5f7a0c4be913
+Create Date: 2026-10-18 12:41:52.307716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81d2e6a4f05'
+down_revision = '5f7a0c4be913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing shows get the default two hour duration
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(timezone=True), nullable=True))
+    op.execute('UPDATE "Show" SET end_time = start_time + interval \'2 hours\'')
+    op.alter_column('Show', 'end_time', existing_type=sa.DateTime(timezone=True), nullable=False)
+
+    # The unique constraints' indexes replace the plain (id, start_time) ones
+    op.drop_index('ix_Show_venue_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_artist_id_start_time', table_name='Show')
+    op.create_unique_constraint('Show_venue_id_start_time_key', 'Show', ['venue_id', 'start_time'])
+    op.create_unique_constraint('Show_artist_id_start_time_key', 'Show', ['artist_id', 'start_time'])
+
+    # Fails if existing shows already overlap; resolve those bookings first
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "Show_venue_id_excl" '
+               'EXCLUDE USING gist (venue_id WITH =, tstzrange(start_time, end_time) WITH &&)')
+    op.execute('ALTER TABLE "Show" ADD CONSTRAINT "Show_artist_id_excl" '
+               'EXCLUDE USING gist (artist_id WITH =, tstzrange(start_time, end_time) WITH &&)')
+
+
+def downgrade():
+    op.drop_constraint('Show_artist_id_excl', 'Show')
+    op.drop_constraint('Show_venue_id_excl', 'Show')
+    op.drop_constraint('Show_artist_id_start_time_key', 'Show', type_='unique')
+    op.drop_constraint('Show_venue_id_start_time_key', 'Show', type_='unique')
+    op.create_index('ix_Show_venue_id_start_time', 'Show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_artist_id_start_time', 'Show', ['artist_id', 'start_time'], unique=False)
+    op.drop_column('Show', 'end_time')
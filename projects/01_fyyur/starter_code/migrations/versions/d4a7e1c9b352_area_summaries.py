@@ -0,0 +1,51 @@
+"""area summaries
+
+Revision ID: d4a7e1c9b352
+Revises: 7b1d4c93e2f6
+Create Date: 2026-10-18 15:02:41.218306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4a7e1c9b352'
+down_revision = '7b1d4c93e2f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('Area',
+    sa.Column('city', sa.String(length=120), nullable=False),
+    sa.Column('state', sa.String(length=120), nullable=False),
+    sa.Column('venue_count', sa.Integer(), nullable=False),
+    sa.Column('artist_count', sa.Integer(), nullable=False),
+    sa.Column('upcoming_shows', sa.Integer(), nullable=False),
+    sa.Column('next_show_time', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('city', 'state')
+    )
+    # The controllers keep the counts up to date from here on
+    op.execute('''
+        INSERT INTO "Area" (city, state, venue_count, artist_count, upcoming_shows, next_show_time)
+        SELECT city, state, sum(venues), sum(artists), sum(shows), min(next_show_time)
+        FROM (
+            SELECT city, state, count(*) AS venues, 0 AS artists, 0 AS shows,
+                   NULL::timestamptz AS next_show_time
+            FROM "Venue" GROUP BY city, state
+            UNION ALL
+            SELECT city, state, 0, count(*), 0, NULL
+            FROM "Artist" GROUP BY city, state
+            UNION ALL
+            SELECT v.city, v.state, 0, 0, count(*), min(s.start_time)
+            FROM "Show" s JOIN "Venue" v ON v.id = s.venue_id
+            WHERE s.start_time >= now()
+            GROUP BY v.city, v.state
+        ) AS counts
+        GROUP BY city, state
+    ''')
+
+
+def downgrade():
+    op.drop_table('Area')
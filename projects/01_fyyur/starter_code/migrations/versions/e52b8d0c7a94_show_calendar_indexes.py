@@ -0,0 +1,27 @@
+"""show calendar indexes
+
+Revision ID: e52b8d0c7a94
+Revises: a3f9e27b6d18
+Create Date: 2026-10-18 13:32:40.915266
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e52b8d0c7a94'
+down_revision = 'a3f9e27b6d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Date range scans over shows, then the venue's city for the calendar
+    op.create_index('ix_Show_start_time', 'Show', ['start_time', 'venue_id', 'artist_id'], unique=False)
+    op.create_index('ix_Venue_city_state', 'Venue', ['city', 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_city_state', table_name='Venue')
+    op.drop_index('ix_Show_start_time', table_name='Show')
@@ -0,0 +1,31 @@
+"""table versions
+
+Revision ID: f1c83a5d7e20
+Revises: d4a7e1c9b352
+Create Date: 2026-10-18 15:48:09.772410
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c83a5d7e20'
+down_revision = 'd4a7e1c9b352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    version = op.create_table('Version',
+    sa.Column('name', sa.String(length=40), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.bulk_insert(version, [{'name': name, 'version': 1} for name in ['Area', 'Artist', 'Match', 'Show', 'Venue']])
+    op.execute('''UPDATE "Version" SET expires_at = (SELECT min(start_time) FROM "Show" WHERE start_time > now()) WHERE name = 'Show' ''')
+
+
+def downgrade():
+    op.drop_table('Version')
@@ -0,0 +1,88 @@
+import json
+import base64
+import datetime
+from sqlalchemy import tuple_
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Keyset(object):
+    """Keyset (seek) pagination over a unique, ascending sort key.
+
+    Rather than skipping rows with OFFSET, each page starts from the key of
+    the last row shown, so it is read straight off an index and costs the
+    same on page one as on page ten thousand. Cursors are opaque URL-safe
+    tokens holding a direction and the key of the row to start from.
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+        self.names = [column.key for column in columns]
+
+    def encode(self, direction, values):
+        values = [value.isoformat() if isinstance(value, datetime.datetime) else value
+                  for value in values]
+        token = json.dumps([direction] + values, separators=(',', ':'))
+        return base64.urlsafe_b64encode(token.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode(self, token):
+        # Return (direction, values) for a cursor, or raise InvalidCursor
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            direction, *values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        except (ValueError, TypeError):
+            raise InvalidCursor(token)
+        if direction not in ('next', 'prev') or len(values) != len(self.columns):
+            raise InvalidCursor(token)
+        return direction, [self._value(column, value) for column, value in zip(self.columns, values)]
+
+    def criteria(self, cursor):
+        # WHERE clause selecting rows after (or before) the cursor's key, as a
+        # row value comparison the database can use as an index range bound
+        if cursor is None:
+            return []
+        direction, values = cursor
+        key = tuple_(*self.columns)
+        return [key > tuple(values) if direction == 'next' else key < tuple(values)]
+
+    def order_by(self, cursor):
+        # Pages before the cursor are read backwards, then flipped
+        if cursor is not None and cursor[0] == 'prev':
+            return [column.desc() for column in self.columns]
+        return list(self.columns)
+
+    def page(self, rows, cursor, size):
+        # Turn `size` + 1 fetched rows into (rows, prev cursor, next cursor)
+        more = len(rows) > size
+        rows = rows[:size]
+        backwards = cursor is not None and cursor[0] == 'prev'
+        if backwards:
+            rows.reverse()
+        if not rows:
+            return rows, None, None
+        # Reading forwards, `more` means there is a next page and a cursor
+        # means there is a previous one; reading backwards it is the reverse
+        has_prev = more if backwards else cursor is not None
+        has_next = cursor is not None if backwards else more
+        prev_cursor = self.encode('prev', self.key(rows[0])) if has_prev else None
+        next_cursor = self.encode('next', self.key(rows[-1])) if has_next else None
+        return rows, prev_cursor, next_cursor
+
+    def key(self, row):
+        if isinstance(row, dict):
+            return [row[name] for name in self.names]
+        return [getattr(row, name) for name in self.names]
+
+    @staticmethod
+    def _value(column, value):
+        python_type = column.type.python_type
+        try:
+            if python_type is datetime.datetime:
+                return datetime.datetime.fromisoformat(value)
+            if not isinstance(value, python_type) or isinstance(value, bool):
+                raise TypeError(value)
+        except (ValueError, TypeError):
+            raise InvalidCursor(value)
+        return value
@@ -0,0 +1,102 @@
+import numpy as np
+
+# Set bits in every byte value, for counting bits a byte at a time
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    # Number of set bits in each element of a uint32 array
+    counts = POPCOUNT[values.view(np.uint8)].reshape(values.shape + (4,))
+    return counts.sum(axis=-1, dtype=np.int64)
+
+
+class Recommender(object):
+    """Genre matches between venues seeking talent and artists seeking venues.
+
+    Genres are encoded as bitsets with one bit per genre choice, so the
+    number of genres two entities share is the popcount of their AND.
+    Entities in the same city and state get `city_bonus` on top, but only
+    pairs sharing at least one genre match at all. Scores for a batch of
+    rows against every column are computed as one NumPy array, and only the
+    top `k` columns per row are kept, ties going to the lowest ID. Unless
+    `batch_size` is given, batches are sized to about `batch_cells` scores,
+    so memory does not grow with the number of columns.
+    """
+
+    def __init__(self, genres, k=5, city_bonus=1, batch_size=None, batch_cells=2 ** 22):
+        if len(genres) > 32:
+            raise ValueError('At most 32 genres fit in a bitset')
+        self.bits = {genre: 1 << i for i, genre in enumerate(genres)}
+        self.k = k
+        self.city_bonus = city_bonus
+        self.batch_size = batch_size
+        self.batch_cells = batch_cells
+
+    def encode(self, genres):
+        # Bitset of the known genres in a list; unknown genres are ignored
+        bits = 0
+        for genre in genres or ():
+            bits |= self.bits.get(genre, 0)
+        return bits
+
+    def top_matches(self, rows, columns):
+        # Return {row id: [(column id, score), ...]} best first, for rows and
+        # columns given as (id, genres, city, state) tuples
+        if not rows or not columns:
+            return {}
+        places = {}
+        row_ids, row_bits, row_places = self._arrays(rows, places)
+        column_ids, column_bits, column_places = self._arrays(columns, places)
+
+        # Sort columns by ID so that a higher rank key means a higher score,
+        # then a lower ID
+        order = np.argsort(column_ids, kind='stable')
+        column_ids, column_bits, column_places = column_ids[order], column_bits[order], column_places[order]
+        tiebreak = np.arange(len(column_ids) - 1, -1, -1, dtype=np.int64)
+        k = min(self.k, len(column_ids))
+        batch_size = self.batch_size or max(1, self.batch_cells // len(column_ids))
+
+        matches = {}
+        for offset in range(0, len(row_ids), batch_size):
+            batch = slice(offset, offset + batch_size)
+            shared = popcount(row_bits[batch, None] & column_bits[None, :])
+            scores = shared + self.city_bonus * (row_places[batch, None] == column_places[None, :])
+            scores[shared == 0] = 0
+            rank = scores * len(column_ids) + tiebreak
+            best = np.argpartition(-rank, k - 1, axis=1)[:, :k]
+            for row, columns_of_row in enumerate(best):
+                columns_of_row = columns_of_row[np.argsort(-rank[row, columns_of_row])]
+                matches[int(row_ids[offset + row])] = [
+                    (int(column_ids[column]), int(scores[row, column]))
+                    for column in columns_of_row if scores[row, column] > 0
+                ]
+        return matches
+
+    def updated_matches(self, rows, columns, current, changed_rows, changed_columns):
+        # Return top matches, as top_matches() does, for the rows whose
+        # matches may differ from `current` now that the rows and columns
+        # with the given IDs have changed. Changed rows, and rows matched to a
+        # changed column, are rescored against every column. Any other row
+        # can only gain changed columns, so it is scored against those alone
+        # and the result merged into its current matches.
+        rescore = [row for row in rows if row[0] in changed_rows
+                   or any(column_id in changed_columns for column_id, score in current.get(row[0], ()))]
+        matches = {row[0]: [] for row in rescore}
+        matches.update(self.top_matches(rescore, columns))
+
+        others = [row for row in rows if row[0] not in matches]
+        changed = [column for column in columns if column[0] in changed_columns]
+        for row_id, gained in self.top_matches(others, changed).items():
+            if gained:
+                merged = sorted(current.get(row_id, []) + gained, key=lambda match: (-match[1], match[0]))
+                matches[row_id] = merged[:self.k]
+        return matches
+
+    def _arrays(self, entities, places):
+        ids = np.array([id for id, genres, city, state in entities], dtype=np.int64)
+        bits = np.array([self.encode(genres) for id, genres, city, state in entities], dtype=np.uint32)
+        codes = np.array([
+            places.setdefault(((city or '').strip().lower(), state), len(places))
+            for id, genres, city, state in entities
+        ], dtype=np.int64)
+        return ids, bits, codes
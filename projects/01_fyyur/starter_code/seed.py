@@ -0,0 +1,193 @@
+import math
+import random
+import datetime
+from bisect import bisect
+from itertools import accumulate
+
+# (city, state, weight): bigger music cities get more venues and artists
+CITIES = [
+    ('New York', 'NY', 20), ('Los Angeles', 'CA', 16), ('Nashville', 'TN', 10),
+    ('Chicago', 'IL', 9), ('Austin', 'TX', 8), ('San Francisco', 'CA', 7),
+    ('Atlanta', 'GA', 6), ('New Orleans', 'LA', 6), ('Seattle', 'WA', 5),
+    ('Houston', 'TX', 5), ('Philadelphia', 'PA', 5), ('Boston', 'MA', 4),
+    ('Miami', 'FL', 4), ('Denver', 'CO', 4), ('Detroit', 'MI', 3),
+    ('Portland', 'OR', 3), ('Minneapolis', 'MN', 3), ('Memphis', 'TN', 3),
+    ('Phoenix', 'AZ', 2), ('Kansas City', 'MO', 2), ('Portland', 'ME', 1),
+]
+
+# Genre popularity, using the genre choices of forms.py
+GENRES = [
+    ('Rock n Roll', 14), ('Pop', 12), ('Hip-Hop', 11), ('Alternative', 9),
+    ('Electronic', 8), ('Jazz', 7), ('Country', 7), ('R&B', 6), ('Folk', 5),
+    ('Blues', 5), ('Punk', 4), ('Soul', 4), ('Heavy Metal', 4), ('Funk', 3),
+    ('Reggae', 3), ('Classical', 3), ('Instrumental', 2), ('Musical Theatre', 2),
+    ('Other', 1),
+]
+
+VENUE_WORDS = (
+    ['The Blue', 'The Velvet', 'Golden', 'Red Rocks', 'Electric', 'The Old', 'Midnight', 'Paper Moon',
+     'Silver', 'The Rusty', 'Neon', 'Crescent', 'Copper', 'Union', 'Harbor', 'Riverside'],
+    ['Room', 'Lounge', 'Hall', 'Ballroom', 'Theatre', 'Tavern', 'Club', 'Garden', 'Station', 'Hop',
+     'Social', 'Cellar', 'Pavilion', 'Amphitheater', 'Music Hall', 'Saloon'],
+)
+ARTIST_WORDS = (
+    ['The Wild', 'Guns N', 'Black', 'Velvet', 'Electric', 'Lonesome', 'Brass', 'Neon', 'Stone',
+     'Midnight', 'Howling', 'Silver', 'Crooked', 'Honey', 'Static', 'Northern'],
+    ['Petals', 'Sax Band', 'Wolves', 'Quartet', 'Ramblers', 'Collective', 'Brothers', 'Echoes',
+     'Machines', 'Drifters', 'Sisters', 'Orchestra', 'Hearts', 'Trio', 'Kings', 'Satellites'],
+)
+STREETS = ['Main Street', 'Folsom Street', 'Broadway', 'Market Street', 'Elm Street', '2nd Avenue', 'Sunset Boulevard']
+
+# Two show slots an evening; a show lasts at most three hours, so a 19:00
+# show is over by the 22:00 one
+SLOT_TIMES = [datetime.time(19, 0), datetime.time(22, 0)]
+DURATIONS = [60, 90, 120, 120, 150, 180]
+
+
+class WeightedChoice(object):
+    """Draws items with the given weights in O(log n) per draw"""
+
+    def __init__(self, items, weights):
+        self.items = items
+        self.totals = list(accumulate(weights))
+
+    def __call__(self, rng):
+        return self.items[bisect(self.totals, rng.random() * self.totals[-1])]
+
+
+def zipf_weights(count, exponent=0.8):
+    # A few venues and artists are much busier than the rest
+    return [1.0 / rank ** exponent for rank in range(1, count + 1)]
+
+
+class SeedData(object):
+    """Deterministic synthetic venues, artists and shows at any scale.
+
+    Cities and genres follow the weights above; shows favour a few busy
+    venues and artists. Shows fall into evening slots spread over `days`
+    days centred on `today`. No venue or artist is ever booked twice in a
+    slot. Each venue walks its own permutation of the slots, and an artist
+    already playing in a slot is swapped for another.
+    """
+
+    def __init__(self, seed=0, days=730, today=None):
+        self.rng = random.Random(seed)
+        self.days = days
+        today = today or datetime.date.today()
+        self.first_day = today - datetime.timedelta(days=days // 2)
+        self.city = WeightedChoice(CITIES, [weight for city, state, weight in CITIES])
+        self.genre = WeightedChoice([genre for genre, weight in GENRES], [weight for genre, weight in GENRES])
+
+    @property
+    def slots(self):
+        return self.days * len(SLOT_TIMES)
+
+    def check(self, venues, artists, shows):
+        # Raise ValueError unless `shows` fit comfortably in the slots, leaving
+        # half of them free so that busy venues do not stall generation
+        if shows > self.slots * min(venues, artists) // 2:
+            raise ValueError('Too many shows for %d venues and %d artists over %d days' % (
+                venues, artists, self.days))
+
+    def venues(self, count):
+        for name in self._names(count, VENUE_WORDS):
+            city, state, weight = self.city(self.rng)
+            yield {
+                'name': name,
+                'city': city,
+                'state': state,
+                'address': '%d %s' % (self.rng.randint(1, 9999), self.rng.choice(STREETS)),
+                'phone': self._phone(),
+                'genres': self._genres(),
+                'image_link': None,
+                'facebook_link': None,
+                'website': None,
+                'seeking_talent': self.rng.random() < 0.3,
+                'seeking_description': None
+            }
+
+    def artists(self, count):
+        for name in self._names(count, ARTIST_WORDS):
+            city, state, weight = self.city(self.rng)
+            yield {
+                'name': name,
+                'city': city,
+                'state': state,
+                'phone': self._phone(),
+                'genres': self._genres(),
+                'image_link': None,
+                'facebook_link': None,
+                'website': None,
+                'seeking_venue': self.rng.random() < 0.4,
+                'seeking_description': None
+            }
+
+    def shows(self, venue_ids, artist_ids, count):
+        # Yield `count` non-conflicting shows between the given venues and artists
+        self.check(len(venue_ids), len(artist_ids), count)
+        pick_venue = WeightedChoice(range(len(venue_ids)), zipf_weights(len(venue_ids)))
+        pick_artist = WeightedChoice(range(len(artist_ids)), zipf_weights(len(artist_ids)))
+        walks = {}
+        booked = set()
+        playing = {}
+
+        made = 0
+        while made < count:
+            venue = pick_venue(self.rng)
+            slot = self._next_slot(walks, venue)
+            if slot is None or playing.get(slot, 0) == len(artist_ids):
+                continue
+            artist = pick_artist(self.rng)
+            while (slot, artist) in booked:
+                artist = self.rng.randrange(len(artist_ids))
+            booked.add((slot, artist))
+            playing[slot] = playing.get(slot, 0) + 1
+
+            start = datetime.datetime.combine(
+                self.first_day + datetime.timedelta(days=slot // len(SLOT_TIMES)),
+                SLOT_TIMES[slot % len(SLOT_TIMES)]
+            ).astimezone()
+            yield {
+                'venue_id': venue_ids[venue],
+                'artist_id': artist_ids[artist],
+                'start_time': start,
+                'end_time': start + datetime.timedelta(minutes=self.rng.choice(DURATIONS))
+            }
+            made += 1
+
+    def _next_slot(self, walks, venue):
+        # Slots start, start + stride, start + 2 * stride, ... modulo the slot
+        # count visit every slot once when the stride is coprime to it
+        walk = walks.get(venue)
+        if walk is None:
+            stride = self.rng.randrange(1, self.slots)
+            while math.gcd(stride, self.slots) != 1:
+                stride = self.rng.randrange(1, self.slots)
+            walk = walks[venue] = [self.rng.randrange(self.slots), stride, 0]
+        start, stride, taken = walk
+        if taken == self.slots:
+            return None
+        walk[2] += 1
+        return (start + stride * taken) % self.slots
+
+    def _names(self, count, words):
+        # Unique names: word pairs first, then numbered ones
+        firsts, seconds = words
+        used = set()
+        for i in range(count):
+            name = '%s %s' % (self.rng.choice(firsts), self.rng.choice(seconds))
+            if name in used:
+                name = '%s %d' % (name, i + 1)
+            used.add(name)
+            yield name
+
+    def _genres(self):
+        genres = []
+        for _ in range(self.rng.choice([1, 1, 2, 2, 2, 3])):
+            genre = self.genre(self.rng)
+            if genre not in genres:
+                genres.append(genre)
+        return genres
+
+    def _phone(self):
+        return '%03d-%03d-%04d' % (self.rng.randint(200, 999), self.rng.randint(200, 999), self.rng.randint(0, 9999))
@@ -0,0 +1,58 @@
+import heapq
+from itertools import count
+
+
+class QueryStats(object):
+    """Statement count, total database time and slowest statements of a request.
+
+    Only the `keep` slowest statements are held, in a min-heap, so a request
+    issuing thousands of statements costs no more memory than one issuing
+    a handful. Durations are in seconds.
+    """
+
+    def __init__(self, keep=3):
+        self.keep = keep
+        self.statements = 0
+        self.total = 0.0
+        self._slowest = []
+        self._order = count()
+
+    def record(self, statement, duration):
+        self.statements += 1
+        self.total += duration
+        entry = (duration, next(self._order), statement)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    @property
+    def slowest(self):
+        # (duration, statement) pairs, slowest first
+        return [(duration, statement) for duration, order, statement in sorted(self._slowest, reverse=True)]
+
+    def server_timing(self):
+        # Server-Timing header value: the total, then each slow statement
+        metrics = ['db;dur=%.2f;desc="%d SQL statements"' % (self.total * 1000, self.statements)]
+        for i, (duration, statement) in enumerate(self.slowest, 1):
+            metrics.append('sql-%d;dur=%.2f;desc="%s"' % (i, duration * 1000, header_text(statement)))
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            'statements': self.statements,
+            'db_ms': round(self.total * 1000, 2),
+            'slowest': [{'ms': round(duration * 1000, 2), 'statement': one_line(statement)}
+                        for duration, statement in self.slowest],
+        }
+
+
+def one_line(statement, limit=200):
+    # Collapse whitespace and cut long statements short for logs and headers
+    text = ' '.join(statement.split())
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+def header_text(statement, limit=100):
+    # A statement made safe to quote in a header parameter
+    return one_line(statement, limit).replace('\\', '').replace('"', "'")
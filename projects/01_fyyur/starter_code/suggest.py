@@ -0,0 +1,142 @@
+import threading
+from bisect import bisect_left, insort
+
+
+class SuggestIndex(object):
+    """In-memory typeahead index over artist and venue names.
+
+    Names starting with the query come first, read in alphabetical order
+    from a sorted list. Queries of three or more characters are then
+    topped up with names containing the query elsewhere, found through a
+    trigram inverted index. Lookups stop as soon as the limit is reached,
+    so their cost does not grow with the number of matching names. Only the first `max_name_length` characters of each name
+    are indexed and at most `max_entries` names are held, which keeps
+    memory bounded. Once the cap is hit the index reports itself as
+    incomplete so callers can fall back to the database.
+
+    The index ignores updates until it has been built with rebuild().
+    """
+
+    def __init__(self, max_entries=100000, max_name_length=64):
+        self.max_entries = max_entries
+        self.max_name_length = max_name_length
+        self.ready = False
+        self.complete = True
+        self._lock = threading.Lock()
+        self._names = {}
+        self._lowered = {}
+        self._grams = {}
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._names)
+
+    @property
+    def usable(self):
+        # True once built and holding every name
+        return self.ready and self.complete
+
+    def rebuild(self, entries):
+        # Replace the whole index with (kind, id, name) entries
+        with self._lock:
+            self._names = {}
+            self._lowered = {}
+            self._grams = {}
+            self._sorted = []
+            self.complete = True
+            for kind, id, name in entries:
+                self._add((kind, id), name)
+            self._sorted.sort()
+            self.ready = True
+
+    def add(self, kind, id, name):
+        # Index a new name, or re-index one that was edited
+        with self._lock:
+            if not self.ready:
+                return
+            key = (kind, id)
+            self._remove(key)
+            self._add(key, name, keep_sorted=True)
+
+    def remove(self, kind, id):
+        with self._lock:
+            if self.ready:
+                self._remove((kind, id))
+
+    def suggest(self, query, limit=10):
+        # Return up to `limit` (kind, id, name) matches, prefix matches first
+        query = query.strip().lower()[:self.max_name_length]
+        if not query:
+            return []
+
+        with self._lock:
+            keys = self._prefix_matches(query, limit)
+            if len(keys) < limit and len(query) >= 3:
+                found = set(keys)
+                others = []
+                for key in self._substring_matches(query):
+                    if key not in found:
+                        others.append(key)
+                        if len(keys) + len(others) == limit:
+                            break
+                keys += sorted(others, key=self._lowered.get)
+            return [key + (self._names[key],) for key in keys]
+
+    def _add(self, key, name, keep_sorted=False):
+        if len(self._names) >= self.max_entries:
+            self.complete = False
+            return
+        lowered = name.lower()[:self.max_name_length]
+        self._names[key] = name
+        self._lowered[key] = lowered
+        for gram in self._trigrams(lowered):
+            self._grams.setdefault(gram, set()).add(key)
+        if keep_sorted:
+            insort(self._sorted, (lowered, key))
+        else:
+            self._sorted.append((lowered, key))
+
+    def _remove(self, key):
+        if self._names.pop(key, None) is None:
+            return
+        lowered = self._lowered.pop(key)
+        for gram in self._trigrams(lowered):
+            keys = self._grams.get(gram)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._grams[gram]
+        position = bisect_left(self._sorted, (lowered, key))
+        if position < len(self._sorted) and self._sorted[position] == (lowered, key):
+            del self._sorted[position]
+
+    def _prefix_matches(self, prefix, limit):
+        keys = []
+        position = bisect_left(self._sorted, (prefix,))
+        while position < len(self._sorted) and len(keys) < limit:
+            lowered, key = self._sorted[position]
+            if not lowered.startswith(prefix):
+                break
+            keys.append(key)
+            position += 1
+        return keys
+
+    def _substring_matches(self, query):
+        # Yield names containing every trigram of the query, walking the
+        # rarest trigram's postings and dropping names whose trigrams only
+        # match out of order
+        postings = []
+        for gram in self._trigrams(query):
+            keys = self._grams.get(gram)
+            if not keys:
+                return
+            postings.append(keys)
+        postings.sort(key=len)
+        rarest, others = postings[0], postings[1:]
+        for key in rarest:
+            if all(key in keys for keys in others) and query in self._lowered[key]:
+                yield key
+
+    @staticmethod
+    def _trigrams(text):
+        return {text[i:i + 3] for i in range(len(text) - 2)}
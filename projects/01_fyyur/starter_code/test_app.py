@@ -0,0 +1,1583 @@
+import os
+import gzip
+import json
+import unittest
+import datetime
+import tempfile
+import logging
+import babel.dates
+import threading
+from types import SimpleNamespace
+from io import BytesIO
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from PIL import Image
+from sqlalchemy import event
+
+# Run the tests against an in-memory SQLite database instead of Postgres
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+from app import app, db, Venue, Artist, Show, ShowListing, Match, MatchChange, Area, Version, current_show_time, booking_conflict, bump_versions, build_suggest_index, page_cache, format_datetime, DATETIME_LOCALE, LISTING_PAGE_SIZE, availability_index, thumbnail_cache
+from suggest import SuggestIndex
+from cache import PageCache
+from availability import AvailabilityIndex
+from recommend import Recommender
+from logqueue import JSONFormatter, queued_logging
+from forms import GENRE_CHOICES
+from thumbnails import ThumbnailCache, ImageUnavailable, CheckedHTTPConnection, resize
+from benchmarks import routes as benchmark_routes
+
+
+class QueryCounter(object):
+    """Counts the SQL statements sent to the database while active"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self)
+        return self
+
+    def __exit__(self, *args):
+        event.remove(db.engine, 'before_cursor_execute', self)
+
+
+def png(width, height, color=(200, 30, 30, 255)):
+    output = BytesIO()
+    Image.new('RGBA', (width, height), color).save(output, 'PNG')
+    return output.getvalue()
+
+
+class ImageServer(object):
+    """Local HTTP stand-in for image hosts, counting the requests it serves"""
+
+    def __init__(self, images):
+        self.images = images
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                data = server.images.get(self.path)
+                self.send_response(200 if data else 404)
+                self.send_header('Content-Type', 'image/png')
+                self.end_headers()
+                self.wfile.write(data or b'')
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+
+    def url(self, path):
+        return 'http://127.0.0.1:%d%s' % (self.httpd.server_port, path)
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the Fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        app.config['TESTING'] = True
+        # Fixtures are written straight to the database, bypassing the
+        # controllers that invalidate cached pages
+        app.config['PAGE_CACHE'] = False
+        # The CLI runner turns debug mode off, and with it Server-Timing
+        app.config['DEBUG'] = True
+        page_cache.clear()
+        page_cache.hits = page_cache.misses = page_cache.evictions = page_cache.invalidations = 0
+        availability_index.reset()
+        self.client = app.test_client
+        db.create_all()
+
+    def tearDown(self):
+        """Executed after reach test"""
+        db.session.remove()
+        db.drop_all()
+
+    def add_venue(self, name, city='San Francisco', state='CA', **kwargs):
+        venue = Venue(
+            name=name,
+            city=city,
+            state=state,
+            address='1015 Folsom Street',
+            genres=kwargs.pop('genres', ['Jazz']),
+            seeking_talent=kwargs.pop('seeking_talent', False),
+            **kwargs
+        )
+        db.session.add(venue)
+        db.session.commit()
+        return venue.id
+
+    def add_artist(self, name, city='San Francisco', state='CA', **kwargs):
+        artist = Artist(
+            name=name,
+            city=city,
+            state=state,
+            genres=kwargs.pop('genres', ['Jazz']),
+            seeking_venue=kwargs.pop('seeking_venue', False),
+            **kwargs
+        )
+        db.session.add(artist)
+        db.session.commit()
+        return artist.id
+
+    def add_show(self, venue_id, artist_id, start_time, minutes=120):
+        show = Show(
+            venue_id=venue_id,
+            artist_id=artist_id,
+            start_time=start_time,
+            end_time=start_time + datetime.timedelta(minutes=minutes)
+        )
+        db.session.add(show)
+        db.session.commit()
+
+    '''
+    TESTS for Venue
+    '''
+    # Test venues are grouped by city and state
+    def test_get_venues_grouped_by_area(self):
+        self.add_venue('The Musical Hop')
+        self.add_venue('Park Square Live Music & Coffee')
+        self.add_venue('The Dueling Pianos Bar', city='New York', state='NY')
+        self.add_venue('Portland Hop', city='Portland', state='ME')
+        self.add_venue('Portland Stage', city='Portland', state='OR')
+
+        res = self.client().get('/venues')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('San Francisco, CA', body)
+        self.assertIn('New York, NY', body)
+        self.assertIn('Portland, ME', body)
+        self.assertIn('Portland, OR', body)
+        self.assertIn('Park Square Live Music &amp; Coffee', body)
+
+    # Test the venue directory costs the same number of queries for any number of areas
+    def test_get_venues_query_count_is_constant(self):
+        self.add_venue('Only Venue')
+        with QueryCounter() as few_areas:
+            self.client().get('/venues')
+
+        for i in range(25):
+            self.add_venue('Venue %d' % i, city='City %d' % i)
+        with QueryCounter() as many_areas:
+            res = self.client().get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(few_areas.count, 1)
+        self.assertEqual(many_areas.count, few_areas.count)
+
+    # Test shows at a venue are split into past and upcoming by start time
+    def test_get_venue_past_and_upcoming_shows(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        now = current_show_time()
+        self.add_show(venue_id, artist_id, now - datetime.timedelta(days=31))
+        self.add_show(venue_id, artist_id, now - datetime.timedelta(hours=1))
+        self.add_show(venue_id, artist_id, now + datetime.timedelta(days=3))
+
+        res = self.client().get('/venues/%d' % venue_id)
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('2 Past Shows', body)
+        self.assertIn('1 Upcoming Show', body)
+
+    # Test a venue page costs the same number of queries however many shows it has
+    def test_get_venue_query_count_is_constant(self):
+        venue_id = self.add_venue('The Musical Hop')
+        now = current_show_time()
+        for i in range(10):
+            artist_id = self.add_artist('Artist %d' % i)
+            self.add_show(venue_id, artist_id, now + datetime.timedelta(days=i - 5))
+
+        res = self.client().get('/venues/%d' % venue_id)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-SQL-Statements'], '3')
+
+    # Test venue search is a case-insensitive partial match with prefix matches first
+    def test_search_venues(self):
+        self.add_venue('The Musical Hop')
+        self.add_venue('Park Square Live Music & Coffee')
+        self.add_venue('Musical Chairs')
+        self.add_venue('The Dueling Pianos Bar')
+
+        res = self.client().post('/venues/search', data={'search_term': 'MUSIC'})
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Number of search results for "MUSIC": 3', body)
+        self.assertNotIn('Dueling', body)
+        self.assertLess(body.index('Musical Chairs'), body.index('The Musical Hop'))
+
+    # Test search results include real upcoming show counts at a constant query cost
+    def test_search_venues_upcoming_show_count(self):
+        hop_id = self.add_venue('The Musical Hop')
+        self.add_venue('Musical Chairs')
+        now = current_show_time()
+        for i in range(3):
+            artist_id = self.add_artist('Artist %d' % i)
+            self.add_show(hop_id, artist_id, now + datetime.timedelta(days=i + 1))
+        self.add_show(hop_id, artist_id, now - datetime.timedelta(days=1))
+
+        res = self.client().post('/venues/search', data={'search_term': 'musical'})
+        body = res.get_data(as_text=True)
+
+        self.assertIn('3 upcoming shows', body)
+        self.assertIn('0 upcoming shows', body)
+        self.assertEqual(res.headers['X-SQL-Statements'], '2')
+
+    # Test search treats LIKE wildcards in the search term literally
+    def test_search_venues_escapes_wildcards(self):
+        self.add_venue('The Musical Hop')
+
+        res = self.client().post('/venues/search', data={'search_term': '%'})
+
+        self.assertIn(': 0</h3>', res.get_data(as_text=True))
+
+    # Test search results are paginated
+    def test_search_artists_paginated(self):
+        for i in range(15):
+            self.add_artist('Band %02d' % i)
+
+        first = self.client().post('/artists/search', data={'search_term': 'band'})
+        second = self.client().post('/artists/search', data={'search_term': 'band', 'page': 2})
+
+        self.assertIn('Band 09', first.get_data(as_text=True))
+        self.assertNotIn('Band 10', first.get_data(as_text=True))
+        self.assertIn('Band 14', second.get_data(as_text=True))
+        self.assertNotIn('Band 09', second.get_data(as_text=True))
+        self.assertEqual(second.headers['X-SQL-Statements'], '2')
+
+    # Test page numbers below 1 give the first page rather than a negative OFFSET
+    def test_search_page_clamped(self):
+        for i in range(15):
+            self.add_venue('Hop %02d' % i)
+
+        res = self.client().post('/venues/search', data={'search_term': 'hop', 'page': -3})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Hop 00', res.get_data(as_text=True))
+        self.assertNotIn('Previous', res.get_data(as_text=True))
+        self.assertIn('name="page" value="2"', res.get_data(as_text=True))
+
+    # Test search results can be narrowed down by genre
+    def test_search_venues_by_genre(self):
+        self.add_venue('The Jazz Hop', genres=['Jazz'])
+        self.add_venue('The Rock Hop', genres=['Rock n Roll'])
+
+        res = self.client().post('/venues/search?genre=Rock+n+Roll', data={'search_term': 'hop'})
+        body = res.get_data(as_text=True)
+
+        self.assertIn(': 1</h3>', body)
+        self.assertIn('The Rock Hop', body)
+        self.assertNotIn('The Jazz Hop', body)
+
+    # Test the venue directory filters by genre
+    def test_get_venues_by_genre(self):
+        self.add_venue('The Jazz Hop', genres=['Jazz', 'Blues'])
+        self.add_venue('The Dueling Pianos Bar', city='New York', state='NY', genres=['Classical'])
+
+        res = self.client().get('/venues?genre=Blues')
+        body = res.get_data(as_text=True)
+
+        self.assertIn('The Jazz Hop', body)
+        self.assertNotIn('The Dueling Pianos Bar', body)
+        self.assertNotIn('New York, NY', body)
+
+    # Test artists must have every requested genre unless match=any is given
+    def test_get_artists_by_genre(self):
+        self.add_artist('Guns N Petals', genres=['Rock n Roll', 'Punk'])
+        self.add_artist('Matt Quevedo', genres=['Jazz'])
+        self.add_artist('The Wild Sax Band', genres=['Jazz', 'Classical'])
+
+        both = self.client().get('/artists?genre=Jazz&genre=Classical').get_data(as_text=True)
+        either = self.client().get('/artists?genre=Punk&genre=Classical&match=any').get_data(as_text=True)
+
+        self.assertIn('The Wild Sax Band', both)
+        self.assertNotIn('Matt Quevedo', both)
+        self.assertNotIn('Guns N Petals', both)
+        self.assertIn('The Wild Sax Band', either)
+        self.assertIn('Guns N Petals', either)
+        self.assertNotIn('Matt Quevedo', either)
+
+    # Test the artist directory is paged with cursors that keep the genre filter
+    def test_get_artists_paginated(self):
+        for i in range(LISTING_PAGE_SIZE + 5):
+            self.add_artist('Band %03d' % i, genres=['Funk'])
+        self.add_artist('Band 999', genres=['Jazz'])
+
+        first = self.client().get('/artists?genre=Funk')
+        cursor = self.client().get('/api/artists?genre=Funk').get_json()['next_cursor']
+        second = self.client().get('/artists', query_string={'genre': 'Funk', 'cursor': cursor})
+
+        self.assertIn('Band 000', first.get_data(as_text=True))
+        self.assertNotIn('Band %03d' % LISTING_PAGE_SIZE, first.get_data(as_text=True))
+        self.assertIn('/artists?cursor=%s&amp;genre=Funk&amp;match=all' % cursor, first.get_data(as_text=True))
+        self.assertIn('Band %03d' % LISTING_PAGE_SIZE, second.get_data(as_text=True))
+        self.assertNotIn('Band 999', second.get_data(as_text=True))
+        self.assertEqual(second.headers['X-SQL-Statements'], '1')
+
+    # Test a tampered cursor is rejected
+    def test_400_bad_cursor(self):
+        for path in ('/artists', '/venues', '/shows', '/api/shows'):
+            res = self.client().get(path + '?cursor=not-a-cursor')
+            self.assertEqual(res.status_code, 400)
+
+    # Test deleting a venue removes its shows with a single DELETE statement
+    def test_delete_venue_cascades_to_shows(self):
+        venue_id = self.add_venue('The Musical Hop')
+        other_id = self.add_venue('Park Square Live Music & Coffee')
+        artist_id = self.add_artist('Guns N Petals')
+        now = current_show_time()
+        for i in range(5):
+            self.add_show(venue_id, artist_id, now + datetime.timedelta(days=i))
+        self.add_show(other_id, artist_id, now - datetime.timedelta(days=1))
+
+        deletes = []
+        def record_delete(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('DELETE'):
+                deletes.append(statement)
+        event.listen(db.engine, 'before_cursor_execute', record_delete)
+        try:
+            res = self.client().delete('/venues/%d/delete' % venue_id)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record_delete)
+
+        self.assertEqual(res.get_json()['success'], True)
+        self.assertEqual(len(deletes), 1)
+        self.assertIsNone(Venue.query.get(venue_id))
+        self.assertEqual(Show.query.count(), 1)
+
+    # Test deleting a venue that does not exist
+    def test_404_delete_venue(self):
+        res = self.client().delete('/venues/1000/delete')
+
+        self.assertEqual(res.status_code, 404)
+
+    '''
+    TESTS for Artist
+    '''
+    # Test deleting many artists at once
+    def test_bulk_delete_artists(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_ids = [self.add_artist('Artist %d' % i) for i in range(3)]
+        for artist_id in artist_ids:
+            self.add_show(venue_id, artist_id, current_show_time())
+
+        res = self.client().delete('/artists/delete', json={'ids': artist_ids[:2] + [1000]})
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(sorted(data['deleted']), artist_ids[:2])
+        self.assertEqual([artist.id for artist in Artist.query.all()], artist_ids[2:])
+        self.assertEqual(Show.query.count(), 1)
+
+    # Test bulk delete rejects malformed IDs
+    def test_400_bulk_delete_artists(self):
+        res = self.client().delete('/artists/delete', json={'ids': ['1']})
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.get_json()['success'], False)
+
+    '''
+    TESTS for Suggest
+    '''
+    # Test suggestions follow venues and artists as they are created, edited and deleted
+    def test_suggest_tracks_changes(self):
+        self.add_artist('Guns N Petals')
+        build_suggest_index()
+
+        self.client().post('/venues/create', data={
+            'name': 'The Musical Hop',
+            'city': 'San Francisco',
+            'state': 'CA',
+            'address': '1015 Folsom Street',
+            'genres': ['Jazz'],
+            'phone': '123-123-1234',
+            'facebook_link': '',
+            'image_link': '',
+            'website': '',
+            'seeking_talent': 'True',
+            'seeking_description': ''
+        })
+        venue_id = Venue.query.one().id
+        res = self.client().get('/api/suggest?q=musical')
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-SQL-Statements'], '0')
+        self.assertEqual(data['data'], [{'type': 'venue', 'id': venue_id, 'name': 'The Musical Hop'}])
+
+        self.client().post('/venues/%d/edit' % venue_id, data={
+            'name': 'The Jazz Hop',
+            'city': 'San Francisco',
+            'state': 'CA',
+            'address': '1015 Folsom Street',
+            'genres': ['Jazz'],
+            'phone': '',
+            'facebook_link': '',
+            'image_link': '',
+            'website': '',
+            'seeking_talent': 'False',
+            'seeking_description': ''
+        })
+        self.assertEqual(self.client().get('/api/suggest?q=musical').get_json()['data'], [])
+        self.assertEqual(len(self.client().get('/api/suggest?q=jazz').get_json()['data']), 1)
+
+        self.client().delete('/venues/%d/delete' % venue_id)
+        self.assertEqual(self.client().get('/api/suggest?q=jazz').get_json()['data'], [])
+        self.assertEqual(self.client().get('/api/suggest?q=gu').get_json()['data'][0]['name'], 'Guns N Petals')
+
+    '''
+    TESTS for Page cache
+    '''
+    # Test listing pages are served from the cache until a write invalidates them
+    def test_page_cache_invalidated_by_writes(self):
+        app.config['PAGE_CACHE'] = True
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+
+        first = self.client().get('/shows')
+        second = self.client().get('/shows')
+        self.assertEqual(first.headers['X-SQL-Statements'], '1')
+        self.assertEqual(second.headers['X-SQL-Statements'], '0')
+
+        self.client().post('/shows/create', data={
+            'artist_id': str(artist_id),
+            'venue_id': str(venue_id),
+            'start_time': '2035-04-01 20:00'
+        })
+        res = self.client().get('/shows')
+
+        self.assertEqual(res.headers['X-SQL-Statements'], '1')
+        self.assertIn('Guns N Petals', res.get_data(as_text=True))
+
+    # Test cache counters are exposed for scraping
+    def test_metrics(self):
+        app.config['PAGE_CACHE'] = True
+        self.client().get('/artists')
+        self.client().get('/artists')
+
+        res = self.client().get('/metrics')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('fyyur_page_cache_hits_total 1', body)
+        self.assertIn('fyyur_page_cache_misses_total 1', body)
+        self.assertIn('fyyur_page_cache_entries 1', body)
+
+    '''
+    TESTS for Show
+    '''
+    # Test the show listing joins venue and artist names in a single query
+    def test_get_shows(self):
+        now = current_show_time()
+        for i in range(5):
+            venue_id = self.add_venue('Venue %d' % i)
+            artist_id = self.add_artist('Artist %d' % i)
+            self.add_show(venue_id, artist_id, now + datetime.timedelta(days=i))
+
+        res = self.client().get('/shows')
+        body = res.get_data(as_text=True)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers['X-SQL-Statements'], '1')
+        self.assertIn('Venue 4', body)
+        self.assertIn('Artist 4', body)
+
+    # Test walking the show listing forwards and back with cursors
+    def test_api_shows_keyset_pages(self):
+        start = current_show_time().replace(microsecond=0) + datetime.timedelta(hours=1)
+        artist_ids = [self.add_artist('Artist %d' % i) for i in range(3)]
+        venue_ids = [self.add_venue('Venue %d' % i) for i in range(3)]
+        for day in range(LISTING_PAGE_SIZE):
+            self.add_show(venue_ids[0], artist_ids[0], start + datetime.timedelta(days=day))
+        # Shows sharing the first start time are ordered by the rest of the key
+        for venue_id, artist_id in zip(venue_ids[1:], artist_ids[1:]):
+            self.add_show(venue_id, artist_id, start)
+
+        seen = []
+        cursor = None
+        while True:
+            res = self.client().get('/api/shows', query_string={'cursor': cursor} if cursor else {})
+            page = res.get_json()
+            # The version counters for the ETag, then the page
+            self.assertEqual(res.headers['X-SQL-Statements'], '2')
+            seen += [(show['start_time'], show['venue_id'], show['artist_id']) for show in page['data']]
+            if not page['next_cursor']:
+                break
+            cursor = page['next_cursor']
+        back = self.client().get('/api/shows', query_string={'cursor': page['prev_cursor']}).get_json()
+
+        self.assertEqual(len(seen), LISTING_PAGE_SIZE + 2)
+        self.assertEqual(len(set(seen)), len(seen))
+        self.assertEqual(seen, sorted(seen))
+        self.assertEqual(len(back['data']), LISTING_PAGE_SIZE)
+        self.assertEqual(back['data'][0]['venue_id'], seen[0][1])
+        self.assertIsNone(back['prev_cursor'])
+        self.assertIsNotNone(back['next_cursor'])
+
+    # Test the calendar lists a city's shows in the range, grouped by day
+    def test_api_show_calendar(self):
+        day = datetime.datetime(2030, 5, 6, 20, 0).astimezone()
+        sf_venue = self.add_venue('The Musical Hop')
+        ny_venue = self.add_venue('The Dueling Pianos Bar', city='New York', state='NY')
+        artist_id = self.add_artist('Guns N Petals')
+        other_artist_id = self.add_artist('Matt Quevedo')
+        self.add_show(sf_venue, artist_id, day)
+        self.add_show(sf_venue, other_artist_id, day + datetime.timedelta(days=1))
+        self.add_show(sf_venue, artist_id, day + datetime.timedelta(days=7))
+        self.add_show(ny_venue, other_artist_id, day)
+
+        res = self.client().get('/api/shows/calendar?from=2030-05-06&to=2030-05-12&city=San+Francisco')
+        days = res.get_json()['days']
+
+        self.assertEqual(res.headers['X-SQL-Statements'], '1')
+        self.assertEqual([d['date'] for d in days], ['2030-05-06', '2030-05-07'])
+        self.assertEqual(days[0]['shows'][0]['artist_name'], 'Guns N Petals')
+        self.assertEqual(len(days[0]['shows']), 1)
+        self.assertIn('Tuesday May 07, 2030', self.client().get(
+            '/shows/calendar?from=2030-05-06&to=2030-05-12&city=San+Francisco').get_data(as_text=True))
+
+    # Test malformed, reversed and oversized calendar ranges are rejected
+    def test_400_show_calendar_range(self):
+        for query in ('from=May', 'from=2030-05-06&to=2030-05-01', 'from=2030-01-01&to=2030-12-31'):
+            res = self.client().get('/shows/calendar?' + query)
+            self.assertEqual(res.status_code, 400)
+
+    # Test creating a show stores its start time as a timestamp
+    def test_create_show(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': str(artist_id),
+            'venue_id': str(venue_id),
+            'start_time': '2035-04-01 20:00'
+        })
+        show = Show.query.one()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(show.start_time.replace(tzinfo=None), datetime.datetime(2035, 4, 1, 20, 0))
+        self.assertEqual(show.end_time - show.start_time, datetime.timedelta(minutes=120))
+
+    # Test free/busy queries see shows created through the form
+    def test_availability_tracks_new_shows(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        other_id = self.add_artist('Matt Quevedo')
+        self.add_show(venue_id, other_id, datetime.datetime(2035, 4, 1, 12, 0).astimezone())
+        window = {'from': '2035-04-01T19:00', 'to': '2035-04-01T23:00'}
+
+        before = self.client().get('/api/availability/artists', query_string=window).get_json()
+        self.client().post('/shows/create', data={
+            'artist_id': str(artist_id),
+            'venue_id': str(venue_id),
+            'start_time': '2035-04-01 20:00'
+        })
+        after = self.client().get('/api/availability/artists', query_string=window).get_json()
+        busy = self.client().get('/api/artists/%d/availability' % artist_id, query_string=window).get_json()
+
+        self.assertEqual([a['name'] for a in before['data']], ['Guns N Petals', 'Matt Quevedo'])
+        self.assertEqual([a['name'] for a in after['data']], ['Matt Quevedo'])
+        self.assertEqual(len(busy['busy']), 1)
+        self.assertEqual(busy['busy'][0]['start'][:16], '2035-04-01T20:00')
+        self.assertEqual([gap['end'][11:16] for gap in busy['free']], ['20:00', '23:00'])
+
+    # Test shows created elsewhere are picked up, and deletes update the index in place
+    def test_availability_tracks_other_writers_and_deletes(self):
+        self.add_venue('The Musical Hop')
+        other_venue_id = self.add_venue('Park Square Live Music & Coffee')
+        artist_id = self.add_artist('Guns N Petals')
+        window = {'from': '2035-04-01T19:00', 'to': '2035-04-01T23:00'}
+        before = self.client().get('/api/availability/artists', query_string=window).get_json()
+
+        # Another worker books the artist
+        self.add_show(other_venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0).astimezone())
+        bump_versions('Booking')
+        db.session.commit()
+        booked = self.client().get('/api/availability/artists', query_string=window).get_json()
+
+        self.client().delete('/venues/%d/delete' % other_venue_id)
+        with QueryCounter() as queries:
+            freed = self.client().get('/api/availability/artists', query_string=window).get_json()
+
+        self.assertEqual([a['name'] for a in before['data']], ['Guns N Petals'])
+        self.assertEqual(booked['data'], [])
+        self.assertEqual([a['name'] for a in freed['data']], ['Guns N Petals'])
+        self.assertFalse(any('FROM "Show"' in statement for statement in queries.statements))
+
+    # Test the slot finder skips times either the artist or the venue is booked
+    def test_find_slots(self):
+        venue_id = self.add_venue('The Musical Hop')
+        other_venue_id = self.add_venue('Park Square Live Music & Coffee')
+        artist_id = self.add_artist('Guns N Petals')
+        other_id = self.add_artist('Matt Quevedo')
+        self.add_show(venue_id, other_id, datetime.datetime(2035, 4, 1, 18, 0).astimezone(), minutes=180)
+        self.add_show(other_venue_id, artist_id, datetime.datetime(2035, 4, 1, 22, 0).astimezone(), minutes=60)
+
+        res = self.client().get('/api/availability/slots', query_string={
+            'artist_id': artist_id, 'from': '2035-04-01T18:00', 'to': '2035-04-02T06:00', 'duration': 120
+        })
+        data = res.get_json()['data']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([slot['name'] for slot in data], ['Park Square Live Music & Coffee', 'The Musical Hop'])
+        self.assertEqual(data[0]['start'][11:16], '18:00')
+        # 21:00 at the Musical Hop would run into the artist's 22:00 show
+        self.assertEqual(data[1]['start'][11:16], '23:00')
+
+    # Test availability queries reject bad windows and unknown IDs
+    def test_availability_errors(self):
+        artist_id = self.add_artist('Guns N Petals')
+
+        self.assertEqual(self.client().get('/api/availability/venues?from=2035-04-01').status_code, 400)
+        self.assertEqual(self.client().get('/api/availability/venues?from=2035-04-02&to=2035-04-01').status_code, 400)
+        self.assertEqual(self.client().get('/api/artists/%d/availability?from=soon' % artist_id).status_code, 400)
+        self.assertEqual(self.client().get('/api/artists/%d/availability' % (artist_id + 1)).status_code, 404)
+        self.assertEqual(self.client().get('/api/availability/slots?artist_id=%d&duration=0' % artist_id).status_code, 400)
+
+    # Test an artist cannot be booked twice at the same time
+    def test_create_show_artist_conflict(self):
+        venue_id = self.add_venue('The Musical Hop')
+        other_id = self.add_venue('Park Square Live Music & Coffee')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0).astimezone())
+
+        with QueryCounter() as queries:
+            res = self.client().post('/shows/create', data={
+                'artist_id': str(artist_id),
+                'venue_id': str(other_id),
+                'start_time': '2035-04-01 20:00'
+            }, follow_redirects=True)
+
+        self.assertIn('Artist with ID %d is not available at time 2035-04-01 20:00' % artist_id, res.get_data(as_text=True))
+        self.assertEqual(Show.query.count(), 1)
+        # Two existence checks and the insert; no query for clashing shows
+        self.assertEqual(queries.count, 3)
+
+    # Test a venue cannot host two shows at the same time
+    def test_create_show_venue_conflict(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        other_id = self.add_artist('Matt Quevedo')
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0).astimezone())
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': str(other_id),
+            'venue_id': str(venue_id),
+            'start_time': '2035-04-01 20:00',
+            'duration': '90'
+        }, follow_redirects=True)
+
+        self.assertIn('Venue with ID %d is not available at time 2035-04-01 20:00' % venue_id, res.get_data(as_text=True))
+
+    # Test posting the same show twice is reported as a booking conflict
+    def test_create_show_twice(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        show = {'artist_id': str(artist_id), 'venue_id': str(venue_id), 'start_time': '2035-04-01 20:00'}
+
+        self.client().post('/shows/create', data=show)
+        res = self.client().post('/shows/create', data=show, follow_redirects=True)
+
+        self.assertIn('Artist with ID %d is not available at time 2035-04-01 20:00' % artist_id, res.get_data(as_text=True))
+        self.assertEqual(Show.query.count(), 1)
+        # Postgres names the primary key rather than the columns
+        postgres_error = SimpleNamespace(orig=SimpleNamespace(diag=SimpleNamespace(constraint_name='Show_pkey')))
+        self.assertEqual(booking_conflict(postgres_error), 'artist_id')
+
+    # Test shows are exported as CSV with venue and artist names
+    def test_export_shows_csv(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0))
+
+        res = self.client().get('/shows/export')
+        lines = res.get_data(as_text=True).splitlines()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, 'text/csv')
+        self.assertEqual(lines[0], 'venue_id,venue_name,artist_id,artist_name,start_time,end_time')
+        self.assertEqual(lines[1], '%d,The Musical Hop,%d,Guns N Petals,2035-04-01T20:00:00,2035-04-01T22:00:00' % (venue_id, artist_id))
+
+    # Test shows are exported as gzipped NDJSON
+    def test_export_shows_ndjson_gzip(self):
+        venue_id = self.add_venue('The Musical Hop')
+        for i in range(3):
+            artist_id = self.add_artist('Artist %d' % i)
+            self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1 + i, 20, 0))
+
+        res = self.client().get('/shows/export?format=ndjson&gzip=1')
+        rows = [json.loads(line) for line in gzip.decompress(res.data).decode().splitlines()]
+
+        self.assertEqual(res.mimetype, 'application/gzip')
+        self.assertEqual([row['artist_name'] for row in rows], ['Artist 0', 'Artist 1', 'Artist 2'])
+
+    # Test the export command writes the same stream as the endpoint
+    def test_export_shows_command(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0))
+
+        result = app.test_cli_runner().invoke(args=['export-shows', '--format', 'ndjson'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(json.loads(result.output)['venue_name'], 'The Musical Hop')
+
+    '''
+    TESTS for Import
+    '''
+    def import_file(self, kind, suffix, content, *options):
+        with tempfile.NamedTemporaryFile('w', suffix=suffix, delete=False) as file:
+            file.write(content)
+        try:
+            return app.test_cli_runner(mix_stderr=False).invoke(
+                args=['import-data', kind, file.name] + list(options)
+            )
+        finally:
+            os.remove(file.name)
+
+    # Test venues are imported from CSV in batches with the form's validation rules
+    def test_import_venues_csv(self):
+        self.add_venue('The Musical Hop')
+        content = (
+            'name,city,state,address,phone,genres,seeking_talent\n'
+            'The Dueling Pianos Bar,New York,NY,335 Delancey Street,914-003-1132,Classical;R&B,True\n'
+            'The Musical Hop,San Francisco,CA,1015 Folsom Street,,Jazz,False\n'
+            'Bad Phone Bar,Austin,TX,1 Main Street,5551234,Jazz,False\n'
+            'Park Square Live Music & Coffee,San Francisco,CA,34 Whiskey Moore Ave,,Rock n Roll,false\n'
+        )
+
+        result = self.import_file('venues', '.csv', content, '--batch-size', '2')
+        venue = Venue.query.filter_by(name='The Dueling Pianos Bar').one()
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Done: 2 rows imported, 2 rejected', result.stdout)
+        self.assertIn('line 4: invalid phone number 5551234', result.stderr)
+        self.assertEqual(Venue.query.count(), 3)
+        self.assertEqual(venue.genres, ['Classical', 'R&B'])
+        self.assertEqual(venue.seeking_talent, True)
+
+    # Test shows are imported from NDJSON, skipping rows the database rejects
+    def test_import_shows_ndjson(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        lines = [
+            {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2035-04-01 20:00'},
+            {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2035-04-01 20:00'},
+            {'venue_id': venue_id, 'artist_id': 1000, 'start_time': '2035-04-02 20:00'},
+            {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2035-04-03', 'duration': 60},
+            {'venue_id': venue_id, 'artist_id': artist_id, 'start_time': '2035-04-08 21:30', 'duration': 90},
+        ]
+        content = '\n'.join(json.dumps(line) for line in lines) + '\n'
+
+        result = self.import_file('shows', '.ndjson', content)
+        last = Show.query.order_by(Show.start_time.desc()).first()
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Done: 2 rows imported, 3 rejected', result.stdout)
+        self.assertEqual(last.end_time - last.start_time, datetime.timedelta(minutes=90))
+
+    # Test malformed NDJSON lines are rejected without stopping the import
+    def test_import_bad_json_lines(self):
+        content = '\n'.join([
+            json.dumps({'name': 'Guns N Petals', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']}),
+            '{"name": "Matt Quevedo",',
+            '["not", "an", "object"]',
+            json.dumps({'name': 'The Wild Sax Band', 'city': 'San Francisco', 'state': 'CA', 'genres': ['Jazz']}),
+        ]) + '\n'
+
+        result = self.import_file('artists', '.ndjson', content)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Done: 2 rows imported, 2 rejected', result.stdout)
+        self.assertIn('line 2: invalid JSON', result.stderr)
+        self.assertIn('line 3: expected a JSON object', result.stderr)
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (0, 2, 0)})
+
+    '''
+    TESTS for Seeding
+    '''
+    # Test the seed command makes the requested rows without double bookings
+    def test_seed_command(self):
+        result = app.test_cli_runner().invoke(args=[
+            'seed', '--venues', '20', '--artists', '50', '--shows', '2000', '--batch-size', '300'
+        ])
+        venue_slots = db.session.query(Show.venue_id, Show.start_time).distinct().count()
+        artist_slots = db.session.query(Show.artist_id, Show.start_time).distinct().count()
+        genres = {genre for venue in Venue.query for genre in venue.genres}
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('Done: 2070 rows imported', result.output)
+        self.assertEqual((Venue.query.count(), Artist.query.count(), Show.query.count()), (20, 50, 2000))
+        self.assertEqual((venue_slots, artist_slots), (2000, 2000))
+        self.assertTrue(genres <= {choice for choice, label in GENRE_CHOICES})
+
+    # Test asking for more shows than the slots allow inserts nothing
+    def test_seed_too_many_shows(self):
+        result = app.test_cli_runner().invoke(args=['seed', '--venues', '2', '--artists', '2', '--shows', '5000'])
+
+        self.assertEqual(result.exit_code, 2)
+        self.assertIn('Too many shows', result.output)
+        self.assertEqual(Venue.query.count(), 0)
+
+    # Test the route benchmark has a request for every endpoint it does not skip
+    def test_benchmark_covers_routes(self):
+        endpoints = {rule.endpoint for rule in app.url_map.iter_rules()} - {'static'}
+
+        self.assertEqual(endpoints - set(benchmark_routes.REQUESTS) - benchmark_routes.WRITES - benchmark_routes.EXTERNAL, set())
+
+    '''
+    TESTS for Instrumentation
+    '''
+    # Test debug responses report statement timings in Server-Timing
+    def test_server_timing(self):
+        self.add_venue('The Musical Hop')
+
+        res = self.client().get('/venues')
+
+        self.assertRegex(res.headers['Server-Timing'], r'^db;dur=[0-9.]+;desc="%s SQL statements", sql-1;dur=[0-9.]+;desc="SELECT ' % res.headers['X-SQL-Statements'])
+
+    # Test production requests are logged and too many statements are flagged
+    def test_sql_stats_logged(self):
+        app.config['DEBUG'] = False
+        app.config['SQL_STATEMENT_THRESHOLD'] = 1
+        try:
+            venue_id = self.add_venue('The Musical Hop')
+            # The first request also builds the suggest index; keep it out of the logs
+            self.client().get('/')
+            with self.assertLogs(app.logger, 'INFO') as logs:
+                listing = self.client().get('/venues')
+                page = self.client().get('/venues/%d' % venue_id)
+        finally:
+            app.config['SQL_STATEMENT_THRESHOLD'] = 25
+
+        self.assertNotIn('Server-Timing', listing.headers)
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertEqual(logs.records[0].sql['statements'], 1)
+        self.assertIn('path=/venues status=200 statements=1', logs.output[0])
+        self.assertEqual(logs.records[-1].levelname, 'WARNING')
+        self.assertTrue(logs.records[-1].sql['flagged'])
+        self.assertEqual(logs.records[-1].sql['statements'], int(page.headers['X-SQL-Statements']))
+
+    # Test statements slower than the threshold are logged on their own
+    def test_slow_query_logged(self):
+        app.config['SLOW_QUERY_MS'] = 0
+        # The first request also builds the suggest index; keep it out of the logs
+        self.client().get('/')
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                self.client().get('/venues')
+        finally:
+            app.config['SLOW_QUERY_MS'] = 100
+
+        self.assertIn('slow_query path=/venues', logs.output[0])
+        self.assertTrue(logs.records[0].sql['statement'].startswith('SELECT'))
+
+    '''
+    TESTS for Recommendations
+    '''
+    # Test the refresh command stores matches and only rewrites what changed
+    def test_refresh_recommendations(self):
+        venue_id = self.add_venue('The Musical Hop', genres=['Jazz', 'Funk'], seeking_talent=True)
+        self.add_venue('The Dueling Pianos Bar', genres=['Jazz'])
+        jazz_id = self.add_artist('The Wild Sax Band', genres=['Jazz'], seeking_venue=True)
+        funk_id = self.add_artist('Matt Quevedo', city='New York', state='NY', genres=['Jazz', 'Funk'], seeking_venue=True)
+        self.add_artist('Guns N Petals', genres=['Rock n Roll'], seeking_venue=True)
+        runner = app.test_cli_runner()
+
+        first = runner.invoke(args=['refresh-recommendations'])
+        second = runner.invoke(args=['refresh-recommendations'])
+        page = self.client().get('/venues/%d' % venue_id).get_data(as_text=True)
+        matches = Match.query.order_by(Match.venue_rank).all()
+
+        self.assertIn('2 matches added, 0 updated, 0 removed', first.output)
+        self.assertIn('0 matches added, 0 updated, 0 removed', second.output)
+        # Two shared genres outscore one shared genre plus the city bonus,
+        # and the tie goes to the lower ID
+        self.assertEqual([(m.artist_id, m.score) for m in matches], [(jazz_id, 2), (funk_id, 2)])
+        self.assertIn('Recommended Artists', page)
+        self.assertIn('The Wild Sax Band', page)
+        self.assertNotIn('Guns N Petals', page)
+
+    # Test refreshing after edits only recomputes what changed, and agrees with a full refresh
+    def test_refresh_recommendations_incremental(self):
+        venue_id = self.add_venue('The Musical Hop', genres=['Jazz', 'Funk'], seeking_talent=True)
+        other_id = self.add_venue('The Dueling Pianos Bar', city='New York', state='NY', genres=['Rock n Roll'], seeking_talent=True)
+        jazz_id = self.add_artist('The Wild Sax Band', genres=['Jazz'], seeking_venue=True)
+        rock_id = self.add_artist('Guns N Petals', genres=['Rock n Roll'], seeking_venue=True)
+        runner = app.test_cli_runner()
+        runner.invoke(args=['refresh-recommendations'])
+        self.assertEqual(MatchChange.query.count(), 0)
+
+        self.post_artist('/artists/%d/edit' % rock_id, 'Guns N Petals', 'San Francisco', 'CA', genres=['Funk'],
+                         seeking_venue='True', version=str(Artist.query.get(rock_id).version))
+        self.post_artist('/artists/create', 'Matt Quevedo', 'New York', 'NY', genres=['Rock n Roll'], seeking_venue='True')
+        self.client().delete('/artist/%d/delete' % jazz_id)
+        changed = {(change.kind, change.entity_id) for change in MatchChange.query}
+        incremental = runner.invoke(args=['refresh-recommendations'])
+        matches = {(m.venue_id, m.artist_id, m.score, m.venue_rank, m.artist_rank) for m in Match.query}
+        full = runner.invoke(args=['refresh-recommendations', '--full'])
+
+        new_id = Artist.query.filter_by(name='Matt Quevedo').one().id
+        self.assertEqual(changed, {('artist', rock_id), ('artist', new_id), ('artist', jazz_id)})
+        self.assertIn('2 matches added, 0 updated, 1 removed', incremental.output)
+        self.assertEqual(matches, {(venue_id, rock_id, 2, 1, 1), (other_id, new_id, 2, 1, 1)})
+        self.assertIn('0 matches added, 0 updated, 0 removed', full.output)
+
+    '''
+    TESTS for Areas
+    '''
+    def post_venue(self, url, name, city, state, **fields):
+        return self.client().post(url, data=dict({
+            'name': name, 'city': city, 'state': state, 'address': '1015 Folsom Street',
+            'genres': ['Jazz'], 'phone': '', 'facebook_link': '', 'image_link': '',
+            'website': '', 'seeking_talent': 'False', 'seeking_description': ''
+        }, **fields))
+
+    def post_artist(self, url, name, city, state, **fields):
+        return self.client().post(url, data=dict({
+            'name': name, 'city': city, 'state': state, 'genres': ['Jazz'], 'phone': '',
+            'facebook_link': '', 'image_link': '', 'website': '',
+            'seeking_venue': 'False', 'seeking_description': ''
+        }, **fields))
+
+    def area_counts(self):
+        return {(area['city'], area['state']): (area['venues'], area['artists'], area['upcoming_shows'])
+                for area in self.client().get('/api/areas').get_json()['data']}
+
+    # Test area counts follow venues, artists and shows through the controllers
+    def test_areas_track_changes(self):
+        self.post_venue('/venues/create', 'The Musical Hop', 'San Francisco', 'CA')
+        self.post_venue('/venues/create', 'Park Square Live Music & Coffee', 'San Francisco', 'CA')
+        self.post_artist('/artists/create', 'Guns N Petals', 'San Francisco', 'CA')
+        venue_id = Venue.query.filter_by(name='The Musical Hop').one().id
+        artist_id = Artist.query.one().id
+        self.client().post('/shows/create', data={
+            'artist_id': str(artist_id), 'venue_id': str(venue_id), 'start_time': '2035-04-01 20:00'
+        })
+        self.add_show(venue_id, artist_id, current_show_time() - datetime.timedelta(days=1))
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (2, 1, 1)})
+
+        self.post_venue('/venues/%d/edit' % venue_id, 'The Musical Hop', 'Oakland', 'CA')
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (1, 1, 0), ('Oakland', 'CA'): (1, 0, 1)})
+
+        self.post_artist('/artists/%d/edit' % artist_id, 'Guns N Petals', 'Oakland', 'CA')
+        self.client().delete('/venues/%d/delete' % venue_id)
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (1, 0, 0), ('Oakland', 'CA'): (0, 1, 0)})
+
+        self.client().delete('/artists/delete', json={'ids': [artist_id]})
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (1, 0, 0)})
+
+    # Test deleting an artist recounts the areas of the venues its shows were at
+    def test_delete_artist_recounts_show_areas(self):
+        self.post_venue('/venues/create', 'The Musical Hop', 'San Francisco', 'CA')
+        self.post_artist('/artists/create', 'Guns N Petals', 'New York', 'NY')
+        venue_id = Venue.query.one().id
+        artist_id = Artist.query.one().id
+        self.client().post('/shows/create', data={
+            'artist_id': str(artist_id), 'venue_id': str(venue_id), 'start_time': '2035-04-01 20:00'
+        })
+        self.assertEqual(self.area_counts()[('San Francisco', 'CA')], (1, 0, 1))
+
+        self.client().delete('/artist/%d/delete' % artist_id)
+
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (1, 0, 0)})
+
+    # Test an area's upcoming shows are recounted once its next show has started
+    def test_area_upcoming_shows_expire(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, current_show_time() - datetime.timedelta(hours=1))
+        db.session.add(Area(city='San Francisco', state='CA', venue_count=1, artist_count=1, upcoming_shows=1,
+                            next_show_time=current_show_time() - datetime.timedelta(hours=1)))
+        db.session.commit()
+
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (1, 1, 0)})
+        self.assertIsNone(Area.query.one().next_show_time)
+
+    # Test the venue directory shows area counts without extra queries
+    def test_venues_page_area_counts(self):
+        self.post_venue('/venues/create', 'The Musical Hop', 'San Francisco', 'CA')
+        self.post_artist('/artists/create', 'Guns N Petals', 'San Francisco', 'CA')
+        self.post_artist('/artists/create', 'Matt Quevedo', 'San Francisco', 'CA')
+
+        res = self.client().get('/venues')
+
+        self.assertIn('1 venue &middot; 2 artists &middot; 0 upcoming shows', res.get_data(as_text=True))
+        self.assertEqual(res.headers['X-SQL-Statements'], '1')
+
+    # Test the refresh command rebuilds areas from the base tables
+    def test_refresh_areas_command(self):
+        self.add_venue('The Musical Hop')
+        self.add_artist('Guns N Petals', city='Austin', state='TX')
+
+        result = app.test_cli_runner().invoke(args=['refresh-areas'])
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(self.area_counts(), {('San Francisco', 'CA'): (1, 0, 0), ('Austin', 'TX'): (0, 1, 0)})
+
+    '''
+    TESTS for Edits
+    '''
+    # Test an edit writes only the changed columns, and nothing when none changed
+    def test_edit_writes_changed_columns_only(self):
+        venue_id = self.add_venue('The Musical Hop')
+        updates = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if statement.startswith('UPDATE "Venue"'):
+                updates.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.post_venue('/venues/%d/edit' % venue_id, 'The Musical Hop', 'San Francisco', 'CA', version='1')
+            self.post_venue('/venues/%d/edit' % venue_id, 'The Musical Hop', 'San Francisco', 'CA',
+                            version='1', phone='123-123-1234')
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        venue = Venue.query.get(venue_id)
+
+        self.assertEqual(len(updates), 1)
+        self.assertIn('SET phone=?, version=? WHERE "Venue".id = ? AND "Venue".version = ?', updates[0])
+        self.assertEqual((venue.phone, venue.version), ('123-123-1234', 2))
+
+    # Test an edit made from an outdated form is refused rather than overwriting a newer one
+    def test_edit_conflict(self):
+        artist_id = self.add_artist('Guns N Petals')
+        form = self.client().get('/artists/%d/edit' % artist_id).get_data(as_text=True)
+        self.assertIn('name="version" value="1"', form)
+        self.post_artist('/artists/%d/edit' % artist_id, 'Guns N Roses', 'San Francisco', 'CA', version='1')
+
+        res = self.post_artist('/artists/%d/edit' % artist_id, 'Guns N Petals', 'Austin', 'TX', version='1')
+        artist = Artist.query.get(artist_id)
+
+        self.assertEqual(res.status_code, 302)
+        self.assertTrue(res.headers['Location'].endswith('/artists/%d/edit' % artist_id))
+        self.assertEqual((artist.name, artist.city, artist.version), ('Guns N Roses', 'San Francisco', 2))
+
+    '''
+    TESTS for Show listing
+    '''
+    # Test the listing read model follows shows, venue edits and deletes
+    def test_show_listing_follows_writes(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        other_id = self.add_artist('Matt Quevedo')
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0))
+        self.add_show(venue_id, other_id, datetime.datetime(2035, 4, 2, 20, 0))
+
+        self.post_venue('/venues/%d/edit' % venue_id, 'The Jazz Hop', 'San Francisco', 'CA')
+        self.client().delete('/artist/%d/delete' % other_id)
+        listing = ShowListing.query.one()
+
+        self.assertEqual((listing.venue_name, listing.artist_name), ('The Jazz Hop', 'Guns N Petals'))
+        self.assertEqual(listing.start_time.replace(tzinfo=None), datetime.datetime(2035, 4, 1, 20, 0))
+
+    # Test /shows is read from the listing alone, and the rebuild command repairs drift
+    def test_rebuild_show_listing(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0))
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 2, 20, 0))
+        ShowListing.query.filter_by(start_time=datetime.datetime(2035, 4, 1, 20, 0)).update({'artist_name': 'Drifted'})
+        ShowListing.query.filter_by(start_time=datetime.datetime(2035, 4, 2, 20, 0)).delete()
+        db.session.commit()
+
+        drifted = self.client().get('/shows').get_data(as_text=True)
+        result = app.test_cli_runner().invoke(args=['rebuild-show-listing'])
+        repaired = self.client().get('/shows').get_data(as_text=True)
+
+        self.assertIn('Drifted', drifted)
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('1 listed shows added, 1 updated, 0 removed', result.output)
+        self.assertNotIn('Drifted', repaired)
+        self.assertEqual(repaired.count('Guns N Petals'), 2)
+
+    '''
+    TESTS for JSON mode
+    '''
+    # Test pages come as JSON to clients asking for it, with an ETag
+    def test_json_venue_page(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime.datetime(2035, 4, 1, 20, 0).astimezone())
+
+        res = self.client().get('/venues/%d' % venue_id, headers={'Accept': 'application/json'})
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['name'], 'The Musical Hop')
+        self.assertEqual(data['upcoming_shows'][0]['artist_name'], 'Guns N Petals')
+        self.assertEqual(data['upcoming_shows'][0]['start_time'][:16], '2035-04-01T20:00')
+        self.assertTrue(res.headers['ETag'].startswith('"json-'))
+        self.assertIn('Accept', res.headers['Vary'])
+
+    # Test HTML stays the default, and the page cache never answers a JSON request with HTML
+    def test_html_by_default(self):
+        app.config['PAGE_CACHE'] = True
+        self.add_artist('Guns N Petals')
+
+        html = self.client().get('/artists', headers={'Accept': 'text/html,*/*;q=0.8'})
+        res = self.client().get('/artists', headers={'Accept': 'application/json'})
+
+        self.assertNotIn('ETag', html.headers)
+        self.assertIn('Guns N Petals', html.get_data(as_text=True))
+        self.assertEqual(res.get_json()['data'][0]['name'], 'Guns N Petals')
+
+    # Test If-None-Match gets a 304 from the version counters alone until a write
+    def test_conditional_get(self):
+        self.add_artist('Guns N Petals')
+        self.client().get('/')
+        first = self.client().get('/artists', headers={'Accept': 'application/json'})
+        etag = first.headers['ETag'].strip('"')
+
+        with QueryCounter() as queries:
+            repeat = self.client().get('/artists', headers={'Accept': 'application/json', 'If-None-Match': '"%s"' % etag})
+
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.get_data(), b'')
+        self.assertEqual(repeat.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(queries.count, 1)
+
+        self.post_artist('/artists/create', 'Matt Quevedo', 'San Francisco', 'CA')
+        changed = self.client().get('/artists', headers={'Accept': 'application/json', 'If-None-Match': '"%s"' % etag})
+
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(len(changed.get_json()['data']), 2)
+
+    # Test unknown venues and artists are 404s, even to a current ETag
+    def test_json_404(self):
+        venue_id = self.add_venue('The Musical Hop')
+        etag = self.client().get('/venues/%d' % venue_id, headers={'Accept': 'application/json'}).headers['ETag']
+
+        html = self.client().get('/venues/%d' % (venue_id + 1))
+        res = self.client().get('/venues/%d' % (venue_id + 1), headers={'Accept': 'application/json', 'If-None-Match': etag})
+        artist = self.client().get('/artists/1', headers={'Accept': 'application/json'})
+
+        self.assertEqual(html.status_code, 404)
+        self.assertEqual(res.status_code, 404)
+        self.assertFalse(res.get_json()['success'])
+        self.assertEqual(artist.status_code, 404)
+
+    # Test a conditional GET of a venue page only reads the version counters
+    def test_conditional_get_venue_page(self):
+        venue_id = self.add_venue('The Musical Hop')
+        self.client().get('/')
+        etag = self.client().get('/venues/%d' % venue_id, headers={'Accept': 'application/json'}).headers['ETag']
+
+        with QueryCounter() as queries:
+            repeat = self.client().get('/venues/%d' % venue_id, headers={'Accept': 'application/json', 'If-None-Match': etag})
+
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(queries.count, 1)
+        self.assertIn('"Version"', queries.statements[0])
+
+    # Test the /api/ listings are the negotiated views, always in JSON
+    def test_api_listings_are_json_views(self):
+        self.add_venue('The Musical Hop')
+
+        res = self.client().get('/api/venues')
+
+        self.assertEqual(res.get_json()['areas'][0]['venues'][0]['name'], 'The Musical Hop')
+        self.assertEqual(res.get_json(), self.client().get('/venues', headers={'Accept': 'application/json'}).get_json())
+        self.assertTrue(res.headers['ETag'].startswith('"json-'))
+
+    # Test the ETag of pages splitting past and upcoming shows changes once a show starts
+    def test_etag_changes_when_show_starts(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.client().post('/shows/create', data={
+            'artist_id': str(artist_id), 'venue_id': str(venue_id), 'start_time': '2035-04-01 20:00'
+        })
+        first = self.client().get('/artists/%d' % artist_id, headers={'Accept': 'application/json'})
+        self.assertEqual(Version.query.get('Show').expires_at.replace(tzinfo=None), datetime.datetime(2035, 4, 1, 20, 0))
+
+        # Wind the show clock back as if the show had just started
+        Version.query.get('Show').expires_at = current_show_time() - datetime.timedelta(minutes=1)
+        db.session.commit()
+        res = self.client().get('/artists/%d' % artist_id, headers={'Accept': 'application/json', 'If-None-Match': first.headers['ETag']})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], first.headers['ETag'])
+        self.assertEqual(Version.query.get('Show').expires_at.replace(tzinfo=None), datetime.datetime(2035, 4, 1, 20, 0))
+
+    '''
+    TESTS for Images
+    '''
+    def use_thumbnail_dir(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(setattr, thumbnail_cache, 'directory', thumbnail_cache.directory)
+        thumbnail_cache.directory = directory.name
+
+    # Test images are fetched once and served resized, as WebP or JPEG, with long-lived caching
+    def test_thumbnail(self):
+        self.use_thumbnail_dir()
+        app.config['THUMBNAIL_ALLOW_PRIVATE'] = True
+        self.addCleanup(app.config.__setitem__, 'THUMBNAIL_ALLOW_PRIVATE', False)
+        with ImageServer({'/hop.png': png(1200, 800)}) as server:
+            venue_id = self.add_venue('The Musical Hop', image_link=server.url('/hop.png'))
+            page = self.client().get('/venues/%d' % venue_id).get_data(as_text=True)
+            url = page.split('<img src="')[1].split('"')[0].replace('&amp;', '&')
+
+            webp = self.client().get(url, headers={'Accept': 'image/webp,*/*'})
+            jpeg = self.client().get(url.replace('w=640', 'w=500'), headers={'Accept': '*/*'})
+            repeat = self.client().get(url, headers={'Accept': 'image/webp', 'If-None-Match': webp.headers['ETag']})
+
+        self.assertTrue(url.startswith('/img/venue/%d?w=640&v=' % venue_id))
+        self.assertEqual(webp.status_code, 200)
+        self.assertEqual(webp.mimetype, 'image/webp')
+        self.assertEqual(Image.open(BytesIO(webp.get_data())).size, (640, 427))
+        self.assertIn('immutable', webp.headers['Cache-Control'])
+        self.assertIn('Accept', webp.headers['Vary'])
+        self.assertEqual(jpeg.mimetype, 'image/jpeg')
+        self.assertEqual(Image.open(BytesIO(jpeg.get_data())).size, (640, 427))
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(server.requests, 1)
+
+    # Test missing images are 404s, and links to private hosts are refused
+    def test_thumbnail_errors(self):
+        self.use_thumbnail_dir()
+        with ImageServer({'/hop.png': png(100, 100)}) as server:
+            no_image = self.add_venue('The Musical Hop')
+            private = self.add_artist('Guns N Petals', image_link=server.url('/hop.png'))
+
+            missing = self.client().get('/img/venue/%d' % no_image)
+            refused = self.client().get('/img/artist/%d' % private)
+
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(refused.status_code, 502)
+        self.assertEqual(server.requests, 0)
+
+    '''
+    TESTS for Filters
+    '''
+    # Test the datetime filter formats strings and datetimes the same way
+    def test_format_datetime(self):
+        start_time = datetime.datetime(2035, 4, 1, 20, 0)
+
+        self.assertEqual(format_datetime(start_time, 'full'), 'Sunday April, 1, 2035 at 8:00PM')
+        self.assertEqual(format_datetime('2035-04-01 20:00', 'full'), 'Sunday April, 1, 2035 at 8:00PM')
+        self.assertEqual(format_datetime(start_time), 'Sun 04, 01, 2035 8:00PM')
+        # Babel's own widths resolve for the locale, as babel.dates.format_datetime does
+        self.assertEqual(format_datetime(start_time, 'short'), babel.dates.format_datetime(start_time, 'short', locale=DATETIME_LOCALE))
+        self.assertEqual(format_datetime(start_time, 'long'), babel.dates.format_datetime(start_time, 'long', locale=DATETIME_LOCALE))
+        self.assertEqual(format_datetime(start_time, 'h:mma'), '8:00PM')
+        # As returned by a database session in UTC
+        self.assertEqual(format_datetime(start_time.astimezone().astimezone(datetime.timezone.utc)), 'Sun 04, 01, 2035 8:00PM')
+
+
+class AvailabilityIndexTestCase(unittest.TestCase):
+    """This class represents the free/busy index test case"""
+
+    def setUp(self):
+        self.index = AvailabilityIndex()
+        self.index.rebuild([
+            ('artist', 1, 10, 20),
+            ('artist', 1, 30, 40),
+            ('artist', 1, 60, 70),
+            ('venue', 1, 35, 50),
+        ])
+
+    # Test bookings overlapping a window are found, touching ones are not
+    def test_busy(self):
+        self.assertEqual(self.index.busy('artist', 1, 15, 35), [(10, 20), (30, 40)])
+        self.assertEqual(self.index.busy('artist', 1, 20, 30), [])
+        self.assertTrue(self.index.is_free('artist', 2, 0, 100))
+
+    # Test a new booking is found and extends the reach of later ones
+    def test_add(self):
+        self.index.add('artist', 1, 5, 65)
+
+        self.assertEqual(self.index.busy('artist', 1, 50, 55), [(5, 65)])
+        self.assertEqual(self.index.busy('artist', 1, 64, 66), [(5, 65), (60, 70)])
+
+    # Test a removed booking is no longer found and no longer extends the reach of later ones
+    def test_remove(self):
+        self.index.add('artist', 1, 5, 65)
+        self.index.remove('artist', 1, 5, 65)
+        self.index.remove('artist', 1, 30, 40)
+
+        self.assertEqual(self.index.busy('artist', 1, 0, 100), [(10, 20), (60, 70)])
+        self.assertEqual(self.index.busy('artist', 1, 50, 55), [])
+
+    # Test changes only apply on top of the version before them
+    def test_update(self):
+        self.index.rebuild([('artist', 1, 10, 20)], version=3)
+
+        applied = self.index.update(4, added=[('artist', 1, 30, 40)], removed=[('artist', 1, 10, 20)])
+        skipped = self.index.update(6, added=[('artist', 1, 50, 60)])
+
+        self.assertTrue(applied)
+        self.assertFalse(skipped)
+        self.assertEqual(self.index.version, 4)
+        self.assertEqual(self.index.busy('artist', 1, 0, 100), [(30, 40)])
+
+    # Test the earliest common gap of the right length is found
+    def test_find_slot(self):
+        keys = [('artist', 1), ('venue', 1)]
+
+        self.assertEqual(self.index.find_slot(keys, 0, 10), 0)
+        self.assertEqual(self.index.find_slot(keys, 12, 10), 20)
+        self.assertEqual(self.index.find_slot(keys, 12, 15), 70)
+        self.assertIsNone(self.index.find_slot(keys, 12, 15, end=80))
+
+    # Test updates are ignored until the index is built
+    def test_not_ready(self):
+        self.index.reset()
+        self.index.add('artist', 1, 10, 20)
+
+        self.assertFalse(self.index.ready)
+        self.assertEqual(len(self.index), 0)
+
+
+class RecommenderTestCase(unittest.TestCase):
+    """This class represents the genre match scoring test case"""
+
+    def setUp(self):
+        self.recommender = Recommender(['Jazz', 'Funk', 'Blues', 'Punk'], k=2, city_bonus=1, batch_size=2)
+
+    # Test scores count shared genres plus the city bonus, best first
+    def test_top_matches(self):
+        venues = [
+            (1, ['Jazz', 'Funk'], 'San Francisco', 'CA'),
+            (2, ['Punk'], 'New York', 'NY'),
+            (3, ['Blues'], 'Austin', 'TX'),
+        ]
+        artists = [
+            (10, ['Jazz'], 'San Francisco', 'CA'),
+            (11, ['Jazz', 'Funk', 'Blues'], 'Austin', 'TX'),
+            (12, ['Punk', 'Other'], 'Brooklyn', 'NY'),
+            (13, ['Funk'], 'san francisco ', 'CA'),
+        ]
+
+        matches = self.recommender.top_matches(venues, artists)
+
+        self.assertEqual(matches[1], [(10, 2), (11, 2)])
+        self.assertEqual(matches[2], [(12, 1)])
+        self.assertEqual(matches[3], [(11, 2)])
+
+    # Test updating matches after changes gives what scoring everything again does
+    def test_updated_matches(self):
+        venues = [(1, ['Jazz', 'Funk'], 'San Francisco', 'CA'), (2, ['Punk'], 'New York', 'NY'), (3, ['Blues'], 'Austin', 'TX')]
+        artists = [(10, ['Jazz'], 'San Francisco', 'CA'), (11, ['Funk', 'Blues'], 'Austin', 'TX'), (12, ['Punk'], 'Brooklyn', 'NY')]
+        current = self.recommender.top_matches(venues, artists)
+        # Artist 12 takes up the blues and moves to Austin; artist 11 stops seeking
+        artists = [(10, ['Jazz'], 'San Francisco', 'CA'), (12, ['Blues', 'Punk'], 'Austin', 'TX')]
+
+        matches = self.recommender.updated_matches(venues, artists, current, set(), {11, 12})
+
+        self.assertEqual(matches, self.recommender.top_matches(venues, artists))
+
+    # Test batches are sized to the number of columns unless given
+    def test_batch_size(self):
+        recommender = Recommender(['Jazz'], k=1, batch_cells=4)
+        rows = [(id, ['Jazz'], 'Austin', 'TX') for id in range(5)]
+
+        self.assertEqual(recommender.top_matches(rows, rows[:2]), {id: [(0, 2)] for id in range(5)})
+
+    # Test genres outside the choices are ignored
+    def test_encode(self):
+        self.assertEqual(self.recommender.encode(['Funk', 'Blues', 'Other']), 0b110)
+        self.assertEqual(self.recommender.encode(None), 0)
+
+
+class QueuedLoggingTestCase(unittest.TestCase):
+    """This class represents the queued JSON logging test case"""
+
+    def setUp(self):
+        self.logger = logging.getLogger('fyyur.test.%s' % self._testMethodName)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+
+    def tearDown(self):
+        self.logger.handlers = []
+
+    # Test records reach the file as JSON, with extra fields, from the listener thread
+    def test_json_records_written(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'error.log')
+            file_handler = logging.FileHandler(path)
+            file_handler.setFormatter(JSONFormatter())
+            handler, listener = queued_logging(file_handler, queue_size=10)
+            self.logger.addHandler(handler)
+
+            listener.start()
+            self.logger.warning('slow_query ms=%d', 250, extra={'sql': {'ms': 250}})
+            listener.stop()
+            file_handler.close()
+            with open(path) as log_file:
+                entry = json.loads(log_file.readline())
+
+        self.assertEqual(entry['level'], 'WARNING')
+        self.assertEqual(entry['message'], 'slow_query ms=250')
+        self.assertEqual(entry['sql'], {'ms': 250})
+
+    # Test a full queue drops info records first and never blocks the caller
+    def test_drops_low_priority_records(self):
+        handler, listener = queued_logging(logging.NullHandler(), queue_size=10)
+        self.logger.addHandler(handler)
+
+        # The listener is not running, so nothing drains the queue
+        for i in range(20):
+            self.logger.info('info %d', i)
+        for i in range(5):
+            self.logger.error('error %d', i)
+
+        levels = [record.levelname for record in list(handler.queue.queue)]
+        self.assertEqual(levels, ['INFO'] * 8 + ['ERROR'] * 2)
+        self.assertEqual(handler.dropped, 15)
+
+
+class SuggestIndexTestCase(unittest.TestCase):
+    """This class represents the typeahead index test case"""
+
+    def setUp(self):
+        self.index = SuggestIndex(max_entries=4)
+        self.index.rebuild([
+            ('venue', 1, 'The Musical Hop'),
+            ('venue', 2, 'Musical Chairs'),
+            ('artist', 1, 'Guns N Petals'),
+        ])
+
+    # Test substring matches rank prefix matches first
+    def test_substring_matches(self):
+        self.assertEqual(self.index.suggest('MUSICAL'), [
+            ('venue', 2, 'Musical Chairs'),
+            ('venue', 1, 'The Musical Hop'),
+        ])
+
+    # Test trigrams that appear out of order are not matches
+    def test_no_false_positive(self):
+        self.assertEqual(self.index.suggest('calmusi'), [])
+
+    # Test short queries match name prefixes
+    def test_short_prefix(self):
+        self.assertEqual(self.index.suggest('mu'), [('venue', 2, 'Musical Chairs')])
+
+    # Test the index stops growing and reports itself incomplete at its cap
+    def test_bounded_entries(self):
+        self.index.add('artist', 2, 'The Wild Sax Band')
+        self.index.add('artist', 3, 'Matt Quevedo')
+
+        self.assertEqual(len(self.index), 4)
+        self.assertFalse(self.index.usable)
+
+
+class ThumbnailCacheTestCase(unittest.TestCase):
+    """This class represents the thumbnail cache test case"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = ThumbnailCache(directory.name, max_bytes=10000, low_water=0.5)
+        self.fetches = []
+
+    def fetch(self, url):
+        self.fetches.append(url)
+        return png(400, 200, color=(len(self.fetches), 0, 0, 255))
+
+    # Test each URL is fetched once, whatever variants are asked for
+    def test_fetched_once(self):
+        first, data = self.cache.get('http://example.com/a.png', 100, 'webp', self.fetch)
+        again, data = self.cache.get('http://example.com/a.png', 100, 'webp', self.fetch)
+        other, data = self.cache.get('http://example.com/a.png', 200, 'jpeg', self.fetch)
+
+        self.assertEqual(self.fetches, ['http://example.com/a.png'])
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    # Test the least recently used files are evicted once the cache is full
+    def test_lru_eviction(self):
+        self.cache.max_bytes = 2 * len(png(400, 200))
+        self.cache.get('http://example.com/a.png', 80, 'jpeg', self.fetch)
+        for path in [os.path.join(root, name) for root, dirs, names in os.walk(self.cache.directory) for name in names]:
+            os.utime(path, (1, 1))
+        self.cache.get('http://example.com/b.png', 80, 'jpeg', self.fetch)
+        self.cache.get('http://example.com/c.png', 80, 'jpeg', self.fetch)
+        self.cache.get('http://example.com/a.png', 80, 'jpeg', self.fetch)
+
+        self.assertGreater(self.cache.evictions, 0)
+        self.assertEqual(len(self.fetches), 4)
+
+    # Test images are scaled down to the width, keeping their aspect ratio, but never up
+    def test_resize(self):
+        self.assertEqual(Image.open(BytesIO(resize(png(400, 200), 100, 'webp'))).size, (100, 50))
+        self.assertEqual(Image.open(BytesIO(resize(png(50, 20), 100, 'jpeg'))).size, (50, 20))
+
+
+    # Test connections to private addresses are refused even past the DNS check, as after rebinding
+    def test_connection_checks_peer(self):
+        with ImageServer({'/a.png': png(10, 10)}) as server:
+            refused = CheckedHTTPConnection('127.0.0.1', server.httpd.server_port, timeout=5)
+            allowed = CheckedHTTPConnection('127.0.0.1', server.httpd.server_port, timeout=5, allow_private=True)
+
+            with self.assertRaises(ImageUnavailable):
+                refused.request('GET', '/a.png')
+            allowed.request('GET', '/a.png')
+            status = allowed.getresponse().status
+            allowed.close()
+
+        self.assertEqual(status, 200)
+        self.assertEqual(server.requests, 1)
+
+
+class PageCacheTestCase(unittest.TestCase):
+    """This class represents the page cache test case"""
+
+    def setUp(self):
+        self.now = 0
+        self.cache = PageCache(max_entries=2, ttl=60, clock=lambda: self.now)
+
+    # Test the least recently used page is evicted first
+    def test_lru_eviction(self):
+        self.cache.set('venues', 'a', 'A')
+        self.cache.set('venues', 'b', 'B')
+        self.cache.get('a')
+        self.cache.set('artists', 'c', 'C')
+
+        self.assertEqual(self.cache.get('a'), 'A')
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    # Test pages expire after their time-to-live
+    def test_ttl(self):
+        self.cache.set('venues', 'a', 'A')
+        self.now = 61
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(len(self.cache), 0)
+
+    # Test invalidating a group drops only its pages
+    def test_invalidate_group(self):
+        self.cache.set('venues', 'a', 'A')
+        self.cache.set('artists', 'b', 'B')
+        self.cache.invalidate('venues')
+
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('b'), 'B')
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,287 @@
+import io
+import os
+import socket
+import hashlib
+import http.client
+import threading
+import ipaddress
+import urllib.parse
+import urllib.request
+
+from PIL import Image, ImageOps
+
+FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpeg': ('JPEG', 'image/jpeg')}
+
+
+class ImageUnavailable(Exception):
+    """The source image could not be fetched or decoded"""
+
+
+class ThumbnailCache(object):
+    """Content-addressed store of source images and their resized variants.
+
+    A source image is stored under the SHA-256 of its bytes, and each
+    variant under the source digest, width and format. A variant name
+    therefore changes whenever the image does, and makes a strong ETag.
+    A small index file per URL records the digest of the image last
+    fetched from it, so every URL is fetched once. Every file is
+    evictable. When the directory grows past `max_bytes`, the least
+    recently used files, by modification time, are removed until it is
+    back under `low_water` of the limit. A hit touches its file.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, low_water=0.9):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def source(self, url, fetch):
+        # Digest of the image at `url`, calling fetch(url) for its bytes on a miss
+        index = 'url-' + hashlib.sha256(url.encode('utf-8')).hexdigest()
+        digest = self._read(index)
+        if digest is not None and self._exists('src-' + digest.decode('ascii')):
+            return digest.decode('ascii')
+        data = fetch(url)
+        digest = hashlib.sha256(data).hexdigest()
+        self._write('src-' + digest, data)
+        self._write(index, digest.encode('ascii'))
+        return digest
+
+    def get(self, url, width, format, fetch):
+        # (name, bytes) of the image at `url` resized to `width` in `format`.
+        # A source evicted between the two steps is fetched again.
+        for attempt in range(2):
+            digest = self.source(url, fetch)
+            try:
+                return self.variant(digest, width, format)
+            except KeyError:
+                continue
+        raise ImageUnavailable('%s was evicted while resizing' % url)
+
+    def variant(self, digest, width, format):
+        # (name, bytes) of the source resized to `width` in `format`, made on a miss
+        name = '%s-w%d.%s' % (digest, width, format)
+        data = self._read(name)
+        if data is not None:
+            self.hits += 1
+            return name, data
+        self.misses += 1
+        source = self._read('src-' + digest)
+        if source is None:
+            raise KeyError(digest)
+        data = resize(source, width, format)
+        self._write(name, data)
+        return name, data
+
+    def _path(self, name):
+        # Spread files over 256 subdirectories by their first two hex digits
+        digest = name.split('-', 1)[1] if name.startswith(('src-', 'url-')) else name
+        return os.path.join(self.directory, digest[:2], name)
+
+    def _exists(self, name):
+        return os.path.exists(self._path(name))
+
+    def _read(self, name):
+        path = self._path(name)
+        try:
+            with open(path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+
+    def _write(self, name, data):
+        # Write to a temporary file and rename it into place, so readers never
+        # see a partial file
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        os.replace(temporary, path)
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for mtime, size, path in self._files())
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _files(self):
+        # (mtime, size, path) of every cached file
+        files = []
+        if not os.path.isdir(self.directory):
+            return files
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _evict(self):
+        # Rescan, as other processes may share the directory, then remove the
+        # oldest files until under the low water mark
+        files = sorted(self._files())
+        self._size = sum(size for mtime, size, path in files)
+        target = self.max_bytes * self.low_water
+        for mtime, size, path in files:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            self.evictions += 1
+
+
+def resize(data, width, format):
+    # Scale an image down to `width` pixels wide, keeping its aspect ratio and
+    # never scaling up, and encode it as 'webp' or 'jpeg'
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise ImageUnavailable('not an image: %s' % error)
+    if image.width > width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+
+    pil_format = FORMATS[format][0]
+    if format == 'jpeg' and image.mode != 'RGB':
+        # JPEG has no alpha channel: flatten onto white
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    output = io.BytesIO()
+    image.save(output, pil_format, quality=80)
+    return output.getvalue()
+
+
+def check_address(address, allow_private=False):
+    # Refuse loopback, private, link-local and other non-public addresses,
+    # unless allow_private
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if allow_private:
+        return
+    if ip.is_private or ip.is_loopback or ip.is_link_local or ip.is_reserved or ip.is_multicast:
+        raise ImageUnavailable('refusing to fetch from %s' % address)
+
+
+def check_url(url, allow_private=False):
+    # Refuse anything but http(s) URLs and, unless allow_private, hosts
+    # resolving to non-public addresses, so image links cannot be used to
+    # reach internal services. The address actually connected to is checked
+    # again by CheckedConnection, as DNS may answer differently the second time.
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ImageUnavailable('not an http(s) URL: %s' % url)
+    if allow_private:
+        return
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, parts.port or 443)}
+    except socket.gaierror as error:
+        raise ImageUnavailable('cannot resolve %s: %s' % (parts.hostname, error))
+    for address in addresses:
+        check_address(address)
+
+
+class CheckedConnection(object):
+    """Mixin applying check_address() to the peer of every new socket.
+
+    The check runs once connected and before anything is sent, so a host
+    that passed check_url() and then resolves to an internal address, as
+    with DNS rebinding, gets no request. TLS is set up after the check, on
+    the same socket, with the hostname kept for SNI and verification.
+    """
+
+    def __init__(self, *args, allow_private=False, **kwargs):
+        super(CheckedConnection, self).__init__(*args, **kwargs)
+        self.allow_private = allow_private
+        self._create_connection = self._create_checked_connection
+
+    def _create_checked_connection(self, address, *args, **kwargs):
+        sock = socket.create_connection(address, *args, **kwargs)
+        try:
+            check_address(sock.getpeername()[0], self.allow_private)
+        except ImageUnavailable:
+            sock.close()
+            raise
+        return sock
+
+
+class CheckedHTTPConnection(CheckedConnection, http.client.HTTPConnection):
+    pass
+
+
+class CheckedHTTPSConnection(CheckedConnection, http.client.HTTPSConnection):
+    pass
+
+
+class CheckedHTTPHandler(urllib.request.HTTPHandler):
+
+    def __init__(self, allow_private):
+        super(CheckedHTTPHandler, self).__init__()
+        self.allow_private = allow_private
+
+    def http_open(self, req):
+        return self.do_open(CheckedHTTPConnection, req, allow_private=self.allow_private)
+
+
+class CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+
+    def __init__(self, allow_private):
+        super(CheckedHTTPSHandler, self).__init__()
+        self.allow_private = allow_private
+
+    def https_open(self, req):
+        return self.do_open(CheckedHTTPSConnection, req, context=self._context, allow_private=self.allow_private)
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Applies check_url() to every redirect target too"""
+
+    def __init__(self, allow_private):
+        self.allow_private = allow_private
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl, self.allow_private)
+        return super(CheckedRedirectHandler, self).redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch_image(url, max_bytes=20 * 1024 * 1024, timeout=10, allow_private=False):
+    # Download an image over HTTP(S), refusing anything larger than max_bytes.
+    # Proxies are not used, as the peer checked would be the proxy.
+    check_url(url, allow_private)
+    opener = urllib.request.build_opener(
+        urllib.request.ProxyHandler({}),
+        CheckedHTTPHandler(allow_private),
+        CheckedHTTPSHandler(allow_private),
+        CheckedRedirectHandler(allow_private)
+    )
+    try:
+        request = urllib.request.Request(url, headers={'User-Agent': 'Fyyur thumbnailer'})
+        with opener.open(request, timeout=timeout) as response:
+            data = response.read(max_bytes + 1)
+    except (OSError, ValueError) as error:
+        raise ImageUnavailable('cannot fetch %s: %s' % (url, error))
+    if len(data) > max_bytes:
+        raise ImageUnavailable('%s is larger than %d bytes' % (url, max_bytes))
+    return data